@@ -0,0 +1,112 @@
+"""Benchmark the transfer/compute overlap achieved by
+:class:`pycuda.pipeline.ChunkedPipeline`.
+
+Usage: python demo_pipeline_overlap.py [MEGABYTES] [CHUNK_MEGABYTES] [DEPTH]
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+import sys
+from time import time
+
+import numpy as np
+
+import pycuda.autoinit  # noqa
+import pycuda.driver as drv
+import pycuda.gpuarray as gpuarray
+from pycuda.elementwise import ElementwiseKernel
+from pycuda.pipeline import ChunkedPipeline
+from pycuda.tools import DeviceMemoryPool
+
+total_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+chunk_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+depth = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+# enough arithmetic per element to make compute comparable to transfers
+work = ElementwiseKernel("float *x, float *y",
+        """
+        float v = x[i];
+        for (int k = 0; k < 32; ++k)
+            v = sinf(v) + 0.5f*v;
+        y[i] = v;
+        """, "work")
+
+x = np.random.randn(total_mb << 18).astype(np.float32)
+y = np.empty_like(x)
+y_ref = np.empty_like(x)
+
+pool = DeviceMemoryPool()
+
+# {{{ stage timings for a single chunk
+
+chunk = drv.pagelocked_empty(chunk_mb << 18, np.float32)
+chunk[:] = x[:chunk.size]
+chunk_gpu = gpuarray.empty(chunk.shape, chunk.dtype)
+out_gpu = gpuarray.empty_like(chunk_gpu)
+
+events = [drv.Event() for i in range(4)]
+events[0].record()
+chunk_gpu.set_async(chunk)
+events[1].record()
+work(chunk_gpu, out_gpu)
+events[2].record()
+out_gpu.get_async(ary=chunk)
+events[3].record()
+events[3].synchronize()
+
+t_up, t_compute, t_down = [
+        events[i+1].time_since(events[i])*1e-3 for i in range(3)]
+n_chunks = x.size // chunk.size
+
+print("per-chunk upload %.2f ms, compute %.2f ms, download %.2f ms" % (
+    t_up*1e3, t_compute*1e3, t_down*1e3))
+
+# }}}
+
+# {{{ serial
+
+drv.Context.synchronize()
+start = time()
+x_gpu = gpuarray.to_gpu(x)
+y_gpu = gpuarray.empty_like(x_gpu)
+work(x_gpu, y_gpu)
+y_gpu.get(ary=y_ref)
+t_serial = time() - start
+del x_gpu, y_gpu
+
+# }}}
+
+# {{{ pipelined
+
+pipeline = ChunkedPipeline(chunk_size=chunk_mb << 20, depth=depth,
+        allocator=pool.allocate)
+
+
+def step(stream, x_chunk, y_chunk):
+    work(x_chunk, y_chunk, stream=stream)
+
+
+# warm up kernel caches and buffers
+pipeline(step, [x[:chunk.size]], [y[:chunk.size]])
+
+drv.Context.synchronize()
+start = time()
+pipeline(step, [x], [y])
+t_pipelined = time() - start
+
+# }}}
+
+assert np.allclose(y, y_ref)
+
+t_bound = n_chunks * max(t_up, t_compute, t_down)
+print("serial:    %.3f s" % t_serial)
+print("pipelined: %.3f s (depth %d, %d MB chunks)" % (
+    t_pipelined, depth, chunk_mb))
+print("lower bound from slowest stage: %.3f s" % t_bound)
+print("speedup %.2fx, overlap efficiency %.0f%%" % (
+    t_serial / t_pipelined,
+    100 * (n_chunks * (t_up + t_compute + t_down) - t_pipelined)
+    / max(n_chunks * (t_up + t_compute + t_down) - t_bound, 1e-9)))
+
+# vim: foldmethod=marker
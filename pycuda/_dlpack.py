@@ -0,0 +1,257 @@
+"""DLPack capsule support for :class:`pycuda.gpuarray.GPUArray`, based on
+:mod:`ctypes`.
+
+See https://github.com/dmlc/dlpack for the format.
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import ctypes
+
+import numpy as np
+from six.moves import range
+
+
+# {{{ structures
+
+DL_CUDA = 2
+DL_CUDA_MANAGED = 13
+
+_DL_INT = 0
+_DL_UINT = 1
+_DL_FLOAT = 2
+_DL_COMPLEX = 5
+_DL_BOOL = 6
+
+_KIND_TO_CODE = {
+        "i": _DL_INT,
+        "u": _DL_UINT,
+        "f": _DL_FLOAT,
+        "c": _DL_COMPLEX,
+        "b": _DL_BOOL,
+        }
+
+_CODE_TO_KIND = dict((code, kind) for kind, code in _KIND_TO_CODE.items())
+
+
+class _DLDevice(ctypes.Structure):
+    _fields_ = [
+            ("device_type", ctypes.c_int),
+            ("device_id", ctypes.c_int32),
+            ]
+
+
+class _DLDataType(ctypes.Structure):
+    _fields_ = [
+            ("code", ctypes.c_uint8),
+            ("bits", ctypes.c_uint8),
+            ("lanes", ctypes.c_uint16),
+            ]
+
+
+class _DLTensor(ctypes.Structure):
+    _fields_ = [
+            ("data", ctypes.c_void_p),
+            ("device", _DLDevice),
+            ("ndim", ctypes.c_int32),
+            ("dtype", _DLDataType),
+            ("shape", ctypes.POINTER(ctypes.c_int64)),
+            ("strides", ctypes.POINTER(ctypes.c_int64)),
+            ("byte_offset", ctypes.c_uint64),
+            ]
+
+
+_DELETER = ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+
+
+class _DLManagedTensor(ctypes.Structure):
+    _fields_ = [
+            ("dl_tensor", _DLTensor),
+            ("manager_ctx", ctypes.c_void_p),
+            ("deleter", _DELETER),
+            ]
+
+# }}}
+
+
+# {{{ capsule API
+
+_CAPSULE_NAME = b"dltensor"
+_USED_CAPSULE_NAME = b"used_dltensor"
+
+_CAPSULE_DESTRUCTOR = ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+
+_capsule_new = ctypes.pythonapi.PyCapsule_New
+_capsule_new.restype = ctypes.py_object
+_capsule_new.argtypes = [
+        ctypes.c_void_p, ctypes.c_char_p, _CAPSULE_DESTRUCTOR]
+
+# The destructor runs while the capsule's reference count is zero, so it
+# must see the capsule as a raw pointer rather than a py_object.
+_raw_capsule_is_valid = ctypes.pythonapi["PyCapsule_IsValid"]
+_raw_capsule_is_valid.restype = ctypes.c_int
+_raw_capsule_is_valid.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+
+_raw_capsule_get_pointer = ctypes.pythonapi["PyCapsule_GetPointer"]
+_raw_capsule_get_pointer.restype = ctypes.c_void_p
+_raw_capsule_get_pointer.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+
+_capsule_is_valid = ctypes.pythonapi.PyCapsule_IsValid
+_capsule_is_valid.restype = ctypes.c_int
+_capsule_is_valid.argtypes = [ctypes.py_object, ctypes.c_char_p]
+
+_capsule_get_pointer = ctypes.pythonapi.PyCapsule_GetPointer
+_capsule_get_pointer.restype = ctypes.c_void_p
+_capsule_get_pointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+
+_capsule_set_name = ctypes.pythonapi.PyCapsule_SetName
+_capsule_set_name.restype = ctypes.c_int
+_capsule_set_name.argtypes = [ctypes.py_object, ctypes.c_char_p]
+
+# }}}
+
+
+# {{{ export
+
+# address of each exported DLManagedTensor -> objects it keeps alive
+_exported = {}
+
+
+@_DELETER
+def _delete_managed_tensor(address):
+    _exported.pop(address, None)
+
+
+@_CAPSULE_DESTRUCTOR
+def _destroy_capsule(capsule):
+    # A capsule that was never consumed still owns its tensor.
+    if _raw_capsule_is_valid(capsule, _CAPSULE_NAME):
+        address = _raw_capsule_get_pointer(capsule, _CAPSULE_NAME)
+        _delete_managed_tensor(address)
+
+
+def to_dlpack(ary, device_type, device_id):
+    """Return a DLPack capsule referring to the memory of the
+    :class:`pycuda.gpuarray.GPUArray` *ary*, which is kept alive until the
+    consumer releases the capsule.
+    """
+    dtype = ary.dtype
+    try:
+        code = _KIND_TO_CODE[dtype.kind]
+    except KeyError:
+        raise TypeError("dtype '%s' cannot be exported via DLPack" % dtype)
+
+    if not dtype.isnative:
+        raise TypeError("non-native byte order cannot be exported via DLPack")
+
+    ndim = len(ary.shape)
+
+    shape = (ctypes.c_int64 * max(ndim, 1))(*ary.shape)
+    strides = (ctypes.c_int64 * max(ndim, 1))()
+    for i in range(ndim):
+        if ary.strides[i] % dtype.itemsize:
+            raise ValueError("strides must be multiples of the item size")
+        strides[i] = ary.strides[i] // dtype.itemsize
+
+    managed = _DLManagedTensor()
+    tensor = managed.dl_tensor
+    tensor.data = ary.ptr if ary.size else None
+    tensor.device = _DLDevice(device_type, device_id)
+    tensor.ndim = ndim
+    tensor.dtype = _DLDataType(code, dtype.itemsize * 8, 1)
+    tensor.shape = shape
+    tensor.strides = strides
+    tensor.byte_offset = 0
+    managed.deleter = _delete_managed_tensor
+
+    address = ctypes.addressof(managed)
+    _exported[address] = (managed, shape, strides, ary)
+
+    return _capsule_new(address, _CAPSULE_NAME, _destroy_capsule)
+
+# }}}
+
+
+# {{{ import
+
+class DLPackOwner(object):
+    """Holds a consumed DLPack tensor and calls its deleter once it is
+    garbage collected.
+    """
+
+    def __init__(self, managed_ptr):
+        self.managed_ptr = managed_ptr
+
+    def __del__(self):
+        managed = self.managed_ptr.contents
+        if managed.deleter:
+            managed.deleter(ctypes.addressof(managed))
+
+
+def from_dlpack(capsule):
+    """Consume the DLPack capsule *capsule*.
+
+    Returns a tuple ``(ptr, shape, strides, dtype, device_type, device_id,
+    owner)``, where *strides* is in bytes and *owner* must be kept alive for
+    as long as the memory is in use.
+    """
+    if not _capsule_is_valid(capsule, _CAPSULE_NAME):
+        raise ValueError("object is not an unconsumed DLPack capsule")
+
+    managed_ptr = ctypes.cast(
+            _capsule_get_pointer(capsule, _CAPSULE_NAME),
+            ctypes.POINTER(_DLManagedTensor))
+    tensor = managed_ptr.contents.dl_tensor
+
+    if tensor.dtype.lanes != 1 or tensor.dtype.code not in _CODE_TO_KIND:
+        raise TypeError("unsupported DLPack data type (code %d, %d bits, "
+                "%d lanes)" % (tensor.dtype.code, tensor.dtype.bits,
+                    tensor.dtype.lanes))
+    dtype = np.dtype("%s%d" % (
+        _CODE_TO_KIND[tensor.dtype.code], tensor.dtype.bits // 8))
+
+    shape = tuple(tensor.shape[i] for i in range(tensor.ndim))
+    if tensor.strides:
+        strides = tuple(
+                tensor.strides[i] * dtype.itemsize for i in range(tensor.ndim))
+    else:
+        strides = None
+
+    ptr = (tensor.data or 0) + tensor.byte_offset
+
+    # From here on, we are responsible for calling the deleter.
+    _capsule_set_name(capsule, _USED_CAPSULE_NAME)
+    owner = DLPackOwner(managed_ptr)
+
+    return (ptr, shape, strides, dtype,
+            tensor.device.device_type, tensor.device.device_id, owner)
+
+# }}}
+
+# vim: foldmethod=marker
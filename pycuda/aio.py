@@ -0,0 +1,163 @@
+"""Awaitable completion of GPU work for :mod:`asyncio` applications."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+import threading
+import asyncio
+
+import pycuda.driver as drv
+from pycuda.tools import EventNotifier
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+# {{{ completion notifier
+
+def _resolve(future, get_result, exc):
+    if future.cancelled():
+        return
+
+    if exc is not None:
+        future.set_exception(exc)
+        return
+
+    try:
+        result = get_result() if get_result is not None else None
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+
+
+class CompletionNotifier(EventNotifier):
+    """Resolves :mod:`asyncio` futures once CUDA events complete.
+
+    A helper thread polls the events being watched, backing off from
+    *min_poll_interval* to *max_poll_interval* seconds while none of them
+    completes, and hands completions to the event loop they belong to. The
+    thread is started on first use and shared by all watched events, so
+    any number of them may be in flight at once.
+    """
+
+    _thread_name = "pycuda-aio-notifier"
+
+    def watch(self, event, loop=None, get_result=None):
+        """Return an :class:`asyncio.Future` that is resolved once *event*
+        has completed, with ``get_result()`` (called in the thread of
+        *loop*) if given and with *None* otherwise. The future receives
+        the :exc:`pycuda.driver.Error` if querying the event fails.
+
+        *event* must have been recorded in the current context.
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        future = asyncio.Future(loop=loop)
+
+        def resolve_in_loop(exc):
+            try:
+                loop.call_soon_threadsafe(_resolve, future, get_result, exc)
+            except RuntimeError:
+                # the event loop has been closed
+                pass
+
+        self.add_callback(event, resolve_in_loop)
+        return future
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    """Return the :class:`CompletionNotifier` used by the functions in this
+    module, starting a new one if the previous one has been closed.
+    """
+    global _notifier
+
+    notifier = _notifier
+    if notifier is None or notifier.closed:
+        with _notifier_lock:
+            notifier = _notifier
+            if notifier is None or notifier.closed:
+                notifier = _notifier = CompletionNotifier()
+
+    return notifier
+
+# }}}
+
+
+# {{{ awaitables
+
+def wait_event(event, loop=None):
+    """Return an :class:`asyncio.Future` that completes once *event* has
+    completed.
+    """
+    return get_notifier().watch(event, loop)
+
+
+def wait_stream(stream=None, loop=None):
+    """Return an :class:`asyncio.Future` that completes once the work
+    enqueued on *stream* up to this call has completed.
+    """
+    event = drv.Event(drv.event_flags.DISABLE_TIMING)
+    event.record(stream)
+    return get_notifier().watch(event, loop)
+
+
+def wrap_future(array_future, loop=None):
+    """Return an :class:`asyncio.Future` resolving to the result of the
+    :class:`pycuda.gpuarray.ArrayFuture` *array_future*.
+    """
+    return get_notifier().watch(
+            array_future.event, loop, array_future.result)
+
+
+def get(ary, stream=None, host_allocator=None, loop=None):
+    """Start copying the :class:`pycuda.gpuarray.GPUArray` *ary* to the host
+    on *stream* once the work enqueued there so far has completed. Return
+    an :class:`asyncio.Future` resolving to the host copy, a
+    :class:`numpy.ndarray`. *host_allocator* is as for
+    :meth:`pycuda.gpuarray.GPUArray.get_future`.
+    """
+    return wrap_future(ary.get_future(stream, host_allocator), loop)
+
+
+def set_array(ary, host_ary, stream=None, loop=None):
+    """Start copying *host_ary* into the
+    :class:`pycuda.gpuarray.GPUArray` *ary* on *stream*. Return an
+    :class:`asyncio.Future` that completes once the copy has.
+
+    The copy only overlaps with other work if *host_ary* is page-locked.
+    *host_ary* must not be modified until the future completes.
+    """
+    ary.set_async(host_ary, stream)
+    return wait_stream(stream, loop)
+
+# }}}
+
+# vim: foldmethod=marker
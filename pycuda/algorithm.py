@@ -0,0 +1,609 @@
+"""Algorithms built on the scan primitive."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import numpy as np
+from six.moves import range
+
+import pycuda.gpuarray as gpuarray
+from pycuda.compiler import SourceModule
+from pycuda.tools import dtype_to_ctype, context_dependent_memoize
+import pycuda._mymako as mako
+
+
+_GRID_STRIDE_LOOP = """
+#define GRID_STRIDE_LOOP(i) for (unsigned int i = blockIdx.x*blockDim.x \
++ threadIdx.x; i < n; i += gridDim.x*blockDim.x)
+"""
+
+
+# {{{ counting scan
+
+@context_dependent_memoize
+def get_count_scan_kernel():
+    """Return an :class:`pycuda.scan.ExclusiveScanKernel` that computes
+    exclusive prefix sums of :class:`numpy.uint32` flags.
+    """
+    from pycuda.scan import ExclusiveScanKernel
+    return ExclusiveScanKernel(np.uint32, "a+b", "0",
+            name_prefix="count_scan")
+
+# }}}
+
+
+# {{{ radix sort
+
+_RADIX_SORT_SOURCE = mako.template.Template("""
+typedef ${key_type} key_type;
+typedef ${radix_type} radix_type;
+% if value_type is not None:
+typedef ${value_type} value_type;
+% endif
+
+#define RADIX ${radix}
+#define BLOCK_SIZE ${block_size}
+#define ITEMS_PER_THREAD ${items_per_thread}
+#define TILE_SIZE (BLOCK_SIZE*ITEMS_PER_THREAD)
+#define SEGMENT_LENGTH (BLOCK_SIZE/RADIX)
+
+// map keys to unsigned integers with the same ordering
+__device__ radix_type radix_key(key_type k)
+{
+    ${radix_key_body}
+}
+
+#define RADIX_DIGIT(k) ((unsigned int) ((radix_key(k) >> shift) & digit_mask))
+
+// Count the keys with each digit in each tile of TILE_SIZE keys. The
+// counts are stored digit by digit, so that their exclusive scan yields
+// the position of the first key with a given digit from a given tile.
+__global__ void radix_sort_histogram(
+    const key_type *keys, unsigned int *histogram,
+    unsigned int shift, unsigned int digit_mask,
+    unsigned int tile_count, unsigned int n)
+{
+    __shared__ unsigned int counts[RADIX];
+
+    for (unsigned int tile = blockIdx.x; tile < tile_count;
+            tile += gridDim.x)
+    {
+        if (threadIdx.x < RADIX)
+            counts[threadIdx.x] = 0;
+        __syncthreads();
+
+        const unsigned int tile_start = tile*TILE_SIZE;
+        for (unsigned int j = threadIdx.x; j < TILE_SIZE; j += BLOCK_SIZE)
+            if (tile_start + j < n)
+                atomicAdd(&counts[RADIX_DIGIT(keys[tile_start + j])], 1);
+        __syncthreads();
+
+        if (threadIdx.x < RADIX)
+            histogram[threadIdx.x*tile_count + tile] = counts[threadIdx.x];
+    }
+}
+
+// Move each key (and value) to its position: the scanned histogram entry
+// for its digit and tile, plus the number of keys with the same digit
+// preceding it in the tile.
+__global__ void radix_sort_scatter(
+    const key_type *keys, key_type *keys_out,
+% if value_type is not None:
+    const value_type *values, value_type *values_out,
+% endif
+    const unsigned int *offsets,
+    unsigned int shift, unsigned int digit_mask,
+    unsigned int tile_count, unsigned int n)
+{
+    // counts[d][t]: keys with digit d among those handled by thread t,
+    // then the number of such keys handled by the preceding threads
+    // within t's segment of SEGMENT_LENGTH threads
+    __shared__ unsigned int counts[RADIX][BLOCK_SIZE];
+    // segment_offsets[d][s]: position of the first key with digit d
+    // handled by segment s
+    __shared__ unsigned int segment_offsets[RADIX][RADIX];
+
+    const unsigned int t = threadIdx.x;
+
+    for (unsigned int tile = blockIdx.x; tile < tile_count;
+            tile += gridDim.x)
+    {
+        // Each thread handles consecutive keys, so that keys with equal
+        // digits keep their order.
+        const unsigned int start = tile*TILE_SIZE + t*ITEMS_PER_THREAD;
+
+        for (unsigned int d = 0; d < RADIX; ++d)
+            counts[d][t] = 0;
+
+        for (unsigned int j = 0; j < ITEMS_PER_THREAD; ++j)
+            if (start + j < n)
+                ++counts[RADIX_DIGIT(keys[start + j])][t];
+        __syncthreads();
+
+        {
+            // BLOCK_SIZE == RADIX*RADIX: one thread per digit and segment
+            const unsigned int d = t / RADIX;
+            const unsigned int segment_start = (t % RADIX)*SEGMENT_LENGTH;
+
+            unsigned int sum = 0;
+            for (unsigned int j = 0; j < SEGMENT_LENGTH; ++j)
+            {
+                const unsigned int count = counts[d][segment_start + j];
+                counts[d][segment_start + j] = sum;
+                sum += count;
+            }
+            segment_offsets[d][t % RADIX] = sum;
+        }
+        __syncthreads();
+
+        if (t < RADIX)
+        {
+            unsigned int sum = offsets[t*tile_count + tile];
+            for (unsigned int s = 0; s < RADIX; ++s)
+            {
+                const unsigned int count = segment_offsets[t][s];
+                segment_offsets[t][s] = sum;
+                sum += count;
+            }
+        }
+        __syncthreads();
+
+        for (unsigned int j = 0; j < ITEMS_PER_THREAD; ++j)
+        {
+            if (start + j < n)
+            {
+                const key_type k = keys[start + j];
+                const unsigned int d = RADIX_DIGIT(k);
+                const unsigned int dest =
+                    segment_offsets[d][t / SEGMENT_LENGTH] + counts[d][t]++;
+
+                keys_out[dest] = k;
+% if value_type is not None:
+                values_out[dest] = values[start + j];
+% endif
+            }
+        }
+
+        // counts and segment_offsets are reused by the next tile
+        __syncthreads();
+    }
+}
+""", strict_undefined=True)
+
+_RADIX_TYPES = {
+        1: "unsigned char",
+        2: "unsigned short",
+        4: "unsigned int",
+        8: "unsigned long long",
+        }
+
+
+def _get_radix_key_body(dtype):
+    bits = dtype.itemsize * 8
+
+    if dtype.kind == "u":
+        return "return k;"
+    elif dtype.kind == "i":
+        # flip the sign bit
+        return "return ((radix_type) k) ^ (((radix_type) 1) << %d);" % (
+                bits - 1)
+    elif dtype == np.float32:
+        # flip all bits of negative numbers, only the sign bit of others
+        return ("radix_type u = (radix_type) __float_as_int(k);"
+                "return u ^ ((u >> 31) ? 0xffffffffu : 0x80000000u);")
+    elif dtype == np.float64:
+        return ("radix_type u = (radix_type) __double_as_longlong(k);"
+                "return u ^ ((u >> 63) ? ~((radix_type) 0) "
+                ": (((radix_type) 1) << 63));")
+    else:
+        raise TypeError("radix sort does not support keys of type '%s'"
+                % dtype)
+
+
+class RadixSort(object):
+    """A stable least-significant-digit radix sort for keys of integer or
+    floating point type, optionally permuting an array of values along
+    with the keys.
+
+    Each pass sorts by a digit of :attr:`radix_bits` bits of the keys: the
+    keys with each digit value are counted in each tile of the input, the
+    counts are summed with :func:`get_count_scan_kernel`, and keys (and
+    values) are scattered to their new positions. A pass takes a fixed
+    number of launches, so sorting 32-bit keys takes 8 passes.
+
+    Floating point keys are ordered like :func:`numpy.sort`, except that
+    ``-0.0`` sorts before ``0.0`` and NaNs with the sign bit set sort first.
+    """
+
+    radix_bits = 4
+    # the scatter kernel uses one thread per digit value and segment of
+    # the block
+    block_size = (1 << radix_bits)**2
+    items_per_thread = 8
+
+    def __init__(self, key_dtype, value_dtype=None, options=None):
+        self.key_dtype = key_dtype = np.dtype(key_dtype)
+        if value_dtype is not None:
+            value_dtype = np.dtype(value_dtype)
+        self.value_dtype = value_dtype
+
+        self.tile_size = self.block_size * self.items_per_thread
+
+        src = str(_RADIX_SORT_SOURCE.render(
+            key_type=dtype_to_ctype(key_dtype),
+            radix_type=_RADIX_TYPES[key_dtype.itemsize],
+            value_type=(dtype_to_ctype(value_dtype)
+                if value_dtype is not None else None),
+            radix_key_body=_get_radix_key_body(key_dtype),
+            radix=1 << self.radix_bits,
+            block_size=self.block_size,
+            items_per_thread=self.items_per_thread))
+
+        mod = SourceModule(src, options=options)
+
+        self.histogram_knl = mod.get_function("radix_sort_histogram")
+        self.histogram_knl.prepare("PPIIII")
+        self.scatter_knl = mod.get_function("radix_sort_scatter")
+        if value_dtype is not None:
+            self.scatter_knl.prepare("PPPPPIIII")
+        else:
+            self.scatter_knl.prepare("PPPIIII")
+
+    def __call__(self, keys, values=None, begin_bit=0, end_bit=None,
+            allocator=None, stream=None):
+        """Sort the one-dimensional :class:`pycuda.gpuarray.GPUArray`
+        *keys* by bits *begin_bit* up to (excluding) *end_bit*, which
+        defaults to all bits of the key type.
+
+        Returns a new, sorted array of keys. If this sort was created with
+        a *value_dtype*, *values* must be an array of that type and the same
+        shape as *keys*, and a tuple ``(sorted_keys, permuted_values)`` is
+        returned.
+        """
+        if keys.dtype != self.key_dtype:
+            raise TypeError("keys must be of type '%s'" % self.key_dtype)
+        if len(keys.shape) != 1:
+            raise ValueError("keys must be one-dimensional")
+        if (values is None) != (self.value_dtype is None):
+            raise TypeError("values must be given if and only if the sort "
+                    "was created with a value_dtype")
+        if values is not None:
+            if values.dtype != self.value_dtype:
+                raise TypeError("values must be of type '%s'"
+                        % self.value_dtype)
+            if values.shape != keys.shape:
+                raise ValueError("keys and values must have the same shape")
+
+        if end_bit is None:
+            end_bit = self.key_dtype.itemsize * 8
+
+        allocator = allocator or keys.allocator
+
+        n, = keys.shape
+        if n > 2**32 - self.tile_size:
+            raise ValueError("radix sort supports at most %d keys"
+                    % (2**32 - self.tile_size))
+
+        keys = _as_contiguous(keys, allocator, stream)
+        if values is not None:
+            values = _as_contiguous(values, allocator, stream)
+
+        if not n or begin_bit >= end_bit:
+            result_keys = _copy(keys, allocator, stream)
+            if values is None:
+                return result_keys
+            else:
+                return result_keys, _copy(values, allocator, stream)
+
+        tile_count = -(-n // self.tile_size)
+        histogram = gpuarray.GPUArray(tile_count << self.radix_bits,
+                np.uint32, allocator=allocator)
+        scan = get_count_scan_kernel()
+
+        shifts = list(range(begin_bit, end_bit, self.radix_bits))
+
+        # The first pass reads from the input arrays, later passes alternate
+        # between two scratch buffers.
+        key_buffers = [
+                gpuarray.GPUArray(n, self.key_dtype, allocator=allocator)
+                for i in range(min(2, len(shifts)))]
+        if values is not None:
+            value_buffers = [
+                    gpuarray.GPUArray(n, self.value_dtype, allocator=allocator)
+                    for i in range(len(key_buffers))]
+
+        grid = (min(tile_count, 65535), 1)
+        block = (self.block_size, 1, 1)
+
+        for i, shift in enumerate(shifts):
+            digit_mask = (1 << min(self.radix_bits, end_bit - shift)) - 1
+            keys_out = key_buffers[i % 2]
+
+            self.histogram_knl.prepared_async_call(grid, block, stream,
+                    keys, histogram, shift, digit_mask, tile_count, n)
+            scan(histogram, allocator=allocator, stream=stream)
+
+            if values is not None:
+                values_out = value_buffers[i % 2]
+                self.scatter_knl.prepared_async_call(grid, block, stream,
+                        keys, keys_out, values, values_out, histogram,
+                        shift, digit_mask, tile_count, n)
+                values = values_out
+            else:
+                self.scatter_knl.prepared_async_call(grid, block, stream,
+                        keys, keys_out, histogram,
+                        shift, digit_mask, tile_count, n)
+
+            keys = keys_out
+
+        if values is not None:
+            return keys, values
+        else:
+            return keys
+
+
+def _copy(ary, allocator, stream):
+    result = gpuarray.GPUArray(ary.shape, ary.dtype, allocator=allocator)
+    if ary.size:
+        gpuarray._memcpy_discontig(result, ary, True, stream)
+    return result
+
+
+def _as_contiguous(ary, allocator, stream):
+    if ary.flags.c_contiguous:
+        return ary
+    else:
+        return _copy(ary, allocator, stream)
+
+
+@context_dependent_memoize
+def get_radix_sort(key_dtype, value_dtype=None):
+    """Return a :class:`RadixSort` for the given types, cached per
+    context.
+    """
+    return RadixSort(key_dtype, value_dtype)
+
+# }}}
+
+
+# {{{ stream compaction
+
+_COPY_IF_SOURCE = mako.template.Template(_GRID_STRIDE_LOOP + """
+typedef ${item_type} item_type;
+typedef ${output_type} output_type;
+
+${preamble}
+
+__global__ void copy_if_flags(
+    const item_type *ary, unsigned int *flags,
+% for decl in extra_arg_decls:
+    ${decl},
+% endfor
+    unsigned int n)
+{
+    // flags has n+1 entries, so that its exclusive scan ends in the count
+    if (blockIdx.x == 0 && threadIdx.x == 0)
+        flags[n] = 0;
+
+    GRID_STRIDE_LOOP(i)
+        flags[i] = (${predicate}) ? 1 : 0;
+}
+
+__global__ void copy_if_scatter(
+    const item_type *ary, output_type *out,
+    const unsigned int *positions, unsigned int n)
+{
+    GRID_STRIDE_LOOP(i)
+    {
+        const unsigned int pos = positions[i];
+        if (positions[i+1] != pos)
+            out[pos] = ${output_expr};
+    }
+}
+""", strict_undefined=True)
+
+
+@context_dependent_memoize
+def _get_copy_if_kernels(item_dtype, output_dtype, predicate, output_expr,
+        extra_arg_types, preamble):
+    extra_arg_decls = []
+    arg_types = ["P", "P"]
+    for name, dtype, is_array in extra_arg_types:
+        if is_array:
+            extra_arg_decls.append(
+                    "const %s *%s" % (dtype_to_ctype(dtype), name))
+            arg_types.append("P")
+        else:
+            extra_arg_decls.append("%s %s" % (dtype_to_ctype(dtype), name))
+            arg_types.append(dtype)
+    arg_types.append(np.uint32)
+
+    src = str(_COPY_IF_SOURCE.render(
+        item_type=dtype_to_ctype(item_dtype),
+        output_type=dtype_to_ctype(output_dtype),
+        preamble=preamble,
+        predicate=predicate,
+        output_expr=output_expr,
+        extra_arg_decls=extra_arg_decls))
+
+    mod = SourceModule(src)
+
+    flags_knl = mod.get_function("copy_if_flags").prepare(arg_types)
+    scatter_knl = mod.get_function("copy_if_scatter").prepare("PPPI")
+    return flags_knl, scatter_knl
+
+
+def _compact(ary, predicate, extra_args, preamble, output_expr, output_dtype,
+        allocator, stream):
+    import pycuda.driver as drv
+
+    if len(ary.shape) != 1:
+        raise ValueError("ary must be one-dimensional")
+
+    allocator = allocator or ary.allocator
+    ary = _as_contiguous(ary, allocator, stream)
+
+    n, = ary.shape
+    if n >= 2**32:
+        raise ValueError("stream compaction supports at most 2**32-1 items")
+    if not n:
+        return gpuarray.GPUArray(0, output_dtype, allocator=allocator)
+
+    extra_arg_types = []
+    extra_arg_values = []
+    for name, value in extra_args:
+        if isinstance(value, gpuarray.GPUArray):
+            if value.shape != ary.shape:
+                raise ValueError("extra array argument '%s' must have the "
+                        "same shape as ary" % name)
+            value = _as_contiguous(value, allocator, stream)
+            extra_arg_types.append((name, value.dtype, True))
+            extra_arg_values.append(value)
+        else:
+            value = np.asarray(value)
+            extra_arg_types.append((name, value.dtype, False))
+            extra_arg_values.append(value[()])
+
+    flags_knl, scatter_knl = _get_copy_if_kernels(
+            ary.dtype, np.dtype(output_dtype), predicate, output_expr,
+            tuple(extra_arg_types), preamble)
+
+    positions = gpuarray.GPUArray(n+1, np.uint32, allocator=allocator)
+    flags_knl.prepared_async_call(ary._grid, ary._block, stream,
+            ary, positions, *(extra_arg_values + [n]))
+    get_count_scan_kernel()(positions, allocator=allocator, stream=stream)
+
+    count = np.empty(1, np.uint32)
+    if stream is None:
+        drv.memcpy_dtoh(count, int(positions.gpudata) + 4*n)
+    else:
+        drv.memcpy_dtoh_async(count, int(positions.gpudata) + 4*n, stream)
+        stream.synchronize()
+    count = int(count[0])
+
+    result = gpuarray.GPUArray(count, output_dtype, allocator=allocator)
+    if count:
+        scatter_knl.prepared_async_call(ary._grid, ary._block, stream,
+                ary, result, positions, n)
+
+    return result
+
+
+def copy_if(ary, predicate, extra_args=(), preamble="", allocator=None,
+        stream=None):
+    """Return a new :class:`pycuda.gpuarray.GPUArray` holding, in order, the
+    elements of the one-dimensional array *ary* for which the C expression
+    *predicate* is true.
+
+    *predicate* refers to the current element as ``ary[i]`` and to the
+    number of elements as ``n``. *extra_args* is a list of ``(name, value)``
+    tuples of further arguments available to *predicate*, where *value* is
+    either a :class:`pycuda.gpuarray.GPUArray` of the same shape as *ary*
+    (indexed as ``name[i]``) or a :mod:`numpy` scalar. *preamble* is
+    inserted before the kernels.
+
+    Determining the size of the result requires reading back the number of
+    selected elements, so this function waits for *stream*.
+    """
+    return _compact(ary, predicate, extra_args, preamble,
+            "ary[i]", ary.dtype, allocator, stream)
+
+
+def nonzero_indices(ary, predicate="ary[i] != 0", extra_args=(),
+        preamble="", index_dtype=np.intp, allocator=None, stream=None):
+    """Like :func:`copy_if`, but return the indices of the selected
+    elements as an array of type *index_dtype*.
+    """
+    return _compact(ary, predicate, extra_args, preamble,
+            "i", index_dtype, allocator, stream)
+
+# }}}
+
+
+# {{{ reduce by key
+
+@context_dependent_memoize
+def _get_key_change_kernel(key_dtype):
+    from pycuda.elementwise import get_elwise_kernel
+    return get_elwise_kernel(
+            "unsigned char *flags, const %s *keys" % dtype_to_ctype(key_dtype),
+            "flags[i] = (i == 0 || keys[i] != keys[i-1])",
+            "key_change_flags")
+
+
+@context_dependent_memoize
+def _get_reduce_by_key_scan(dtype, reduce_expr, neutral, preamble):
+    from pycuda.scan import SegmentedScanKernel
+    return SegmentedScanKernel(dtype, reduce_expr, neutral,
+            name_prefix="reduce_by_key", preamble=preamble)
+
+
+def reduce_by_key(keys, values, reduce_expr="a+b", neutral="0", preamble="",
+        allocator=None, stream=None):
+    """Reduce each run of equal consecutive *keys* in the one-dimensional
+    arrays *keys* and *values*.
+
+    Returns a tuple ``(unique_keys, reduced_values)`` with one entry per
+    run. *reduce_expr* combines two values ``a`` and ``b`` and must be
+    associative, with *neutral* as its neutral element. To reduce all
+    values with equal keys, sort by key first, e.g. with :class:`RadixSort`.
+    """
+    if keys.shape != values.shape or len(keys.shape) != 1:
+        raise ValueError("keys and values must be one-dimensional arrays "
+                "of the same shape")
+
+    allocator = allocator or values.allocator
+    keys = _as_contiguous(keys, allocator, stream)
+    values = _as_contiguous(values, allocator, stream)
+
+    n, = keys.shape
+    if not n:
+        return (_copy(keys, allocator, stream),
+                _copy(values, allocator, stream))
+
+    flags = gpuarray.GPUArray(n, np.uint8, allocator=allocator)
+    _get_key_change_kernel(keys.dtype).prepared_async_call(
+            flags._grid, flags._block, stream,
+            flags, keys, n)
+
+    scan = _get_reduce_by_key_scan(values.dtype, reduce_expr, neutral,
+            preamble)
+    scanned = scan(values, "new", segment_flags=flags,
+            allocator=allocator, stream=stream)
+
+    # the last element of each run holds the run's result
+    reduced = copy_if(scanned, "i == n-1 || flags[i+1]",
+            extra_args=[("flags", flags)], allocator=allocator, stream=stream)
+    unique_keys = copy_if(keys, "flags[i]",
+            extra_args=[("flags", flags)], allocator=allocator, stream=stream)
+
+    return unique_keys, reduced
+
+# }}}
+
+# vim: foldmethod=marker
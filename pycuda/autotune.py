@@ -0,0 +1,381 @@
+"""Per-device tuning of kernel launch parameters."""
+
+from __future__ import division
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import json
+import threading
+from itertools import product
+
+import numpy as np
+from six.moves import range
+
+import pycuda.driver as drv
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+# {{{ tuning database
+
+TUNING_DB_VERSION = 1
+
+
+def size_bucket(n):
+    """Return the size bucket of a problem of *n* elements. Problems whose
+    sizes lie within the same power of two share tuned parameters.
+    """
+    return int(n).bit_length()
+
+
+def _default_db_path():
+    if "PYCUDA_TUNING_DB" in os.environ:
+        return os.environ["PYCUDA_TUNING_DB"]
+
+    import appdirs
+    return os.path.join(appdirs.user_cache_dir("pycuda", "pycuda"),
+            "tuning-db-v%d.json" % TUNING_DB_VERSION)
+
+
+_device_keys = {}
+
+
+def get_device_key(dev=None):
+    """Return the string identifying *dev* (by default, the device of the
+    current context) in the tuning database.
+    """
+    if dev is None:
+        dev = drv.Context.get_device()
+
+    try:
+        return _device_keys[dev]
+    except KeyError:
+        key = "%s (sm_%d%d)" % ((dev.name(),) + dev.compute_capability())
+        _device_keys[dev] = key
+        return key
+
+
+class TuningDatabase(object):
+    """A persistent map from (kernel family, dtype, size bucket, device) to
+    the launch parameters found to be fastest, stored as JSON in the file
+    *path*.
+
+    The file is read on first use. :meth:`store` merges new entries into
+    the file as it exists at that time, so that several processes may tune
+    concurrently.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.lock = threading.Lock()
+
+        # incremented on every change, so that users may cache lookups
+        self.generation = 0
+
+    @staticmethod
+    def _make_key(family, dtype, n, device_key):
+        if dtype is None:
+            dtype_str = "*"
+        else:
+            dtype_str = np.dtype(dtype).str
+        return "%s|%s|%d|%s" % (family, dtype_str, size_bucket(n), device_key)
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as inf:
+                data = json.load(inf)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        if data.get("version") != TUNING_DB_VERSION:
+            return {}
+
+        return data.get("entries", {})
+
+    def _get_entries(self):
+        if self.entries is None:
+            with self.lock:
+                if self.entries is None:
+                    self.entries = self._read()
+        return self.entries
+
+    def lookup(self, family, dtype, n, dev=None):
+        """Return the parameters (a :class:`dict`) stored for a problem of
+        size *n*, or *None* if there are none.
+        """
+        entries = self._get_entries()
+        if not entries:
+            return None
+
+        entry = entries.get(
+                self._make_key(family, dtype, n, get_device_key(dev)))
+        if entry is None:
+            return None
+        return entry["params"]
+
+    def store(self, family, dtype, n, params, time=None, dev=None):
+        """Record *params* as the best parameters for problems of size *n*,
+        measured to take *time* milliseconds.
+        """
+        entry = {"params": params, "time": time}
+        key = self._make_key(family, dtype, n, get_device_key(dev))
+
+        with self.lock:
+            if self.entries is None:
+                self.entries = self._read()
+            self.entries[key] = entry
+            self.generation += 1
+
+            entries = self._read()
+            entries[key] = entry
+
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                try:
+                    os.makedirs(dirname)
+                except OSError as e:
+                    from errno import EEXIST
+                    if e.errno != EEXIST:
+                        raise
+
+            tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(tmp_path, "w") as outf:
+                json.dump({"version": TUNING_DB_VERSION, "entries": entries},
+                        outf, indent=1, sort_keys=True)
+
+            try:
+                os.replace(tmp_path, self.path)
+            except AttributeError:
+                # Python 2
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(tmp_path, self.path)
+
+    def clear(self):
+        """Forget all entries, including those in the file."""
+        with self.lock:
+            self.entries = {}
+            self.generation += 1
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+_tuning_db = None
+
+
+def get_tuning_db():
+    """Return the :class:`TuningDatabase` consulted at launch time. Its
+    location is taken from the environment variable
+    :envvar:`PYCUDA_TUNING_DB` if set.
+    """
+    global _tuning_db
+    if _tuning_db is None:
+        _tuning_db = TuningDatabase(_default_db_path())
+    return _tuning_db
+
+
+def set_tuning_db(db):
+    """Make the :class:`TuningDatabase` *db* the one consulted at launch
+    time.
+    """
+    global _tuning_db
+    _tuning_db = db
+
+# }}}
+
+
+# {{{ tuning
+
+_autotuning = os.environ.get("PYCUDA_AUTOTUNE", "0") not in ("", "0")
+
+
+def set_autotuning(enabled):
+    """Enable or disable tuning of scans and reductions the first time they
+    are launched for a size bucket without an entry in the tuning database.
+    The initial setting is taken from the environment variable
+    :envvar:`PYCUDA_AUTOTUNE`.
+    """
+    global _autotuning
+    _autotuning = enabled
+
+
+def is_autotuning():
+    return _autotuning
+
+
+def get_parameters(family, dtype, n, defaults, tuner=None, dev=None):
+    """Return the launch parameters for a problem of size *n*.
+
+    The tuned parameters from the database are used if present. Otherwise,
+    if autotuning is enabled and *tuner* is given, ``tuner()`` is called to
+    find and store them. *defaults* fill in parameters that were not tuned.
+    """
+    params = get_tuning_db().lookup(family, dtype, n, dev)
+
+    if params is None and tuner is not None and _autotuning:
+        params = tuner()
+
+    if params is None:
+        return defaults
+
+    result = defaults.copy()
+    result.update(params)
+    return result
+
+
+def time_launch(run, stream=None, repeat=5):
+    """Return the average time in milliseconds taken by the work that
+    ``run()`` enqueues on *stream*. One untimed call precedes the
+    measurement to take compilation and allocation out of it.
+    """
+    from pycuda.tools import get_event_pool
+
+    run()
+
+    event_pool = get_event_pool(0)
+    start = event_pool.get()
+    stop = event_pool.get()
+    start.record(stream)
+    for i in range(repeat):
+        run()
+    stop.record(stream)
+    stop.synchronize()
+
+    elapsed = stop.time_since(start)
+    event_pool.put(start)
+    event_pool.put(stop)
+
+    return elapsed / repeat
+
+
+def tune(family, dtype, n, candidates, run_candidate, stream=None, repeat=5,
+        dev=None, store=True):
+    """Time ``run_candidate(params)`` for each :class:`dict` *params* in
+    *candidates* and return the fastest. Candidates that fail to compile or
+    launch (for instance because they need too many resources) are skipped.
+
+    If *store* is true, the winner is recorded in the tuning database under
+    *family*, *dtype* and the size bucket of *n*.
+    """
+    best_params = None
+    best_time = None
+
+    for params in candidates:
+        try:
+            elapsed = time_launch(
+                    lambda: run_candidate(params), stream, repeat)
+        except (drv.Error, drv.CompileError):
+            continue
+
+        if best_time is None or elapsed < best_time:
+            best_params = params
+            best_time = elapsed
+
+    if best_params is None:
+        raise RuntimeError("no viable candidate while tuning '%s'" % family)
+
+    if store:
+        get_tuning_db().store(family, dtype, n, best_params, best_time, dev)
+
+    return best_params
+
+
+def parameter_space(**kwargs):
+    """Return a list of :class:`dict` instances for all combinations of the
+    values of the sequences given as keyword arguments.
+    """
+    names = sorted(kwargs)
+    return [dict(zip(names, values))
+            for values in product(*[kwargs[name] for name in names])]
+
+# }}}
+
+
+# {{{ tuning of the built-in kernels
+
+def tune_elementwise(n, dtype=np.float32, stream=None, store=True):
+    """Tune the maximum number of threads per block used for ``a*x + b*y``
+    on arrays of *n* elements of type *dtype*. Other elementwise operations
+    keep the default of :func:`pycuda.gpuarray.splay`.
+    """
+    import pycuda.gpuarray as gpuarray
+    from pycuda import elementwise
+
+    dev = drv.Context.get_device()
+    max_threads = dev.get_attribute(drv.device_attribute.MAX_THREADS_PER_BLOCK)
+
+    dtype = np.dtype(dtype)
+    x = gpuarray.zeros(n, dtype)
+    y = gpuarray.zeros(n, dtype)
+    z = gpuarray.empty(n, dtype)
+    func = elementwise.get_axpbyz_kernel(dtype, dtype, dtype)
+
+    def run(params):
+        grid, block = gpuarray._splay_backend(n, dev, params["max_threads"])
+        func.prepared_async_call(grid, block, stream,
+                1, x, 2, y, z, n)
+
+    return tune("elementwise", dtype, n,
+            parameter_space(max_threads=[
+                t for t in (64, 128, 256, 512, 1024) if t <= max_threads]),
+            run, stream=stream, store=store)
+
+
+def tune_defaults(sizes=None, dtypes=(np.float32, np.float64)):
+    """Tune elementwise operations, sums and prefix sums of the built-in
+    :mod:`pycuda.gpuarray` functions for arrays of each of *sizes* and
+    *dtypes* on the current device and store the results.
+    """
+    import pycuda.gpuarray as gpuarray
+    from pycuda.reduction import get_sum_kernel
+    from pycuda.scan import InclusiveScanKernel
+
+    if sizes is None:
+        sizes = [2**k for k in range(10, 27, 2)]
+
+    for n in sizes:
+        for dtype in dtypes:
+            tune_elementwise(n, dtype)
+
+            ary = gpuarray.zeros(n, dtype)
+            get_sum_kernel(dtype, dtype).autotune(ary)
+            InclusiveScanKernel(dtype, "a+b").autotune(ary)
+
+
+if __name__ == "__main__":
+    import pycuda.autoinit  # noqa
+
+    tune_defaults()
+    db = get_tuning_db()
+    print("stored %d entries in %s" % (len(db.entries), db.path))
+
+# }}}
+
+# vim: foldmethod=marker
@@ -509,7 +509,7 @@ class _RandomNumberGeneratorBase(object):
 
         func.prepared_async_call(
                 (self.block_count, 1), (self.generators_per_block, 1, 1), stream,
-                self.state, data.gpudata, data.size)
+                self.state, data, data.size)
 
     def fill_normal(self, data, stream=None):
         if data.dtype == np.float32:
@@ -528,7 +528,7 @@ class _RandomNumberGeneratorBase(object):
 
         func.prepared_async_call(
                 (self.block_count, 1), (self.generators_per_block, 1, 1), stream,
-                self.state, data.gpudata, int(data_size))
+                self.state, data, int(data_size))
 
     def gen_uniform(self, shape, dtype, stream=None):
         result = array.empty(shape, dtype)
@@ -558,7 +558,7 @@ class _RandomNumberGeneratorBase(object):
 
             func.prepared_async_call(
                     (self.block_count, 1), (self.generators_per_block, 1, 1), stream,
-                    self.state, data.gpudata, mean, stddev, int(data_size))
+                    self.state, data, mean, stddev, int(data_size))
 
         def gen_log_normal(self, shape, dtype, mean, stddev, stream=None):
             result = array.empty(shape, dtype)
@@ -576,7 +576,7 @@ class _RandomNumberGeneratorBase(object):
 
             func.prepared_async_call(
                     (self.block_count, 1), (self.generators_per_block, 1, 1), stream,
-                    self.state, data.gpudata, lambda_value, data.size)
+                    self.state, data, lambda_value, data.size)
 
         def gen_poisson(self, shape, dtype, lambda_value, stream=None):
             result = array.empty(shape, dtype)
@@ -369,9 +369,9 @@ class DeferredFunction(object):
         block = funcmethodargs[1]
         func = self._modulelazy._delayed_get_function(self._funcname, funcargs, grid, block)
         self._do_delayed_prepare(func)
-        newfuncargs = [ getattr(arg, 'gpudata', arg) for arg in funcargs ]
+        # the prepared call interface unwraps GPUArray arguments itself
         fullargs = list(funcmethodargs)
-        fullargs.extend(newfuncargs)
+        fullargs.extend(funcargs)
         return getattr(func, funcmethodstr)(*fullargs, **funckwargs)
 
     def prepared_call(self, grid, block, *args, **kwargs):
@@ -41,6 +41,76 @@ def set_debugging(flag=True):
     CUDA_DEBUGGING = flag
 
 
+# {{{ launch hooks
+
+# replaced rather than modified, so that launches in other threads can
+# iterate over it without locking
+_launch_hooks = ()
+
+
+def add_launch_hook(hook):
+    """Arrange for ``hook(func, grid, block, stream, args, arg_buf,
+    shared_size)`` to be called before each kernel launch through
+    :meth:`Function.__call__` or the prepared call interface, with the
+    arguments as passed by the caller and the packed parameter buffer.
+    If it returns a callable, that is called without arguments once the
+    launch has been enqueued.
+    """
+    global _launch_hooks
+    _launch_hooks = _launch_hooks + (hook,)
+
+
+def remove_launch_hook(hook):
+    """Undo :func:`add_launch_hook`."""
+    global _launch_hooks
+    hooks = list(_launch_hooks)
+    hooks.remove(hook)
+    _launch_hooks = tuple(hooks)
+
+
+def _run_launch_hooks(func, grid, block, stream, args, arg_buf, shared_size):
+    after_launch = []
+    for hook in _launch_hooks:
+        after = hook(func, grid, block, stream, args, arg_buf, shared_size)
+        if after is not None:
+            after_launch.append(after)
+    return after_launch
+
+
+_copy_hooks = ()
+
+
+def add_copy_hook(hook):
+    """Arrange for ``hook(dst, src, stream)`` to be called before each copy
+    issued by :mod:`pycuda.gpuarray`, where *dst* and *src* are
+    :class:`pycuda.gpuarray.GPUArray` or :class:`numpy.ndarray` instances
+    and *stream* is *None* for synchronous copies. The return value is
+    treated as for :func:`add_launch_hook`, except that it is also called
+    if the copy fails.
+    """
+    global _copy_hooks
+    _copy_hooks = _copy_hooks + (hook,)
+
+
+def remove_copy_hook(hook):
+    """Undo :func:`add_copy_hook`."""
+    global _copy_hooks
+    hooks = list(_copy_hooks)
+    hooks.remove(hook)
+    _copy_hooks = tuple(hooks)
+
+
+def _run_copy_hooks(dst, src, stream):
+    after_copy = []
+    for hook in _copy_hooks:
+        after = hook(dst, src, stream)
+        if after is not None:
+            after_copy.append(after)
+    return after_copy
+
+# }}}
+
+
 class CompileError(Error):
     def __init__(self, msg, command_line, stdout=None, stderr=None):
         self.msg = msg
@@ -100,6 +170,21 @@ class InOut(In, Out):
     pass
 
 
+def _make_get_call_time(event_pool, start, end):
+    # The events go back to the pool once the time has been read.
+    call_time = []
+
+    def get_call_time():
+        if not call_time:
+            end.synchronize()
+            call_time.append(end.time_since(start)*1e-3)
+            event_pool.put(start)
+            event_pool.put(end)
+        return call_time[0]
+
+    return get_call_time
+
+
 def _add_functionality():
 
     def device_get_attributes(dev):
@@ -125,6 +210,11 @@ def _add_functionality():
     def device___getattr__(dev, name):
         return dev.get_attribute(getattr(device_attribute, name.upper()))
 
+    def _unwrap_args(args):
+        # allow passing objects that hold their memory in a 'gpudata'
+        # attribute, such as GPUArray
+        return [getattr(arg, "gpudata", arg) for arg in args]
+
     def _build_arg_buf(args):
         handlers = []
 
@@ -283,7 +373,7 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        func._param_setv(0, pack(func.arg_format, *args))
+        func._param_setv(0, pack(func.arg_format, *_unwrap_args(args)))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
@@ -309,23 +399,21 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        func._param_setv(0, pack(func.arg_format, *args))
+        func._param_setv(0, pack(func.arg_format, *_unwrap_args(args)))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
 
-        start = Event()
-        end = Event()
+        from pycuda.tools import get_event_pool
+        event_pool = get_event_pool(0)
+        start = event_pool.get()
+        end = event_pool.get()
 
         start.record()
         func._launch_grid(*grid)
         end.record()
 
-        def get_call_time():
-            end.synchronize()
-            return end.time_since(start)*1e-3
-
-        return get_call_time
+        return _make_get_call_time(event_pool, start, end)
 
     def function_prepared_async_call_pre_v4(func, grid, block, stream,
             *args, **kwargs):
@@ -348,7 +436,7 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        func._param_setv(0, pack(func.arg_format, *args))
+        func._param_setv(0, pack(func.arg_format, *_unwrap_args(args)))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
@@ -392,6 +480,10 @@ def _add_functionality():
                 for handler in handlers
                 if hasattr(handler, "post_call")]
 
+        after_launch = (_run_launch_hooks(func, grid, block, stream, args,
+                    arg_buf, shared)
+                if _launch_hooks else ())
+
         if stream is None:
             if time_kernel:
                 Context.synchronize()
@@ -401,6 +493,9 @@ def _add_functionality():
 
             func._launch_kernel(grid, block, arg_buf, shared, None)
 
+            for after in after_launch:
+                after()
+
             if post_handlers or time_kernel:
                 Context.synchronize()
 
@@ -417,6 +512,9 @@ def _add_functionality():
                     "Can't time the kernel on an asynchronous invocation"
             func._launch_kernel(grid, block, arg_buf, shared, stream)
 
+            for after in after_launch:
+                after()
+
             if post_handlers:
                 for handler in post_handlers:
                     handler.post_call(stream)
@@ -458,13 +556,20 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        arg_buf = pack(func.arg_format, *args)
+        arg_buf = pack(func.arg_format, *_unwrap_args(args))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
 
+        after_launch = (_run_launch_hooks(func, grid, block, None, args,
+                    arg_buf, shared_size)
+                if _launch_hooks else ())
+
         func._launch_kernel(grid, block, arg_buf, shared_size, None)
 
+        for after in after_launch:
+            after()
+
     def function_prepared_timed_call(func, grid, block, *args, **kwargs):
         shared_size = kwargs.pop("shared_size", 0)
         if kwargs:
@@ -472,23 +577,28 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        arg_buf = pack(func.arg_format, *args)
+        arg_buf = pack(func.arg_format, *_unwrap_args(args))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
 
-        start = Event()
-        end = Event()
+        after_launch = (_run_launch_hooks(func, grid, block, None, args,
+                    arg_buf, shared_size)
+                if _launch_hooks else ())
+
+        from pycuda.tools import get_event_pool
+        event_pool = get_event_pool(0)
+        start = event_pool.get()
+        end = event_pool.get()
 
         start.record()
         func._launch_kernel(grid, block, arg_buf, shared_size, None)
         end.record()
 
-        def get_call_time():
-            end.synchronize()
-            return end.time_since(start)*1e-3
+        for after in after_launch:
+            after()
 
-        return get_call_time
+        return _make_get_call_time(event_pool, start, end)
 
     def function_prepared_async_call(func, grid, block, stream, *args, **kwargs):
         if isinstance(block, tuple):
@@ -508,13 +618,20 @@ def _add_functionality():
                     + ", ".join(six.iterkeys(kwargs)))
 
         from pycuda._pvt_struct import pack
-        arg_buf = pack(func.arg_format, *args)
+        arg_buf = pack(func.arg_format, *_unwrap_args(args))
 
         for texref in func.texrefs:
             func.param_set_texref(texref)
 
+        after_launch = (_run_launch_hooks(func, grid, block, stream, args,
+                    arg_buf, shared_size)
+                if _launch_hooks else ())
+
         func._launch_kernel(grid, block, arg_buf, shared_size, stream)
 
+        for after in after_launch:
+            after()
+
     # }}}
 
     def function___getattr__(self, name):
@@ -581,6 +698,24 @@ def _add_functionality():
 _add_functionality()
 
 
+# {{{ default stream
+
+def _init_default_stream():
+    import os
+    mode = os.environ.get("PYCUDA_DEFAULT_STREAM", "legacy")
+    if mode == "per-thread":
+        set_per_thread_default_stream(True)
+    elif mode != "legacy":
+        from warnings import warn
+        warn("ignoring unrecognized value '%s' of PYCUDA_DEFAULT_STREAM "
+                "(expected 'legacy' or 'per-thread')" % mode)
+
+
+_init_default_stream()
+
+# }}}
+
+
 # {{{ pagelocked numpy arrays
 
 def pagelocked_zeros(shape, dtype, order="C", mem_flags=0):
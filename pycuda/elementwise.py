@@ -552,6 +552,230 @@ class ElementwiseKernel:
         func.prepared_async_call(grid, block, stream, *invocation_args)
 
 
+# {{{ multi-array elementwise kernels
+
+@context_dependent_memoize
+def _get_multi_elwise_function(source, name, keep, options, arg_types):
+    from pycuda.compiler import SourceModule
+    if options is not None:
+        options = list(options)
+    mod = SourceModule(source, keep=keep, options=options)
+    func = mod.get_function(name)
+    func.prepare(arg_types)
+    return func
+
+
+class MultiElementwiseKernel:
+    """Applies an elementwise operation, written as for
+    :class:`ElementwiseKernel`, to many groups of arrays in one launch.
+
+    Each vector argument is passed a sequence of arrays, and the operation
+    is carried out for every index *k* on the *k*-th array of each of
+    them, which must all have the same size and be contiguous in the same
+    order. The addresses and sizes of the arrays are gathered in a table in
+    device memory, which is reused as long as the same arrays are passed.
+    Scalar arguments are shared by all groups. Within *operation*, ``n`` is
+    the size of the current group's arrays. *loop_prep* may not refer to
+    vector arguments.
+    """
+
+    def __init__(self, arguments, operation,
+            name="kernel", keep=False, options=None,
+            preamble="", loop_prep="", after_loop="", block_size=256):
+        if isinstance(arguments, str):
+            from pycuda.tools import parse_c_arg
+            arguments = [parse_c_arg(arg) for arg in arguments.split(",")]
+
+        self.arguments = arguments
+        self.vector_args = [arg for arg in arguments
+                if isinstance(arg, VectorArg)]
+        if not self.vector_args:
+            raise ValueError("MultiElementwiseKernel can only be used with "
+                    "functions that have at least one vector argument")
+
+        self.name = name
+        self.keep = keep
+        self.options = options
+        self.block_size = block_size
+        self.chunk_size = 4*block_size
+
+        # table row: first block, size, then one address per vector argument
+        self._row_length = 2 + len(self.vector_args)
+
+        uintp = dtype_to_ctype(np.uintp)
+        self.source = """
+            #include <pycuda-complex.hpp>
+
+            %(defines)s
+
+            %(preamble)s
+
+            __global__ void %(name)s(const %(uintp)s *mt_table,
+              unsigned mt_array_count, %(uintp)s mt_block_count%(scalar_args)s)
+            {
+              unsigned tid = threadIdx.x;
+
+              %(loop_prep)s;
+
+              for (%(uintp)s mt_block = blockIdx.x; mt_block < mt_block_count;
+                  mt_block += gridDim.x)
+              {
+                // find the group of arrays this block works on
+                unsigned mt_lo = 0, mt_hi = mt_array_count;
+                while (mt_hi - mt_lo > 1)
+                {
+                  unsigned mt_mid = (mt_lo + mt_hi) / 2;
+                  if (mt_table[mt_mid*%(row_length)d] <= mt_block)
+                    mt_lo = mt_mid;
+                  else
+                    mt_hi = mt_mid;
+                }
+
+                const %(uintp)s *mt_row = mt_table + mt_lo*%(row_length)d;
+                const %(uintp)s n = mt_row[1];
+                %(vector_decls)s
+
+                %(uintp)s mt_start = (mt_block - mt_row[0]) * %(chunk_size)d;
+                %(uintp)s mt_stop = mt_start + %(chunk_size)d;
+                if (mt_stop > n)
+                  mt_stop = n;
+
+                for (%(uintp)s i = mt_start + tid; i < mt_stop; i += blockDim.x)
+                {
+                  %(operation)s;
+                }
+              }
+
+              %(after_loop)s;
+            }
+            """ % {
+                "defines": "\n".join(
+                    "#define %s_i i" % arg.name for arg in self.vector_args),
+                "preamble": preamble,
+                "name": name,
+                "uintp": uintp,
+                "scalar_args": "".join(", " + arg.declarator()
+                    for arg in arguments if not isinstance(arg, VectorArg)),
+                "loop_prep": loop_prep,
+                "row_length": self._row_length,
+                "vector_decls": "\n".join(
+                    "%s = (%s *) mt_row[%d];" % (
+                        arg.declarator(), dtype_to_ctype(arg.dtype), 2+i)
+                    for i, arg in enumerate(self.vector_args)),
+                "chunk_size": self.chunk_size,
+                "operation": operation,
+                "after_loop": after_loop,
+                }
+
+        self.arg_types = "P%s%s%s" % (
+                np.dtype(np.uint32).char, np.dtype(np.uintp).char,
+                "".join(arg.struct_char for arg in arguments
+                    if not isinstance(arg, VectorArg)))
+
+        self._tables = {}
+
+    def get_function(self):
+        # the arguments serve as a cache key and must be hashable
+        options = self.options
+        if options is not None:
+            options = tuple(options)
+
+        return _get_multi_elwise_function(
+                self.source, self.name, self.keep, options, self.arg_types)
+
+    def _get_table(self, groups):
+        import pycuda.driver as drv
+
+        key = (drv.Context.get_current(),
+                tuple((group[0].size,) + tuple(ary.ptr for ary in group)
+                    for group in groups))
+
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+
+        table = np.empty((len(groups), self._row_length), np.uintp)
+        block_count = 0
+        for k, group in enumerate(groups):
+            table[k, 0] = block_count
+            table[k, 1] = group[0].size
+            table[k, 2:] = [ary.ptr for ary in group]
+            block_count += -(-group[0].size // self.chunk_size)
+
+        from pycuda.gpuarray import to_gpu
+        if len(self._tables) >= 16:
+            self._tables.clear()
+        result = self._tables[key] = to_gpu(table), block_count
+        return result
+
+    def __call__(self, *args, **kwargs):
+        """Run the operation. Vector arguments are sequences of
+        :class:`pycuda.gpuarray.GPUArray` instances of equal length.
+        Accepts *stream* as a keyword argument.
+        """
+        stream = kwargs.pop("stream", None)
+        if kwargs:
+            raise TypeError("invalid keyword arguments specified: "
+                    + ", ".join(six.iterkeys(kwargs)))
+
+        if len(args) != len(self.arguments):
+            raise TypeError("expected %d arguments, got %d"
+                    % (len(self.arguments), len(args)))
+
+        vectors = []
+        scalars = []
+        for arg, arg_descr in zip(args, self.arguments):
+            if isinstance(arg_descr, VectorArg):
+                vectors.append(list(arg))
+            else:
+                scalars.append(arg)
+
+        group_count = len(vectors[0])
+        if any(len(vec) != group_count for vec in vectors):
+            raise ValueError("vector arguments must be sequences "
+                    "of the same length")
+
+        groups = []
+        for group in zip(*vectors):
+            size = group[0].size
+            for ary in group:
+                if ary.size != size:
+                    raise ValueError("arrays processed together must "
+                            "have the same size")
+                if not (ary.flags.c_contiguous or ary.flags.f_contiguous):
+                    raise ValueError("arrays must be contiguous")
+                if ary.ndim > 1 and (ary.flags.c_contiguous
+                        != group[0].flags.c_contiguous):
+                    raise ValueError("arrays processed together must "
+                            "have the same order")
+            if size:
+                groups.append(group)
+
+        if not groups:
+            return
+
+        from pycuda.gpuarray import (wait_for_access, record_access,
+                is_dependency_tracking)
+
+        table, block_count = self._get_table(groups)
+
+        # The arrays are only reachable through the table, so launch hooks
+        # do not see them.
+        if is_dependency_tracking():
+            arrays = [ary for group in groups for ary in group]
+            wait_for_access(arrays, stream)
+
+        self.get_function().prepared_async_call(
+                (min(block_count, 65535), 1), (self.block_size, 1, 1),
+                stream, table, len(groups), block_count, *scalars)
+
+        if is_dependency_tracking():
+            record_access(arrays, stream)
+
+# }}}
+
+
 @context_dependent_memoize
 def get_take_kernel(dtype, idx_dtype, vec_count=1):
     ctx = {
@@ -716,27 +940,79 @@ def get_linear_combination_kernel(summand_descriptors,
     return func, tex_src
 
 
-@context_dependent_memoize
-def get_axpbyz_kernel(dtype_x, dtype_y, dtype_z):
-    return get_elwise_kernel(
-            "%(tp_x)s a, %(tp_x)s *x, %(tp_y)s b, %(tp_y)s *y, %(tp_z)s *z" % {
+def _get_scalar_arg(name, dtype, dtype_device=None):
+    """Return the declarator of the scalar kernel argument *name* of type
+    *dtype* and a statement to run before the loop of the kernel.
+
+    If *dtype_device* is not *None*, the scalar is passed instead as the
+    address of a value of that type in device memory, which the statement
+    reads into a local variable *name*.
+    """
+    tp = dtype_to_ctype(dtype)
+
+    if dtype_device is None:
+        return "%s %s" % (tp, name), ""
+
+    return ("%s %s_ptr" % (dtype_to_ctype(np.uintp), name),
+            "const %(tp)s %(name)s = (%(tp)s) *(const %(tp_dev)s *) %(name)s_ptr;"
+            % {
+                "tp": tp,
+                "tp_dev": dtype_to_ctype(dtype_device),
+                "name": name,
+                })
+
+
+def _get_axpbyz_arguments(dtype_x, dtype_y, dtype_z, dtype_a, dtype_b):
+    a_arg, a_prep = _get_scalar_arg(
+            "a", dtype_x if dtype_a is None else dtype_z, dtype_a)
+    b_arg, b_prep = _get_scalar_arg(
+            "b", dtype_y if dtype_b is None else dtype_z, dtype_b)
+
+    return ("%(a_arg)s, %(tp_x)s *x, %(b_arg)s, %(tp_y)s *y, %(tp_z)s *z" % {
+                "a_arg": a_arg,
+                "b_arg": b_arg,
                 "tp_x": dtype_to_ctype(dtype_x),
                 "tp_y": dtype_to_ctype(dtype_y),
                 "tp_z": dtype_to_ctype(dtype_z),
                 },
+            a_prep + b_prep)
+
+
+@context_dependent_memoize
+def get_axpbyz_kernel(dtype_x, dtype_y, dtype_z, dtype_a=None, dtype_b=None):
+    arguments, loop_prep = _get_axpbyz_arguments(
+            dtype_x, dtype_y, dtype_z, dtype_a, dtype_b)
+
+    return get_elwise_kernel(arguments,
+            "z[z_i] = a*x[x_i] + b*y[y_i]",
+            "axpbyz", loop_prep=loop_prep)
+
+
+@context_dependent_memoize
+def get_multi_axpbyz_kernel(dtype_x, dtype_y, dtype_z,
+        dtype_a=None, dtype_b=None):
+    arguments, loop_prep = _get_axpbyz_arguments(
+            dtype_x, dtype_y, dtype_z, dtype_a, dtype_b)
+
+    return MultiElementwiseKernel(arguments,
             "z[z_i] = a*x[x_i] + b*y[y_i]",
-            "axpbyz")
+            "multi_axpbyz", loop_prep=loop_prep)
 
 
 @context_dependent_memoize
-def get_axpbz_kernel(dtype_x, dtype_z):
+def get_axpbz_kernel(dtype_x, dtype_z, dtype_a=None, dtype_b=None):
+    a_arg, a_prep = _get_scalar_arg("a", dtype_z, dtype_a)
+    b_arg, b_prep = _get_scalar_arg("b", dtype_z, dtype_b)
+
     return get_elwise_kernel(
-            "%(tp_z)s a, %(tp_x)s *x,%(tp_z)s b, %(tp_z)s *z" % {
+            "%(a_arg)s, %(tp_x)s *x,%(b_arg)s, %(tp_z)s *z" % {
+                "a_arg": a_arg,
+                "b_arg": b_arg,
                 "tp_x": dtype_to_ctype(dtype_x),
                 "tp_z": dtype_to_ctype(dtype_z)
                 },
             "z[z_i] = a * x[x_i] + b",
-            "axpb")
+            "axpb", loop_prep=a_prep + b_prep)
 
 
 @context_dependent_memoize
@@ -752,14 +1028,17 @@ def get_binary_op_kernel(dtype_x, dtype_y, dtype_z, operator):
 
 
 @context_dependent_memoize
-def get_rdivide_elwise_kernel(dtype_x, dtype_z):
+def get_rdivide_elwise_kernel(dtype_x, dtype_z, dtype_y=None):
+    y_arg, y_prep = _get_scalar_arg("y", dtype_z, dtype_y)
+
     return get_elwise_kernel(
-            "%(tp_x)s *x, %(tp_z)s y, %(tp_z)s *z" % {
+            "%(tp_x)s *x, %(y_arg)s, %(tp_z)s *z" % {
                 "tp_x": dtype_to_ctype(dtype_x),
+                "y_arg": y_arg,
                 "tp_z": dtype_to_ctype(dtype_z),
                 },
             "z[z_i] = y / x[x_i]",
-            "divide_r")
+            "divide_r", loop_prep=y_prep)
 
 
 @context_dependent_memoize
@@ -801,13 +1080,29 @@ def get_binary_minmax_kernel(func, dtype_x, dtype_y, dtype_z, use_scalar):
 
 
 @context_dependent_memoize
-def get_fill_kernel(dtype):
+def get_fill_kernel(dtype, dtype_a=None):
+    a_arg, a_prep = _get_scalar_arg("a", dtype, dtype_a)
+
     return get_elwise_kernel(
-            "%(tp)s a, %(tp)s *z" % {
+            "%(a_arg)s, %(tp)s *z" % {
+                "a_arg": a_arg,
                 "tp": dtype_to_ctype(dtype),
                 },
             "z[z_i] = a",
-            "fill")
+            "fill", loop_prep=a_prep)
+
+
+@context_dependent_memoize
+def get_multi_fill_kernel(dtype, dtype_a=None):
+    a_arg, a_prep = _get_scalar_arg("a", dtype, dtype_a)
+
+    return MultiElementwiseKernel(
+            "%(a_arg)s, %(tp)s *z" % {
+                "a_arg": a_arg,
+                "tp": dtype_to_ctype(dtype),
+                },
+            "z[z_i] = a",
+            "multi_fill", loop_prep=a_prep)
 
 
 @context_dependent_memoize
@@ -863,18 +1158,31 @@ def get_arange_kernel(dtype):
 
 
 @context_dependent_memoize
-def get_pow_kernel(dtype):
+def get_unravel_index_kernel(dtype):
+    return get_elwise_kernel(
+            "%(tp)s *z, const %(tp)s *flat, %(tp)s divisor, %(tp)s dim" % {
+                "tp": dtype_to_ctype(dtype),
+                },
+            "z[z_i] = (flat[flat_i] / divisor) % dim",
+            "unravel_index")
+
+
+@context_dependent_memoize
+def get_pow_kernel(dtype, dtype_value=None):
     if dtype == np.float32:
         func = "powf"
     else:
         func = "pow"
 
+    value_arg, value_prep = _get_scalar_arg("value", dtype, dtype_value)
+
     return get_elwise_kernel(
-            "%(tp)s value, %(tp)s *y, %(tp)s *z" % {
+            "%(value_arg)s, %(tp)s *y, %(tp)s *z" % {
+                "value_arg": value_arg,
                 "tp": dtype_to_ctype(dtype),
                 },
             "z[z_i] = %s(y[y_i], value)" % func,
-            "pow_method")
+            "pow_method", loop_prep=value_prep)
 
 
 @context_dependent_memoize
@@ -957,12 +1265,15 @@ def get_if_positive_kernel(crit_dtype, dtype):
 
 
 @context_dependent_memoize
-def get_scalar_op_kernel(dtype_x, dtype_y, operator):
+def get_scalar_op_kernel(dtype_x, dtype_y, operator, dtype_a=None):
+    a_arg, a_prep = _get_scalar_arg(
+            "a", dtype_x if dtype_a is None else dtype_a, dtype_a)
+
     return get_elwise_kernel(
-            "%(tp_x)s *x, %(tp_a)s a, %(tp_y)s *y" % {
+            "%(tp_x)s *x, %(a_arg)s, %(tp_y)s *y" % {
                 "tp_x": dtype_to_ctype(dtype_x),
                 "tp_y": dtype_to_ctype(dtype_y),
-                "tp_a": dtype_to_ctype(dtype_x),
+                "a_arg": a_arg,
                 },
             "y[y_i] = x[x_i] %s a" % operator,
-            "scalarop_kernel")
+            "scalarop_kernel", loop_prep=a_prep)
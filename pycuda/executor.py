@@ -0,0 +1,252 @@
+"""Running Python callables on several devices from a pool of threads."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+import threading
+from concurrent.futures import Executor, Future
+
+from six.moves import range, queue
+
+import pycuda.driver as drv
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+class _DeviceSlot(object):
+    def __init__(self, index, device, context):
+        self.index = index
+        self.device = device
+        self.context = context
+        self.queue = queue.Queue()
+        self.threads = []
+
+        # number of submitted work items that have not finished
+        self.outstanding = 0
+
+
+class _WorkItem(object):
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+
+
+_worker_state = threading.local()
+
+
+def get_worker_device_index():
+    """Return the index (within its :class:`DeviceExecutor`) of the device
+    the calling worker thread is bound to, or *None* if the caller is not a
+    worker thread.
+    """
+    return getattr(_worker_state, "device_index", None)
+
+
+class DeviceExecutor(Executor):
+    """A :class:`concurrent.futures.Executor` running callables on several
+    devices.
+
+    One context is created for each of *devices* (a sequence of
+    :class:`pycuda.driver.Device` instances or device ordinals, all devices
+    by default), with *context_flags*. Each context is served by
+    *threads_per_device* worker threads, in which it is current for the
+    lifetime of the executor. Callables can therefore use
+    :mod:`pycuda.gpuarray` and compiled kernels without managing contexts.
+
+    :meth:`submit` sends work to the device with the fewest unfinished work
+    items. *initializer*, if given, is called with *initargs* in each worker
+    thread once its context is current.
+
+    Device memory and other objects tied to a context should be released
+    either in a worker for the same device or in the thread that created
+    the executor.
+    """
+
+    def __init__(self, devices=None, threads_per_device=1, context_flags=0,
+            initializer=None, initargs=()):
+        drv.init()
+
+        if devices is None:
+            devices = range(drv.Device.count())
+
+        self._initializer = initializer
+        self._initargs = initargs
+
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._slots = []
+
+        # held while joining the workers and detaching the contexts, which
+        # happens at most once, but possibly after a non-waiting shutdown
+        self._release_lock = threading.Lock()
+        self._released = False
+
+        try:
+            for index, dev in enumerate(devices):
+                if not isinstance(dev, drv.Device):
+                    dev = drv.Device(dev)
+                ctx = dev.make_context(context_flags)
+                drv.Context.pop()
+                self._slots.append(_DeviceSlot(index, dev, ctx))
+        except:
+            for slot in self._slots:
+                slot.context.detach()
+            raise
+
+        if not self._slots:
+            raise ValueError("no devices to run on")
+
+        for slot in self._slots:
+            for i in range(threads_per_device):
+                thread = threading.Thread(
+                        target=self._work, args=(slot,),
+                        name="pycuda-executor-%d-%d" % (slot.index, i))
+                thread.daemon = True
+                thread.start()
+                slot.threads.append(thread)
+
+    @property
+    def devices(self):
+        """The list of :class:`pycuda.driver.Device` instances used."""
+        return [slot.device for slot in self._slots]
+
+    @property
+    def contexts(self):
+        """The list of contexts, one per device, in which work is run."""
+        return [slot.context for slot in self._slots]
+
+    def _work(self, slot):
+        slot.context.push()
+        _worker_state.device_index = slot.index
+        try:
+            init_error = None
+            if self._initializer is not None:
+                try:
+                    self._initializer(*self._initargs)
+                except BaseException as e:
+                    init_error = e
+
+            while True:
+                item = slot.queue.get()
+                if item is None:
+                    return
+
+                try:
+                    if init_error is not None:
+                        # fail the work items this thread picks up rather
+                        # than leaving them pending forever
+                        if item.future.set_running_or_notify_cancel():
+                            item.future.set_exception(init_error)
+                    else:
+                        item.run()
+                finally:
+                    del item
+                    with self._lock:
+                        slot.outstanding -= 1
+        finally:
+            del _worker_state.device_index
+            drv.Context.pop()
+
+    def _submit_to_slot(self, slot, fn, args, kwargs):
+        # called with self._lock held, so that no work is enqueued after
+        # the worker threads have been told to exit
+        if self._shutdown:
+            raise RuntimeError("cannot submit after shutdown")
+
+        future = Future()
+        slot.outstanding += 1
+        slot.queue.put(_WorkItem(future, fn, args, kwargs))
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule ``fn(*args, **kwargs)`` on the least busy device and
+        return a :class:`concurrent.futures.Future` for its result.
+        """
+        with self._lock:
+            slot = min(self._slots,
+                    key=lambda slot: (slot.outstanding, slot.index))
+            return self._submit_to_slot(slot, fn, args, kwargs)
+
+    def submit_to(self, device_index, fn, *args, **kwargs):
+        """Like :meth:`submit`, but run *fn* on the device at *device_index*
+        in :attr:`devices`.
+        """
+        with self._lock:
+            return self._submit_to_slot(
+                    self._slots[device_index], fn, args, kwargs)
+
+    def submit_to_all(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` once on every device, for instance to
+        compile the kernels a workload needs ahead of time, which are cached
+        per context. Return a list of futures, one per device.
+        """
+        return [self.submit_to(i, fn, *args, **kwargs)
+                for i in range(len(self._slots))]
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and let the worker threads exit once the work
+        already submitted is done. If *wait* is true, wait for them and
+        release the contexts, which must then no longer be used. A later
+        call with *wait* true completes a shutdown started with *wait*
+        false.
+        """
+        with self._lock:
+            stop_workers = not self._shutdown
+            self._shutdown = True
+
+        if stop_workers:
+            for slot in self._slots:
+                for thread in slot.threads:
+                    slot.queue.put(None)
+
+        if wait:
+            with self._release_lock:
+                if self._released:
+                    return
+
+                for slot in self._slots:
+                    for thread in slot.threads:
+                        thread.join()
+
+                for slot in self._slots:
+                    slot.context.detach()
+
+                self._released = True
+
+# vim: foldmethod=marker
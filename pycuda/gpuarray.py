@@ -4,6 +4,8 @@ import numpy as np
 import pycuda.elementwise as elementwise
 from pytools import memoize, memoize_method
 import pycuda.driver as drv
+from pycuda.tools import context_dependent_memoize
+from pycuda.autotune import get_tuning_db, size_bucket
 from pycuda.compyte.array import (
         as_strided as _as_strided,
         f_contiguous_strides as _f_contiguous_strides,
@@ -14,6 +16,7 @@ from pycuda.characterize import has_double_support
 import six
 from six.moves import range, zip, reduce
 import numbers
+import weakref
 
 
 def _get_common_dtype(obj1, obj2):
@@ -78,13 +81,15 @@ _create_vector_types()
 # {{{ helper functionality
 
 @memoize
-def _splay_backend(n, dev):
+def _splay_backend(n, dev, max_threads=None):
     # heavily modified from cublas
     from pycuda.tools import DeviceData
     devdata = DeviceData(dev)
 
+    if max_threads is None:
+        max_threads = 128
+
     min_threads = devdata.warp_size
-    max_threads = 128
     max_blocks = 4 * devdata.thread_blocks_per_mp \
             * dev.get_attribute(drv.device_attribute.MULTIPROCESSOR_COUNT)
 
@@ -111,14 +116,80 @@ def splay(n, dev=None):
         dev = drv.Context.get_device()
     return _splay_backend(n, dev)
 
+
+@context_dependent_memoize
+def _get_tuned_max_threads(func, dtype, bucket, db, db_generation):
+    # Returns the device and the thread cap for _tuned_splay. *db_generation*
+    # is part of the key so that changes to *db* are picked up.
+    dev = drv.Context.get_device()
+
+    # a size in *bucket*
+    params = db.lookup("elementwise", dtype, (1 << bucket) >> 1, dev)
+    if params is None:
+        return dev, None
+
+    return dev, min(params["max_threads"], func.max_threads_per_block)
+
+
+def _tuned_splay(n, dtype, func):
+    """Like :func:`splay`, but use the thread cap found by
+    :func:`pycuda.autotune.tune_elementwise` for *dtype*, if any, as far as
+    the elementwise kernel *func* supports it.
+    """
+    db = get_tuning_db()
+    dev, max_threads = _get_tuned_max_threads(
+            func, dtype, size_bucket(n), db, db.generation)
+    return _splay_backend(n, dev, max_threads)
+
 # }}}
 
 
 # {{{ main GPUArray class
 
+def _is_device_scalar(obj):
+    """Return whether *obj* is a 0-dimensional :class:`GPUArray`, which
+    arithmetic treats as a scalar that is read on the device.
+    """
+    return isinstance(obj, GPUArray) and obj.shape == ()
+
+
+def _get_scalar_arg(value):
+    """Return a tuple ``(dtype, arg)`` for passing the scalar *value* to a
+    kernel. *dtype* is the type of a device scalar and *None* for a host
+    scalar. Device scalars are passed as arrays, so that launch hooks such
+    as dependency tracking see them.
+    """
+    if _is_device_scalar(value):
+        return value.dtype, value
+    else:
+        return None, value
+
+
+def _is_scalar_over(ary, other):
+    """Return whether *ary* is a device scalar to be applied to each entry of
+    the array *other*.
+    """
+    return (isinstance(other, GPUArray)
+            and ary.shape == () and other.shape != ())
+
+
+# the operator that gives the same result with the operands swapped
+_SWAPPED_OPERATORS = {
+        "==": "==", "!=": "!=",
+        "<": ">", ">": "<",
+        "<=": ">=", ">=": "<=",
+        }
+
+
 def _make_binary_op(operator):
     def func(self, other):
-        if isinstance(other, GPUArray):
+        if _is_scalar_over(self, other):
+            result = other._scalar_op(self, _SWAPPED_OPERATORS[operator],
+                    other._new_like_me())
+        elif _is_device_scalar(other):
+            result = self._new_like_me()
+            self._scalar_op(other, operator, result)
+        elif isinstance(other, GPUArray):
             assert self.shape == other.shape
 
             result = self._new_like_me()
@@ -128,8 +199,6 @@ def _make_binary_op(operator):
             func.prepared_async_call(self._grid, self._block, None,
                     self, other, result,
                     self.mem_size)
-
-            return result
         else:  # scalar operator
             result = self._new_like_me()
             func = elementwise.get_scalar_op_kernel(
@@ -137,7 +206,9 @@ def _make_binary_op(operator):
             func.prepared_async_call(self._grid, self._block, None,
                     self, other, result,
                     self.mem_size)
-            return result
+
+        result._is_comparison = True
+        return result
 
     return func
 
@@ -210,6 +281,10 @@ class GPUArray(object):
 
         self._grid, self._block = splay(self.mem_size)
 
+        # set on the results of comparisons, which may be used as masks
+        # for indexing even though they have the type of the operands
+        self._is_comparison = False
+
     @property
     def ndim(self):
         return len(self.shape)
@@ -240,7 +315,12 @@ class GPUArray(object):
     def get(self, ary=None, pagelocked=False, async=False, stream=None):
         slicer = None
         if ary is None:
-            if pagelocked:
+            if pagelocked and self.size:
+                # reuse page-locked memory across calls
+                from pycuda.tools import get_staging_pool
+                ary = get_staging_pool().host_pool.allocate(
+                        (self.size,), self.dtype).reshape(self.shape)
+            elif pagelocked:
                 ary = drv.pagelocked_empty(self.shape, self.dtype)
             else:
                 ary = np.empty(self.shape, self.dtype)
@@ -269,11 +349,32 @@ class GPUArray(object):
     def get_async(self, stream=None, ary=None):
         return self.get(ary=ary, async=True, stream=stream)
 
+    def get_future(self, stream=None, host_allocator=None):
+        """Enqueue a copy of *self* to page-locked host memory on *stream*
+        and return an :class:`ArrayFuture` for it, without waiting.
+        *host_allocator*, if given, is called as ``host_allocator(shape,
+        dtype)`` to obtain the page-locked destination array.
+        """
+        return ArrayFuture(self, stream=stream, host_allocator=host_allocator)
+
     def copy(self, order="K"):
         new = self._new_like_me(order=order)
         _memcpy_discontig(new, self)
         return new
 
+    def get_ipc_handle(self, stream=None):
+        """Return an :class:`IPCArrayHandle` through which other processes
+        can access the memory of *self* without copying.
+        """
+        return IPCArrayHandle(self, stream=stream)
+
+    def tofile(self, fid):
+        """Write the raw bytes of *self* in C order to *fid*, a file name
+        or a binary file object, without making a full host copy.
+        See :func:`fromfile`.
+        """
+        _write_raw(fid, self, order="C")
+
     def __str__(self):
         return str(self.get())
 
@@ -287,29 +388,68 @@ class GPUArray(object):
     def ptr(self):
         return self.gpudata.__int__()
 
+    @property
+    def __cuda_array_interface__(self):
+        """Version 3 of the CUDA Array Interface, see
+        https://numba.readthedocs.io/en/stable/cuda/cuda_array_interface.html
+        """
+        return {
+                "shape": self.shape,
+                "typestr": self.dtype.str,
+                "data": (self.ptr if self.size else 0, False),
+                "strides": None if self.flags.c_contiguous else self.strides,
+                # work issued through PyCUDA without an explicit stream
+                # runs on the legacy (1) or the per-thread (2) default
+                # stream
+                "stream": 2 if drv.uses_per_thread_default_stream() else 1,
+                "version": 3,
+                }
+
+    def __dlpack__(self, stream=None):
+        """Return a DLPack capsule referring to the memory of *self*.
+        *stream* is the consumer's stream handle, as an integer.
+        """
+        if stream != -1:
+            _sync_with_foreign_stream(stream)
+
+        from pycuda._dlpack import to_dlpack
+        return to_dlpack(self, *self.__dlpack_device__())
+
+    def __dlpack_device__(self):
+        from pycuda._dlpack import DL_CUDA
+        return DL_CUDA, _get_device_ordinal()
+
     # kernel invocation wrappers ----------------------------------------------
     def _axpbyz(self, selffac, other, otherfac, out, add_timer=None, stream=None):
         """Compute ``out = selffac * self + otherfac*other``,
-        where `other` is a vector.."""
+        where `other` is a vector. The factors may be device scalars."""
         assert self.shape == other.shape
 
-        func = elementwise.get_axpbyz_kernel(self.dtype, other.dtype, out.dtype)
+        dtype_a, selffac = _get_scalar_arg(selffac)
+        dtype_b, otherfac = _get_scalar_arg(otherfac)
+        func = elementwise.get_axpbyz_kernel(self.dtype, other.dtype, out.dtype,
+                dtype_a, dtype_b)
 
         if add_timer is not None:
             add_timer(3*self.size, func.prepared_timed_call(self._grid,
                 selffac, self, otherfac, other,
                 out, self.mem_size))
         else:
-            func.prepared_async_call(self._grid, self._block, stream,
+            grid, block = _tuned_splay(self.mem_size, out.dtype, func)
+            func.prepared_async_call(grid, block, stream,
                     selffac, self, otherfac, other,
                     out, self.mem_size)
 
         return out
 
     def _axpbz(self, selffac, other, out, stream=None):
-        """Compute ``out = selffac * self + other``, where `other` is a scalar."""
+        """Compute ``out = selffac * self + other``, where `other` is a scalar.
+        Both *selffac* and *other* may be device scalars."""
 
-        func = elementwise.get_axpbz_kernel(self.dtype, out.dtype)
+        dtype_a, selffac = _get_scalar_arg(selffac)
+        dtype_b, other = _get_scalar_arg(other)
+        func = elementwise.get_axpbz_kernel(self.dtype, out.dtype,
+                dtype_a, dtype_b)
         func.prepared_async_call(self._grid, self._block, stream,
                 selffac, self,
                 other, out, self.mem_size)
@@ -331,7 +471,22 @@ class GPUArray(object):
            y = n / self
         """
 
-        func = elementwise.get_rdivide_elwise_kernel(self.dtype, out.dtype)
+        dtype_y, other = _get_scalar_arg(other)
+        func = elementwise.get_rdivide_elwise_kernel(self.dtype, out.dtype,
+                dtype_y)
+        func.prepared_async_call(self._grid, self._block, stream,
+                self, other,
+                out, self.mem_size)
+
+        return out
+
+    def _scalar_op(self, other, operator, out, stream=None):
+        """Compute ``out = self operator other``, where `other` is a
+        (host or device) scalar."""
+
+        dtype_a, other = _get_scalar_arg(other)
+        func = elementwise.get_scalar_op_kernel(self.dtype, out.dtype,
+                operator, dtype_a)
         func.prepared_async_call(self._grid, self._block, stream,
                 self, other,
                 out, self.mem_size)
@@ -400,15 +555,22 @@ class GPUArray(object):
 
     # operators ---------------------------------------------------------------
     def mul_add(self, selffac, other, otherfac, add_timer=None, stream=None):
-        """Return `selffac * self + otherfac*other`.
+        """Return `selffac * self + otherfac*other`. The factors may be
+        host scalars or 0-dimensional :class:`GPUArray` instances.
         """
         result = self._new_like_me(_get_common_dtype(self, other))
-        return self._axpbyz(selffac, other, otherfac, result, add_timer)
+        return self._axpbyz(selffac, other, otherfac, result, add_timer,
+                stream=stream)
 
     def __add__(self, other):
         """Add an array with an array or an array with a scalar."""
 
-        if isinstance(other, GPUArray):
+        if _is_scalar_over(self, other):
+            return other.__radd__(self)
+        elif _is_device_scalar(other):
+            result = self._new_like_me(_get_common_dtype(self, other))
+            return self._axpbz(1, other, result)
+        elif isinstance(other, GPUArray):
             # add another vector
             result = self._new_like_me(_get_common_dtype(self, other))
             return self._axpbyz(1, other, 1, result)
@@ -425,7 +587,12 @@ class GPUArray(object):
     def __sub__(self, other):
         """Substract an array from an array or a scalar from an array."""
 
-        if isinstance(other, GPUArray):
+        if _is_scalar_over(self, other):
+            return other.__rsub__(self)
+        elif _is_device_scalar(other):
+            result = self._new_like_me(_get_common_dtype(self, other))
+            return self._scalar_op(other, "-", result)
+        elif isinstance(other, GPUArray):
             result = self._new_like_me(_get_common_dtype(self, other))
             return self._axpbyz(1, other, -1, result)
         else:
@@ -446,13 +613,17 @@ class GPUArray(object):
         return self._axpbz(-1, other, result)
 
     def __iadd__(self, other):
-        if isinstance(other, GPUArray):
+        if _is_device_scalar(other):
+            return self._axpbz(1, other, self)
+        elif isinstance(other, GPUArray):
             return self._axpbyz(1, other, 1, self)
         else:
             return self._axpbz(1, other, self)
 
     def __isub__(self, other):
-        if isinstance(other, GPUArray):
+        if _is_device_scalar(other):
+            return self._scalar_op(other, "-", self)
+        elif isinstance(other, GPUArray):
             return self._axpbyz(1, other, -1, self)
         else:
             return self._axpbz(1, -other, self)
@@ -462,7 +633,12 @@ class GPUArray(object):
         return self._axpbz(-1, 0, result)
 
     def __mul__(self, other):
-        if isinstance(other, GPUArray):
+        if _is_scalar_over(self, other):
+            return other.__rmul__(self)
+        elif _is_device_scalar(other):
+            result = self._new_like_me(_get_common_dtype(self, other))
+            return self._axpbz(other, 0, result)
+        elif isinstance(other, GPUArray):
             result = self._new_like_me(_get_common_dtype(self, other))
             return self._elwise_multiply(other, result)
         else:
@@ -474,7 +650,9 @@ class GPUArray(object):
         return self._axpbz(scalar, 0, result)
 
     def __imul__(self, other):
-        if isinstance(other, GPUArray):
+        if _is_device_scalar(other):
+            return self._axpbz(other, 0, self)
+        elif isinstance(other, GPUArray):
             return self._elwise_multiply(other, self)
         else:
             return self._axpbz(other, 0, self)
@@ -484,7 +662,12 @@ class GPUArray(object):
 
            x = self / n
         """
-        if isinstance(other, GPUArray):
+        if _is_scalar_over(self, other):
+            return other.__rdiv__(self)
+        elif _is_device_scalar(other):
+            result = self._new_like_me(_get_common_dtype(self, other))
+            return self._scalar_op(other, "/", result)
+        elif isinstance(other, GPUArray):
             result = self._new_like_me(_get_common_dtype(self, other))
             return self._div(other, result)
         else:
@@ -513,7 +696,9 @@ class GPUArray(object):
 
            x /= n
         """
-        if isinstance(other, GPUArray):
+        if _is_device_scalar(other):
+            return self._scalar_op(other, "/", self)
+        elif isinstance(other, GPUArray):
             return self._div(other, self)
         else:
             if other == 1:
@@ -524,8 +709,10 @@ class GPUArray(object):
     __itruediv__ = __idiv__
 
     def fill(self, value, stream=None):
-        """fills the array with the specified value"""
-        func = elementwise.get_fill_kernel(self.dtype)
+        """fills the array with the specified value, which may be a device
+        scalar"""
+        dtype_a, value = _get_scalar_arg(value)
+        func = elementwise.get_fill_kernel(self.dtype, dtype_a)
         func.prepared_async_call(self._grid, self._block, stream,
                 value, self, self.mem_size)
 
@@ -623,7 +810,7 @@ class GPUArray(object):
         with new, the user can choose between ipow or just pow
         """
 
-        if isinstance(other, GPUArray):
+        if isinstance(other, GPUArray) and not _is_device_scalar(other):
             assert self.shape == other.shape
 
             if new:
@@ -644,7 +831,8 @@ class GPUArray(object):
                 result = self._new_like_me()
             else:
                 result = self
-            func = elementwise.get_pow_kernel(self.dtype)
+            dtype_value, other = _get_scalar_arg(other)
+            func = elementwise.get_pow_kernel(self.dtype, dtype_value)
             func.prepared_async_call(self._grid, self._block, None,
                     other, self, result,
                     self.mem_size)
@@ -828,6 +1016,15 @@ class GPUArray(object):
         """
         .. versionadded:: 2013.1
         """
+        if isinstance(index, GPUArray):
+            if not (index.dtype in [np.bool_, np.uint8]
+                    or index._is_comparison):
+                raise IndexError("only boolean, uint8 or comparison result "
+                        "arrays may be used as GPUArray indices")
+            return _mask_select(self, index)
+        elif isinstance(index, np.ndarray) and index.dtype == np.bool_:
+            return _mask_select(self, index)
+
         if not isinstance(index, tuple):
             index = (index,)
 
@@ -1120,6 +1317,8 @@ def arange(*args, **kwargs):
     else:
         raise ValueError("too many arguments")
 
+    stream = kwargs.pop("stream", None)
+
     admissible_names = ["start", "stop", "step", "dtype"]
     for k, v in six.iteritems(kwargs):
         if k in admissible_names:
@@ -1156,7 +1355,7 @@ def arange(*args, **kwargs):
     result = GPUArray((size,), dtype)
 
     func = elementwise.get_arange_kernel(dtype)
-    func.prepared_async_call(result._grid, result._block, kwargs.get("stream"),
+    func.prepared_async_call(result._grid, result._block, stream,
             result, start, step, size)
 
     return result
@@ -1211,6 +1410,17 @@ def _compact_positive_strides(a):
     return a, strides, slicer
 
 
+def _get_staging_pool_for(host_ary):
+    # Large pageable host arrays are routed through the context's pinned
+    # staging buffers, see :class:`pycuda.tools.PinnedStagingPool`.
+    from pycuda.tools import get_staging_pool
+    staging_pool = get_staging_pool()
+    if staging_pool.should_stage(host_ary):
+        return staging_pool
+    else:
+        return None
+
+
 def _memcpy_discontig(dst, src, async=False, stream=None):
     """Copy the contents of src into dst.
 
@@ -1219,6 +1429,37 @@ def _memcpy_discontig(dst, src, async=False, stream=None):
     axes along which either `src` or `dst` is not contiguous.
     """
 
+    if not async and drv.uses_per_thread_default_stream():
+        # Synchronous copies go through the legacy default stream, which
+        # waits for the work of all threads. Copy on this thread's default
+        # stream instead and wait for that alone.
+        stream = drv.get_default_stream()
+        _memcpy_discontig(dst, src, async=True, stream=stream)
+        stream.synchronize()
+        return
+
+    if not async:
+        stream = None
+
+    after_copy = (drv._run_copy_hooks(dst, src, stream)
+            if drv._copy_hooks else ())
+
+    try:
+        if not _dependency_tracking:
+            _memcpy_discontig_untracked(dst, src, async, stream)
+        else:
+            arrays = [ary for ary in (dst, src) if isinstance(ary, GPUArray)]
+            wait_for_access(arrays, stream)
+            _memcpy_discontig_untracked(dst, src, async, stream)
+            record_access(arrays, stream)
+    finally:
+        # also on failure, so that hooks can clean up
+        for after in after_copy:
+            after()
+
+
+def _memcpy_discontig_untracked(dst, src, async=False, stream=None):
+
     if not isinstance(src, (GPUArray, np.ndarray)):
         raise TypeError("src must be GPUArray or ndarray")
     if not isinstance(dst, (GPUArray, np.ndarray)):
@@ -1284,13 +1525,22 @@ def _memcpy_discontig(dst, src, async=False, stream=None):
                 # so that the order is neither Fortran or C.
                 # So, we attempt to get a contiguous view of dst.
                 dst = _as_strided(dst, shape=(dst.size,), strides=(dst.dtype.itemsize,))
-                if async:
+                # The staging pool returns only once dst holds the data,
+                # so it is not used for asynchronous copies.
+                staging_pool = None if async else _get_staging_pool_for(dst)
+                if staging_pool is not None:
+                    staging_pool.dtoh(dst, src.gpudata)
+                elif async:
                     drv.memcpy_dtoh_async(dst, src.gpudata, stream=stream)
                 else:
                     drv.memcpy_dtoh(dst, src.gpudata)
         else:
             src = _as_strided(src, shape=(src.size,), strides=(src.dtype.itemsize,))
-            if async:
+            staging_pool = _get_staging_pool_for(src)
+            if staging_pool is not None:
+                staging_pool.htod(dst.gpudata, src,
+                        stream=stream if async else None)
+            elif async:
                 drv.memcpy_htod_async(dst.gpudata, src, stream=stream)
             else:
                 drv.memcpy_htod(dst.gpudata, src)
@@ -1351,6 +1601,665 @@ six.moves.copyreg.pickle(GPUArray,
 # }}}
 
 
+# {{{ dependency tracking
+
+_dependency_tracking = False
+
+
+class _AccessRecord(object):
+    """The event recorded after the most recent operation on some memory,
+    if that was issued on a stream other than the legacy default stream,
+    along with that stream.
+    """
+
+    def __init__(self):
+        self.event = None
+        self.stream = None
+
+
+def _get_access_record(ary):
+    # views share the record of the array owning the memory
+    while isinstance(ary.base, GPUArray):
+        ary = ary.base
+
+    try:
+        return ary._access_record
+    except AttributeError:
+        record = ary._access_record = _AccessRecord()
+        return record
+
+
+def wait_for_access(arrays, stream=None):
+    """Make *stream* wait for the most recent operations on the
+    :class:`GPUArray` instances in *arrays* that were issued on other
+    streams. Does nothing unless dependency tracking is enabled, see
+    :func:`set_dependency_tracking`.
+    """
+    if not _dependency_tracking:
+        return
+
+    if stream is not None:
+        waiting_stream = stream
+    elif drv.uses_per_thread_default_stream():
+        # Default streams of different threads are told apart by nothing
+        # but the thread, so always wait.
+        waiting_stream = drv.get_default_stream()
+    else:
+        # The legacy default stream synchronizes with all other blocking
+        # streams anyway.
+        return
+
+    for ary in arrays:
+        record = _get_access_record(ary)
+        if record.event is not None and (
+                stream is None or record.stream is not stream):
+            waiting_stream.wait_for_event(record.event)
+
+
+def record_access(arrays, stream=None):
+    """Note that the work enqueued on *stream* so far uses the
+    :class:`GPUArray` instances in *arrays*, so that later work on other
+    streams waits for it. Does nothing unless dependency tracking is
+    enabled.
+    """
+    if not _dependency_tracking:
+        return
+
+    if stream is None and not drv.uses_per_thread_default_stream():
+        event = None
+    else:
+        event = drv.Event(drv.event_flags.DISABLE_TIMING).record(stream)
+
+    for ary in arrays:
+        record = _get_access_record(ary)
+        record.event = event
+        record.stream = stream
+
+
+def _track_launch(func, grid, block, stream, args, arg_buf, shared_size):
+    arrays = [arg for arg in args if isinstance(arg, GPUArray)]
+    if not arrays:
+        return None
+
+    wait_for_access(arrays, stream)
+    return lambda: record_access(arrays, stream)
+
+
+def set_dependency_tracking(enabled=True):
+    """Enable or disable tracking of the streams on which arrays are used.
+
+    While enabled, each kernel launched with :class:`GPUArray` arguments
+    (as well as each copy and each reduction or scan) first makes its
+    stream wait for the most recent operations on those arrays issued on
+    other streams, and then records an event for them on its own stream.
+    Independent work can then be spread across streams without explicit
+    synchronization.
+
+    Since it is not known which arguments a kernel writes to, all of them
+    are treated as written to. Kernels that read the same array on
+    different streams are therefore serialized.
+    """
+    global _dependency_tracking
+
+    if enabled and not _dependency_tracking:
+        drv.add_launch_hook(_track_launch)
+    elif not enabled and _dependency_tracking:
+        drv.remove_launch_hook(_track_launch)
+
+    _dependency_tracking = enabled
+
+
+def is_dependency_tracking():
+    return _dependency_tracking
+
+# }}}
+
+
+# {{{ futures
+
+try:
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+except ImportError:
+    class FutureTimeoutError(Exception):
+        pass
+
+
+class ArrayFuture(object):
+    """The host copy of a :class:`GPUArray`, which becomes available once
+    the work enqueued on a stream up to the creation of the future is
+    complete. Use :meth:`GPUArray.get_future` to obtain one.
+    """
+
+    def __init__(self, ary, stream=None, host_allocator=None):
+        if host_allocator is None:
+            from pycuda.tools import get_staging_pool
+            host_pool = get_staging_pool().host_pool
+
+            def host_allocator(shape, dtype):
+                size = int(np.prod(shape))
+                if not size:
+                    return np.empty(shape, dtype)
+                return host_pool.allocate((size,), dtype).reshape(shape)
+
+        self._host = host_allocator(ary.shape, ary.dtype)
+        if ary.size:
+            ary.get(ary=self._host, async=True, stream=stream)
+
+        from pycuda.tools import get_event_pool
+        self._event_pool = get_event_pool()
+        self._event = self._event_pool.get()
+        self._event.record(stream)
+        self._context = drv.Context.get_current()
+        # The event goes back to the pool once the result is available,
+        # unless it has been handed out through the event property.
+        self._event_shared = False
+
+        # keep the device array alive until the copy has completed
+        self._ary = ary
+
+        self._done = False
+        self._callbacks = []
+        self._watched = False
+
+        import threading
+        self._lock = threading.Lock()
+
+    def _mark_done(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            self._ary = None
+            callbacks = self._callbacks
+            self._callbacks = None
+
+            # a watched event is returned once the notifier is done with it
+            if not (self._event_shared or self._watched):
+                self._event_pool.put(self._event)
+                self._event = None
+
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        """Return *True* if the result is available. Does not block."""
+        if not self._done:
+            # another thread may mark the future done meanwhile
+            event = self._event
+            if event is None or event.query():
+                self._mark_done()
+        return self._done
+
+    def wait(self, timeout=None):
+        """Block until the result is available, or for at most *timeout*
+        seconds. Return whether the result is available.
+        """
+        event = self._event
+        if self._done or event is None:
+            return True
+
+        if timeout is None:
+            event.synchronize()
+        else:
+            from time import time, sleep
+            deadline = time() + timeout
+            delay = 1e-5
+            while not (self._done or event.query()):
+                remaining = deadline - time()
+                if remaining <= 0:
+                    return False
+                sleep(_builtin_min(delay, remaining))
+                delay = _builtin_min(2*delay, 1e-3)
+
+        self._mark_done()
+        return True
+
+    def result(self, timeout=None):
+        """Return the host copy as a :class:`numpy.ndarray` (of the same
+        shape as the device array, so zero-dimensional for the results of
+        reductions), waiting for at most *timeout* seconds if given.
+        Raises :exc:`FutureTimeoutError` if the result does not become
+        available in time.
+        """
+        if not self.wait(timeout):
+            raise FutureTimeoutError()
+        return self._host
+
+    def add_done_callback(self, fn):
+        """Arrange for ``fn(future)`` to be called once the result is
+        available. If it already is, *fn* is called right away. Otherwise,
+        it is called from the helper thread of
+        :func:`pycuda.tools.get_event_notifier` as soon as the copy
+        completes, or by :meth:`done`, :meth:`wait` or :meth:`result` if
+        one of them finds the result to be available first.
+        """
+        with self._lock:
+            if self._done:
+                event = None
+            else:
+                self._callbacks.append(fn)
+                if self._watched:
+                    return
+                self._watched = True
+                event = self._event
+
+        if event is None:
+            fn(self)
+        else:
+            from pycuda.tools import get_event_notifier
+            get_event_notifier().add_callback(
+                    event, self._on_event_complete, self._context)
+
+    def _on_event_complete(self, exc):
+        # called by the event notifier. If querying the event failed,
+        # wait() and result() report the error.
+        if exc is None:
+            self._mark_done()
+
+        with self._lock:
+            self._watched = False
+            if (self._done and not self._event_shared
+                    and self._event is not None):
+                self._event_pool.put(self._event)
+                self._event = None
+
+    @property
+    def event(self):
+        """The :class:`pycuda.driver.Event` recorded after the copy."""
+        with self._lock:
+            if self._event is None:
+                # already returned to the pool; an event that was never
+                # recorded counts as complete
+                self._event = drv.Event(drv.event_flags.DISABLE_TIMING)
+            self._event_shared = True
+            return self._event
+
+
+def wait_futures(futures, timeout=None):
+    """Wait for all of *futures* (see :class:`ArrayFuture`) to complete,
+    for at most *timeout* seconds overall. Return the list of those still
+    pending.
+    """
+    if timeout is None:
+        for future in futures:
+            future.wait()
+        return []
+
+    from time import time
+    deadline = time() + timeout
+    pending = []
+    for future in futures:
+        if not future.wait(_builtin_max(deadline - time(), 0)):
+            pending.append(future)
+    return pending
+
+# }}}
+
+
+# {{{ IPC sharing
+
+class _IPCExport(object):
+    """The :class:`IPCArrayHandle` instances created in this process for
+    one allocation.
+    """
+
+    def __init__(self):
+        self.handles = weakref.WeakSet()
+
+    def get_array(self):
+        for handle in list(self.handles):
+            ary = handle._array
+            if ary is not None:
+                return ary
+
+        return None
+
+
+# maps IPC handles to the exports of this process, so that handles that
+# are unpickled by their exporter do not need to be opened
+_ipc_exports = weakref.WeakValueDictionary()
+
+
+class _IPCMapping(object):
+    def __init__(self, ipc_handle):
+        self.handle = drv.IPCMemoryHandle(ipc_handle)
+
+    def __int__(self):
+        return int(self.handle)
+
+
+@context_dependent_memoize
+def _get_ipc_mappings():
+    return weakref.WeakValueDictionary()
+
+
+class IPCArrayHandle(object):
+    """A picklable reference to the memory of a :class:`GPUArray` that can
+    be opened as a :class:`GPUArray` sharing that memory in another process
+    on the same machine, using CUDA's interprocess communication facilities.
+
+    Pickling and unpickling the handle transfers only its metadata, so
+    arrays can be passed between :mod:`multiprocessing` workers without
+    copying their contents.
+
+    The handle keeps *ary* alive in the exporting process until it is
+    garbage collected or :meth:`close` is called. The exporter must
+    therefore hold on to it for as long as other processes may use the
+    memory.
+
+    An interprocess event is recorded on *stream* at creation time, and
+    :meth:`open` waits for it, so that the importer sees all work on *ary*
+    enqueued before the handle was created.
+    """
+
+    def __init__(self, ary, stream=None):
+        if not ary.size:
+            raise ValueError("cannot export empty arrays")
+
+        import os
+
+        base_ptr, _ = drv.mem_get_address_range(ary.ptr)
+
+        self.ipc_handle = drv.mem_get_ipc_handle(base_ptr)
+        self.offset = ary.ptr - base_ptr
+        self.shape = ary.shape
+        self.strides = ary.strides
+        self.dtype = ary.dtype
+        self.pid = os.getpid()
+
+        self._event = drv.Event(
+                drv.event_flags.DISABLE_TIMING | drv.event_flags.INTERPROCESS)
+        self._event.record(stream)
+        self.event_handle = self._event.ipc_handle()
+
+        self._array = ary
+
+        # Several arrays may be exported from one allocation. Each handle
+        # keeps the shared export alive, so unpickled handles can be opened
+        # while any of them still holds its array.
+        key = bytes(self.ipc_handle)
+        export = _ipc_exports.get(key)
+        if export is None:
+            export = _ipc_exports[key] = _IPCExport()
+        export.handles.add(self)
+        self._export = export
+
+    def __getstate__(self):
+        return dict(
+                (key, value) for key, value in six.iteritems(self.__dict__)
+                if not key.startswith("_"))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._array = None
+        self._event = None
+        self._export = None
+
+    def close(self):
+        """Release the exporting process's reference to the array."""
+        self._array = None
+        self._event = None
+
+    def open(self, stream=None):
+        """Return a :class:`GPUArray` that shares memory with the exported
+        array. The memory is mapped into the current context on first use
+        and unmapped once all arrays obtained from the same allocation have
+        been garbage collected.
+
+        If *stream* is *None*, wait until all work enqueued on the
+        exported array before creating the handle has completed.
+        Otherwise, order subsequent work on *stream* after it.
+        """
+        import os
+
+        key = bytes(self.ipc_handle)
+
+        if self.pid == os.getpid():
+            export = _ipc_exports.get(key)
+            local = export.get_array() if export is not None else None
+            if local is None:
+                raise RuntimeError("exported array no longer exists")
+
+            base = local
+            base_ptr, _ = drv.mem_get_address_range(local.ptr)
+        else:
+            mappings = _get_ipc_mappings()
+            base = mappings.get(key)
+            if base is None:
+                base = _IPCMapping(bytearray(self.ipc_handle))
+                mappings[key] = base
+            base_ptr = int(base)
+
+            evt = drv.Event.from_ipc_handle(bytearray(self.event_handle))
+            if stream is None:
+                evt.synchronize()
+            else:
+                stream.wait_for_event(evt)
+
+        return GPUArray(self.shape, self.dtype, base=base,
+                gpudata=base_ptr + self.offset, strides=self.strides)
+
+# }}}
+
+
+# {{{ interoperability
+
+@context_dependent_memoize
+def _get_device_ordinal():
+    dev = drv.Context.get_device()
+    for i in range(drv.Device.count()):
+        if drv.Device(i) == dev:
+            return i
+
+    raise RuntimeError("could not determine ordinal of current device")
+
+
+def _sync_with_foreign_stream(stream):
+    # Work on the legacy (1) and per-thread (2) default streams is ordered
+    # with PyCUDA's default stream. For other streams, we cannot wait on the
+    # handle directly, so wait for everything.
+    if stream is not None and stream not in (1, 2):
+        drv.Context.synchronize()
+
+
+def from_cuda_array_interface(obj):
+    """Return a :class:`GPUArray` sharing memory with *obj*, which must
+    implement the CUDA Array Interface (``__cuda_array_interface__``).
+
+    The result keeps *obj* alive. If *obj* declares a producer stream other
+    than a default stream, the current context is synchronized first.
+    """
+    iface = obj.__cuda_array_interface__
+
+    if iface.get("mask") is not None:
+        raise NotImplementedError("masked arrays are not supported")
+
+    ptr, _ = iface["data"]
+    dtype = np.dtype(iface["typestr"])
+    if "descr" in iface and dtype.kind == "V":
+        dtype = np.dtype(iface["descr"])
+
+    _sync_with_foreign_stream(iface.get("stream"))
+
+    return GPUArray(iface["shape"], dtype, gpudata=ptr,
+            strides=iface.get("strides"), base=obj)
+
+
+def from_dlpack(obj):
+    """Return a :class:`GPUArray` sharing memory with *obj*, which is either
+    a DLPack capsule or an object implementing ``__dlpack__``. The memory
+    is released to its producer once the result is garbage collected.
+    """
+    from pycuda._dlpack import (
+            from_dlpack as consume_capsule, DL_CUDA, DL_CUDA_MANAGED)
+
+    if hasattr(obj, "__dlpack__"):
+        try:
+            capsule = obj.__dlpack__(stream=1)
+        except TypeError:
+            capsule = obj.__dlpack__()
+    else:
+        capsule = obj
+
+    ptr, shape, strides, dtype, device_type, device_id, owner = \
+            consume_capsule(capsule)
+
+    if device_type not in (DL_CUDA, DL_CUDA_MANAGED):
+        raise ValueError("DLPack tensor does not reside in CUDA memory")
+    if device_type == DL_CUDA and device_id != _get_device_ordinal():
+        raise ValueError("DLPack tensor resides on device %d, but the "
+                "current context is on device %d"
+                % (device_id, _get_device_ordinal()))
+
+    return GPUArray(shape, dtype, gpudata=ptr, strides=strides, base=owner)
+
+# }}}
+
+
+# {{{ file i/o
+
+def _open_for(fid, mode):
+    if isinstance(fid, six.string_types):
+        return open(fid, mode), True
+    else:
+        return fid, False
+
+
+def _readinto_exactly(f, buf):
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(buf):
+        count = f.readinto(view[pos:])
+        if not count:
+            raise IOError("unexpected end of file")
+        pos += count
+
+
+def _read_raw(f, result):
+    if not result.nbytes:
+        return
+
+    from pycuda.tools import get_staging_pool
+    get_staging_pool().htod_from_reader(result.gpudata, result.nbytes,
+            lambda offset, buf: _readinto_exactly(f, buf))
+
+
+def _write_raw(fid, a, order):
+    if not (a.flags.c_contiguous or (order == "F" and a.flags.f_contiguous)):
+        a = a.copy(order=order)
+
+    f, own = _open_for(fid, "wb")
+    try:
+        if a.nbytes:
+            from pycuda.tools import get_staging_pool
+            get_staging_pool().dtoh_to_writer(
+                    lambda offset, buf: f.write(buf), a.gpudata, a.nbytes)
+    finally:
+        if own:
+            f.close()
+
+
+def save(fid, a):
+    """Write the :class:`GPUArray` *a* to *fid* in NumPy's ``.npy`` format.
+
+    *fid* is a file name (to which ``.npy`` is appended if missing) or a
+    binary file object. The data is downloaded in chunks through the
+    page-locked buffers of :func:`pycuda.tools.get_staging_pool`, so no
+    full host copy of *a* is made, and writing one chunk to disk overlaps
+    with the download of the next.
+    """
+    from numpy.lib import format
+
+    if isinstance(fid, six.string_types) and not fid.endswith(".npy"):
+        fid = fid + ".npy"
+
+    fortran_order = a.flags.f_contiguous and not a.flags.c_contiguous
+
+    f, own = _open_for(fid, "wb")
+    try:
+        format.write_array_header_1_0(f, {
+            "descr": format.dtype_to_descr(a.dtype),
+            "fortran_order": fortran_order,
+            "shape": a.shape,
+            })
+        _write_raw(f, a, order="F" if fortran_order else "C")
+    finally:
+        if own:
+            f.close()
+
+
+def load(fid, allocator=drv.mem_alloc):
+    """Read a :class:`GPUArray` from *fid*, a file name or binary file
+    object in NumPy's ``.npy`` format, as written by :func:`save` or
+    :func:`numpy.save`.
+
+    The data is uploaded in chunks through page-locked staging buffers,
+    so no full host copy is made, and reading one chunk from disk overlaps
+    with the upload of the previous one.
+    """
+    from numpy.lib import format
+
+    f, own = _open_for(fid, "rb")
+    try:
+        version = format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = format.read_array_header_1_0(f)
+        elif version == (2, 0):
+            shape, fortran_order, dtype = format.read_array_header_2_0(f)
+        else:
+            raise ValueError("unsupported .npy format version %d.%d"
+                    % version)
+
+        if dtype.hasobject:
+            raise ValueError("cannot load arrays containing Python objects")
+
+        result = GPUArray(shape, dtype, allocator=allocator,
+                order="F" if fortran_order else "C")
+        _read_raw(f, result)
+    finally:
+        if own:
+            f.close()
+
+    return result
+
+
+def fromfile(fid, dtype, shape=None, offset=0, allocator=drv.mem_alloc):
+    """Read raw binary data of type *dtype* in C order from *fid*, a file
+    name or binary file object, into a new :class:`GPUArray`, starting
+    *offset* bytes into the file.
+
+    If *shape* is *None*, the array is one-dimensional and extends to the
+    end of the file. Like :func:`load`, the data is streamed through
+    page-locked staging buffers.
+    """
+    dtype = np.dtype(dtype)
+
+    f, own = _open_for(fid, "rb")
+    try:
+        f.seek(offset)
+
+        if shape is None:
+            import os
+            f.seek(0, os.SEEK_END)
+            nbytes = f.tell() - offset
+            f.seek(offset)
+
+            if nbytes % dtype.itemsize:
+                raise ValueError("file size is not a multiple of the "
+                        "item size")
+            shape = (nbytes // dtype.itemsize,)
+
+        result = GPUArray(shape, dtype, allocator=allocator)
+        _read_raw(f, result)
+    finally:
+        if own:
+            f.close()
+
+    return result
+
+# }}}
+
+
 # {{{ take/put
 
 def take(a, indices, out=None, stream=None):
@@ -1553,6 +2462,63 @@ def reshape(a, shape):
 # }}}
 
 
+# {{{ multi-array elementwise operations
+
+def multi_mul_add(selffac, xs, otherfac, ys, out=None, stream=None):
+    """Return the list of ``selffac*x + otherfac*y`` for the corresponding
+    arrays *x* and *y* in *xs* and *ys*, computed in one launch for each
+    combination of dtypes occurring. The factors may be device scalars.
+    If *out* is given, it is a list of arrays receiving the results.
+    """
+    xs = list(xs)
+    ys = list(ys)
+    if len(xs) != len(ys):
+        raise ValueError("xs and ys must have the same length")
+    for x, y in zip(xs, ys):
+        if x.shape != y.shape:
+            raise ValueError("shapes do not match")
+
+    if out is None:
+        out = [x._new_like_me(_get_common_dtype(x, y))
+                for x, y in zip(xs, ys)]
+    else:
+        out = list(out)
+        if len(out) != len(xs):
+            raise ValueError("out must have as many entries as xs")
+
+    dtype_a, selffac = _get_scalar_arg(selffac)
+    dtype_b, otherfac = _get_scalar_arg(otherfac)
+
+    batches = {}
+    for x, y, z in zip(xs, ys, out):
+        batches.setdefault((x.dtype, y.dtype, z.dtype), []).append((x, y, z))
+
+    for (dtype_x, dtype_y, dtype_z), batch in six.iteritems(batches):
+        func = elementwise.get_multi_axpbyz_kernel(
+                dtype_x, dtype_y, dtype_z, dtype_a, dtype_b)
+        batch_xs, batch_ys, batch_zs = zip(*batch)
+        func(selffac, batch_xs, otherfac, batch_ys, batch_zs, stream=stream)
+
+    return out
+
+
+def multi_fill(arrays, value, stream=None):
+    """Fill each of *arrays* with *value*, which may be a device scalar,
+    in one launch for each dtype occurring.
+    """
+    dtype_a, value = _get_scalar_arg(value)
+
+    batches = {}
+    for ary in arrays:
+        batches.setdefault(ary.dtype, []).append(ary)
+
+    for dtype, batch in six.iteritems(batches):
+        func = elementwise.get_multi_fill_kernel(dtype, dtype_a)
+        func(value, batch, stream=stream)
+
+# }}}
+
+
 # {{{ conditionals
 
 def if_positive(criterion, then_, else_, out=None, stream=None):
@@ -1612,10 +2578,27 @@ maximum = _make_binary_minmax_func("max")
 
 # {{{ reductions
 
-def sum(a, dtype=None, stream=None, allocator=None):
+def sum(a, dtype=None, stream=None, allocator=None, out=None):
     from pycuda.reduction import get_sum_kernel
     krnl = get_sum_kernel(dtype, a.dtype)
-    return krnl(a, stream=stream, allocator=allocator)
+    return krnl(a, stream=stream, allocator=allocator, out=out)
+
+
+def multi_sum(arrays, dtype=None, stream=None, allocator=None, out=None):
+    """Return a vector of the sums of each of *arrays*, which must all have
+    the same type, computed in a single launch.
+    """
+    from pytools import single_valued
+    from pycuda.reduction import get_batched_sum_kernel
+
+    arrays = list(arrays)
+    if not arrays:
+        if dtype is None:
+            raise ValueError("need dtype to sum an empty list of arrays")
+        return empty((0,), dtype, allocator=allocator or drv.mem_alloc)
+
+    krnl = get_batched_sum_kernel(dtype, single_valued(a.dtype for a in arrays))
+    return krnl(arrays, stream=stream, allocator=allocator, out=out)
 
 
 def subset_sum(subset, a, dtype=None, stream=None, allocator=None):
@@ -1624,12 +2607,12 @@ def subset_sum(subset, a, dtype=None, stream=None, allocator=None):
     return krnl(subset, a, stream=stream)
 
 
-def dot(a, b, dtype=None, stream=None, allocator=None):
+def dot(a, b, dtype=None, stream=None, allocator=None, out=None):
     from pycuda.reduction import get_dot_kernel
     if dtype is None:
         dtype = _get_common_dtype(a, b)
     krnl = get_dot_kernel(dtype, a.dtype, b.dtype)
-    return krnl(a, b, stream=stream, allocator=allocator)
+    return krnl(a, b, stream=stream, allocator=allocator, out=out)
 
 
 def subset_dot(subset, a, b, dtype=None, stream=None, allocator=None):
@@ -1663,6 +2646,308 @@ def _make_subset_minmax_kernel(what):
 subset_min = _make_subset_minmax_kernel("min")
 subset_max = _make_subset_minmax_kernel("max")
 
+
+def _make_arg_minmax_kernel(what):
+    def f(a, stream=None, allocator=None):
+        from pycuda.reduction import (
+                get_arg_minmax_kernel, get_arg_minmax_index_kernel)
+
+        if not a.size:
+            raise ValueError("attempt to get arg%s of an empty array" % what)
+
+        # indices refer to the flattened array in C order
+        if not a.flags.c_contiguous:
+            a = a.copy(order="C")
+
+        allocator = allocator or a.allocator
+        pair = get_arg_minmax_kernel(what, a.dtype)(
+                a, stream=stream, allocator=allocator)
+
+        result = empty((), np.int64, allocator=allocator)
+        func = get_arg_minmax_index_kernel(a.dtype)
+        func.prepared_async_call(result._grid, result._block, stream,
+                result, pair, result.mem_size)
+        return result
+
+    return f
+
+argmin = _make_arg_minmax_kernel("min")
+argmax = _make_arg_minmax_kernel("max")
+
+
+def moments(a, dtype=None, ddof=0, stream=None, allocator=None):
+    """Return zero-dimensional arrays holding the mean and the variance of
+    the entries of *a*, computed in a single pass over the data.
+    """
+    from pycuda.reduction import get_moments_kernel, get_moments_finish_kernel
+
+    if a.dtype.kind not in "iuf":
+        raise TypeError("unsupported dtype specified")
+
+    if dtype is None:
+        if a.dtype.kind == "f" and a.dtype.itemsize >= 4:
+            dtype = a.dtype
+        else:
+            dtype = np.float64
+    dtype = np.dtype(dtype)
+
+    if not a.flags.forc:
+        a = a.copy()
+
+    allocator = allocator or a.allocator
+    state = get_moments_kernel(dtype, a.dtype)(
+            a, stream=stream, allocator=allocator)
+
+    mean = empty((), dtype, allocator=allocator)
+    var = empty((), dtype, allocator=allocator)
+    func = get_moments_finish_kernel(dtype)
+    func.prepared_async_call(mean._grid, mean._block, stream,
+            mean, var, state, ddof, mean.mem_size)
+    return mean, var
+
+# }}}
+
+
+# {{{ sorting
+
+def _get_sort_keys(a, axis):
+    if axis is None:
+        if not a.flags.c_contiguous:
+            a = a.copy(order="C")
+        a = a.reshape(a.size)
+    elif len(a.shape) != 1:
+        raise NotImplementedError("only one-dimensional arrays can be sorted "
+                "(or pass axis=None to sort the flattened array)")
+    return a
+
+
+def sort(a, axis=-1, allocator=None, stream=None):
+    """Return a sorted copy of the one-dimensional array *a*, or of the
+    flattened array if *axis* is *None*, using
+    :class:`pycuda.algorithm.RadixSort`.
+    """
+    from pycuda.algorithm import get_radix_sort
+    a = _get_sort_keys(a, axis)
+    return get_radix_sort(a.dtype)(a, allocator=allocator, stream=stream)
+
+
+def argsort(a, axis=-1, allocator=None, stream=None):
+    """Return the indices that stably sort the one-dimensional array *a*,
+    or the flattened array if *axis* is *None*, as an array of type
+    :class:`numpy.intp`.
+    """
+    from pycuda.algorithm import get_radix_sort
+    a = _get_sort_keys(a, axis)
+    indices = arange(a.size, dtype=np.intp, stream=stream)
+    _, result = get_radix_sort(a.dtype, np.intp)(a, indices,
+            allocator=allocator, stream=stream)
+    return result
+
+# }}}
+
+
+# {{{ stream compaction
+
+def _c_flat(a):
+    if not a.flags.c_contiguous:
+        a = a.copy(order="C")
+    return a.reshape(a.size)
+
+
+def _mask_select(a, mask):
+    if mask.shape != a.shape:
+        raise IndexError("mask must have the same shape as the "
+                "indexed array")
+    if isinstance(mask, np.ndarray):
+        mask = to_gpu(mask)
+
+    from pycuda.algorithm import copy_if
+    return copy_if(_c_flat(a), "mask[i] != 0",
+            extra_args=[("mask", _c_flat(mask))])
+
+
+def nonzero(a, allocator=None, stream=None):
+    """Return a tuple of :class:`numpy.intp` arrays, one per dimension of
+    *a*, holding the indices of the nonzero elements of *a* in C order,
+    like :func:`numpy.nonzero`.
+    """
+    from pycuda.algorithm import nonzero_indices
+    flat = nonzero_indices(_c_flat(a), allocator=allocator, stream=stream)
+
+    if len(a.shape) <= 1:
+        return (flat,)
+
+    func = elementwise.get_unravel_index_kernel(flat.dtype)
+    result = []
+    for axis, dim in enumerate(a.shape):
+        divisor = int(np.prod(a.shape[axis+1:]))
+        indices = GPUArray(flat.shape, flat.dtype,
+                allocator=allocator or flat.allocator)
+        if flat.size:
+            func.prepared_async_call(indices._grid, indices._block, stream,
+                    indices, flat, divisor, dim, indices.mem_size)
+        result.append(indices)
+
+    return tuple(result)
+
+# }}}
+
+
+# {{{ scans
+
+@context_dependent_memoize
+def _get_cumsum_kernel(dtype):
+    from pycuda.scan import InclusiveScanKernel
+    return InclusiveScanKernel(dtype, "a+b", name_prefix="cumsum")
+
+
+@context_dependent_memoize
+def _get_segmented_cumsum_kernel(dtype):
+    from pycuda.scan import SegmentedScanKernel
+    return SegmentedScanKernel(dtype, "a+b", "0",
+            name_prefix="segmented_cumsum")
+
+
+def cumsum(a, axis=None, allocator=None, stream=None):
+    """Return the cumulative sum of the elements of *a* along *axis*, or
+    of the flattened array if *axis* is *None*. Unlike :func:`numpy.cumsum`,
+    the result has the same dtype as *a*.
+
+    Sums along an axis of an N-dimensional array are computed with one
+    :class:`pycuda.scan.SegmentedScanKernel` invocation for all rows.
+    """
+    allocator = allocator or a.allocator
+
+    if axis is None:
+        flat = _c_flat(a)
+        result = GPUArray(flat.shape, a.dtype, allocator=allocator)
+        if a.size:
+            _get_cumsum_kernel(a.dtype)(flat, result, allocator=allocator,
+                    stream=stream)
+        return result
+    else:
+        result = GPUArray(a.shape, a.dtype, allocator=allocator)
+        return _get_segmented_cumsum_kernel(a.dtype)(a, result, axis=axis,
+                allocator=allocator, stream=stream)
+
+# }}}
+
+
+# {{{ out-of-core streaming
+
+def _split_stream_args(args, out):
+    # Host arrays among *args* are streamed; all of them must have the same
+    # shape so that chunks along the leading axis line up elementwise.
+    array_indices = [i for i, arg in enumerate(args)
+            if isinstance(arg, np.ndarray)]
+    if not array_indices:
+        raise TypeError("at least one argument must be a host array")
+
+    from pytools import single_valued
+    try:
+        single_valued(args[i].shape for i in array_indices)
+    except ValueError:
+        raise ValueError("all host arrays must have the same shape")
+
+    out_indices = [i for i in array_indices
+            if any(args[i] is o for o in out)]
+    in_indices = [i for i in array_indices if i not in out_indices]
+    return in_indices, out_indices
+
+
+def _substitute_chunks(args, indices, chunks):
+    args = list(args)
+    for i, chunk in zip(indices, chunks):
+        args[i] = chunk
+    return args
+
+
+def stream_map(kernel, *args, **kwargs):
+    """Run the :class:`pycuda.elementwise.ElementwiseKernel` *kernel* over
+    host arrays (e.g. :class:`numpy.memmap` instances) that need not fit
+    into device memory.
+
+    *args* are passed to *kernel* in order, with host arrays replaced by
+    device chunks. Host arrays that appear in the keyword argument *out*
+    are treated as outputs: they are downloaded instead of uploaded.
+    The transfers are driven by the keyword argument *pipeline*, a
+    :class:`pycuda.pipeline.ChunkedPipeline`, which defaults to a
+    per-context pipeline.
+    """
+    out = kwargs.pop("out", ())
+    pipeline = kwargs.pop("pipeline", None)
+    if kwargs:
+        raise TypeError("invalid keyword arguments specified: "
+                + ", ".join(six.iterkeys(kwargs)))
+
+    if pipeline is None:
+        pipeline = _get_default_pipeline()
+
+    in_indices, out_indices = _split_stream_args(args, out)
+
+    def step(stream, *chunks):
+        kernel(*_substitute_chunks(args, in_indices + out_indices, chunks),
+                stream=stream)
+
+    pipeline(step,
+            [args[i] for i in in_indices],
+            [args[i] for i in out_indices])
+
+
+def stream_reduce(kernel, *args, **kwargs):
+    """Run the :class:`pycuda.reduction.ReductionKernel` *kernel* over host
+    arrays (e.g. :class:`numpy.memmap` instances) that need not fit into
+    device memory, returning the result as a 0-dimensional
+    :class:`GPUArray`.
+
+    Each chunk is reduced on the device into an array of partial results,
+    which is then reduced with
+    :meth:`pycuda.reduction.ReductionKernel.get_partials_kernel`. The keyword
+    arguments *pipeline* and *allocator* are also accepted.
+    """
+    pipeline = kwargs.pop("pipeline", None)
+    allocator = kwargs.pop("allocator", drv.mem_alloc)
+    if kwargs:
+        raise TypeError("invalid keyword arguments specified: "
+                + ", ".join(six.iterkeys(kwargs)))
+
+    if pipeline is None:
+        pipeline = _get_default_pipeline()
+
+    in_indices, _ = _split_stream_args(args, ())
+    inputs = [args[i] for i in in_indices]
+
+    n = inputs[0].shape[0]
+    if not n:
+        raise ValueError("cannot stream-reduce empty arrays")
+
+    chunk_len = pipeline.get_chunk_length(inputs)
+    partials = GPUArray(((n + chunk_len - 1) // chunk_len,), kernel.dtype_out,
+            allocator=allocator)
+    itemsize = partials.dtype.itemsize
+
+    chunk_counter = [0]
+
+    def step(stream, *chunks):
+        result = kernel(*_substitute_chunks(args, in_indices, chunks),
+                stream=stream, allocator=allocator)
+        k = chunk_counter[0]
+        chunk_counter[0] += 1
+
+        drv.memcpy_dtod_async(partials.ptr + k*itemsize, result.gpudata,
+                itemsize, stream=stream)
+        return result
+
+    pipeline(step, inputs)
+
+    return kernel.get_partials_kernel()(partials, allocator=allocator)
+
+
+@context_dependent_memoize
+def _get_default_pipeline():
+    from pycuda.pipeline import ChunkedPipeline
+    return ChunkedPipeline()
+
 # }}}
 
 # vim: foldmethod=marker
@@ -0,0 +1,527 @@
+"""Recording of kernel launches and copies for profiling."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+import json
+import threading
+from collections import deque
+from time import time
+
+import numpy as np
+
+import pycuda.driver as drv
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+# {{{ records
+
+class OperationRecord(object):
+    """A kernel launch or copy observed while instrumentation was enabled.
+
+    .. attribute:: kind
+
+        ``"kernel"`` or ``"copy"``.
+
+    .. attribute:: name
+
+        The name of the kernel, or one of ``"memcpy_htod"``,
+        ``"memcpy_dtoh"`` and ``"memcpy_dtod"``, for synchronous and
+        asynchronous copies alike.
+
+    .. attribute:: grid
+    .. attribute:: block
+    .. attribute:: shared_size
+
+        The launch configuration, *None* for copies.
+
+    .. attribute:: nbytes
+
+        For copies, the number of bytes copied. For kernels, the total size
+        of the :class:`pycuda.gpuarray.GPUArray` arguments.
+
+    .. attribute:: stream
+
+        The handle of the stream used, 0 for the default stream.
+
+    .. attribute:: host_time
+
+        The time (as returned by :func:`time.time`) at which the operation
+        was issued.
+
+    .. attribute:: thread_id
+
+    .. attribute:: device_start
+    .. attribute:: device_time
+
+        The time (in seconds, on the same scale as :attr:`host_time`) at
+        which the device started the operation, and its duration in
+        seconds, measured with events. *None* while the operation has not
+        completed or if timing was disabled.
+    """
+
+    def __init__(self, kind, name, grid, block, shared_size, nbytes, stream):
+        self.kind = kind
+        self.name = name
+        self.grid = grid
+        self.block = block
+        self.shared_size = shared_size
+        self.nbytes = nbytes
+        self.stream = 0 if stream is None else stream.handle
+        self.host_time = time()
+        self.thread_id = threading.current_thread().ident
+
+        self.device_start = None
+        self.device_time = None
+
+        self._timing = None
+
+    def _resolve(self, wait):
+        # returns whether device timing is (now) available or will never be.
+        # The caller must hold _resolve_lock, so that the events are
+        # returned to their pool only once.
+        if self._timing is None:
+            return True
+
+        context, event_pool, reference, start, end = self._timing
+
+        pushed = False
+        if drv.Context.get_current() != context:
+            context.push()
+            pushed = True
+
+        try:
+            if wait:
+                end.synchronize()
+            elif not end.query():
+                return False
+
+            ref_event, ref_host_time = reference
+            self.device_start = (
+                    ref_host_time + start.time_since(ref_event)*1e-3)
+            self.device_time = end.time_since(start)*1e-3
+
+            event_pool.put(start)
+            event_pool.put(end)
+        finally:
+            if pushed:
+                drv.Context.pop()
+
+        self._timing = None
+        return True
+
+# }}}
+
+
+# {{{ collection
+
+_records = None
+_time_operations = True
+_lock = threading.Lock()
+_resolve_lock = threading.Lock()
+
+# records kept after disable()
+_kept_records = []
+
+# maps contexts to an event recorded when instrumentation started
+# in them and the host time at that point
+_references = {}
+
+# the original driver copy functions while they are wrapped
+_wrapped_copies = {}
+
+# copy_depth: the number of GPUArray copies in progress in the thread
+_state = threading.local()
+
+
+def _get_timing(stream):
+    from pycuda.tools import get_event_pool
+
+    context = drv.Context.get_current()
+    event_pool = get_event_pool(0)
+
+    reference = _references.get(context)
+    if reference is None:
+        with _lock:
+            reference = _references.get(context)
+            if reference is None:
+                ref_event = drv.Event()
+                ref_event.record()
+                ref_event.synchronize()
+                reference = _references[context] = ref_event, time()
+
+    start = event_pool.get()
+    start.record(stream)
+    return context, event_pool, reference, start
+
+
+def _release_evicted(record):
+    # Return the events of a record dropped from the buffer to their pool if
+    # the operation has completed. This runs on every launch once the buffer
+    # is full, so it neither waits for the device nor for a thread in
+    # get_records(). Events not returned here are destroyed with the record.
+    if not _resolve_lock.acquire(False):
+        return
+
+    try:
+        record._resolve(wait=False)
+    finally:
+        _resolve_lock.release()
+
+
+def _add_record(record, stream):
+    records = _records
+    if records is None:
+        return None
+
+    if _time_operations:
+        context, event_pool, reference, start = _get_timing(stream)
+    else:
+        start = None
+
+    if len(records) == records.maxlen:
+        try:
+            evicted = records.popleft()
+        except IndexError:
+            # another thread evicted it
+            pass
+        else:
+            _release_evicted(evicted)
+
+    records.append(record)
+
+    if start is None:
+        return None
+
+    def after():
+        end = event_pool.get()
+        end.record(stream)
+        record._timing = context, event_pool, reference, start, end
+
+    return after
+
+
+def _instrument_launch(func, grid, block, stream, args, arg_buf, shared_size):
+    nbytes = 0
+    for arg in args:
+        if hasattr(arg, "gpudata"):
+            nbytes += arg.nbytes
+
+    return _add_record(
+            OperationRecord("kernel", func.name, tuple(grid), tuple(block),
+                shared_size, nbytes, stream),
+            stream)
+
+
+def _instrument_copy(dst, src, stream):
+    if hasattr(src, "gpudata"):
+        name = "memcpy_dtod" if hasattr(dst, "gpudata") else "memcpy_dtoh"
+    else:
+        name = "memcpy_htod"
+
+    after = _add_record(
+            OperationRecord("copy", name, None, None, None, src.nbytes, stream),
+            stream)
+
+    # The driver copies making up this one are not recorded separately.
+    _state.copy_depth = getattr(_state, "copy_depth", 0) + 1
+
+    def after_copy():
+        _state.copy_depth -= 1
+        if after is not None:
+            after()
+
+    return after_copy
+
+
+# (function, record name, index of the stream argument or None)
+_DRIVER_COPIES = [
+        ("memcpy_htod", "memcpy_htod", None),
+        ("memcpy_htod_async", "memcpy_htod", 2),
+        ("memcpy_dtoh", "memcpy_dtoh", None),
+        ("memcpy_dtoh_async", "memcpy_dtoh", 2),
+        ("memcpy_dtod", "memcpy_dtod", None),
+        ("memcpy_dtod_async", "memcpy_dtod", 3),
+        ]
+
+
+def _get_arg(args, kwargs, index, name):
+    if index < len(args):
+        return args[index]
+    return kwargs.get(name)
+
+
+def _get_host_nbytes(buf):
+    try:
+        return buf.nbytes
+    except AttributeError:
+        return np.frombuffer(buf, np.uint8).size
+
+
+def _make_copy_wrapper(func, name, stream_index):
+    def wrapper(*args, **kwargs):
+        if getattr(_state, "copy_depth", 0):
+            return func(*args, **kwargs)
+
+        if name == "memcpy_htod":
+            nbytes = _get_host_nbytes(_get_arg(args, kwargs, 1, "src"))
+        elif name == "memcpy_dtoh":
+            nbytes = _get_host_nbytes(_get_arg(args, kwargs, 0, "dest"))
+        else:
+            nbytes = int(_get_arg(args, kwargs, 2, "size"))
+
+        if stream_index is None:
+            stream = None
+        else:
+            stream = _get_arg(args, kwargs, stream_index, "stream")
+
+        after = _add_record(
+                OperationRecord("copy", name, None, None, None, nbytes,
+                    stream),
+                stream)
+
+        result = func(*args, **kwargs)
+
+        if after is not None:
+            after()
+        return result
+
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def enable(capacity=100000, time_operations=True):
+    """Start recording the kernel launches made through
+    :meth:`pycuda.driver.Function.__call__` or the prepared call interface
+    (which covers :mod:`pycuda.gpuarray`, :mod:`pycuda.cumath`, reductions
+    and scans), the copies issued by :mod:`pycuda.gpuarray` and calls to
+    the ``memcpy_htod``, ``memcpy_dtoh`` and ``memcpy_dtod`` functions
+    (and their ``_async`` variants) of :mod:`pycuda.driver`, in all
+    threads. The most recent *capacity* records are kept.
+
+    The driver copy functions are replaced by recording wrappers until
+    :func:`disable` is called. Code that imported them by name before
+    instrumentation was enabled keeps calling the originals.
+
+    If *time_operations* is true, events are recorded around each operation
+    to measure its duration on the device. This adds two event records to
+    each launch but does not synchronize.
+    """
+    global _records, _time_operations
+
+    with _lock:
+        if _records is not None:
+            raise RuntimeError("instrumentation is already enabled")
+
+        _time_operations = time_operations
+        _records = deque(maxlen=capacity)
+        _references.clear()
+
+        drv.add_launch_hook(_instrument_launch)
+        drv.add_copy_hook(_instrument_copy)
+
+        for func_name, name, stream_index in _DRIVER_COPIES:
+            func = getattr(drv, func_name, None)
+            if func is not None:
+                _wrapped_copies[func_name] = func
+                setattr(drv, func_name,
+                        _make_copy_wrapper(func, name, stream_index))
+
+
+def disable():
+    """Stop recording. The records collected so far remain available."""
+    global _records
+
+    with _lock:
+        if _records is None:
+            return
+
+        drv.remove_launch_hook(_instrument_launch)
+        drv.remove_copy_hook(_instrument_copy)
+
+        for func_name, func in list(_wrapped_copies.items()):
+            setattr(drv, func_name, func)
+        _wrapped_copies.clear()
+
+        _kept_records[:] = list(_records)
+        _records = None
+
+
+def is_enabled():
+    return _records is not None
+
+
+def clear():
+    """Forget all records."""
+    records = _records
+    if records is not None:
+        records.clear()
+    del _kept_records[:]
+
+
+def get_records(wait=True):
+    """Return a list of the :class:`OperationRecord` instances collected,
+    oldest first. If *wait* is true, wait for the recorded operations to
+    complete so that their device times are available. Otherwise, only
+    those of completed operations are filled in.
+    """
+    records = _records
+    if records is None:
+        records = _kept_records
+
+    result = list(records)
+    with _resolve_lock:
+        for record in result:
+            record._resolve(wait)
+
+    return result
+
+# }}}
+
+
+# {{{ reports
+
+def summarize(records=None):
+    """Return a list of :class:`dict` instances, one per kernel (or kind of
+    copy), with the keys ``name``, ``kind``, ``count``, ``total_time``,
+    ``min_time``, ``max_time``, ``mean_time`` (in seconds, considering only
+    operations with device times) and ``nbytes`` (the sum over all
+    operations), sorted by decreasing total time.
+
+    *records* defaults to the result of :func:`get_records`.
+    """
+    if records is None:
+        records = get_records()
+
+    by_name = {}
+    for record in records:
+        try:
+            entry = by_name[record.kind, record.name]
+        except KeyError:
+            entry = by_name[record.kind, record.name] = {
+                    "name": record.name,
+                    "kind": record.kind,
+                    "count": 0,
+                    "timed_count": 0,
+                    "total_time": 0,
+                    "min_time": None,
+                    "max_time": None,
+                    "nbytes": 0,
+                    }
+
+        entry["count"] += 1
+        entry["nbytes"] += record.nbytes
+
+        t = record.device_time
+        if t is not None:
+            entry["timed_count"] += 1
+            entry["total_time"] += t
+            if entry["min_time"] is None or t < entry["min_time"]:
+                entry["min_time"] = t
+            if entry["max_time"] is None or t > entry["max_time"]:
+                entry["max_time"] = t
+
+    result = []
+    for entry in by_name.values():
+        timed_count = entry.pop("timed_count")
+        entry["mean_time"] = (entry["total_time"] / timed_count
+                if timed_count else None)
+        result.append(entry)
+
+    result.sort(key=lambda entry: (-entry["total_time"], entry["name"]))
+    return result
+
+
+def format_summary(records=None):
+    """Return the result of :func:`summarize` as a text table."""
+
+    def fmt_time(t):
+        if t is None:
+            return "-"
+        return "%.3f" % (t*1e3)
+
+    lines = ["%-40s %-6s %8s %12s %10s %10s %10s %12s" % (
+        "name", "kind", "count", "total [ms]", "mean [ms]", "min [ms]",
+        "max [ms]", "bytes")]
+
+    for entry in summarize(records):
+        lines.append("%-40s %-6s %8d %12s %10s %10s %10s %12d" % (
+            entry["name"][:40], entry["kind"], entry["count"],
+            fmt_time(entry["total_time"]), fmt_time(entry["mean_time"]),
+            fmt_time(entry["min_time"]), fmt_time(entry["max_time"]),
+            entry["nbytes"]))
+
+    return "\n".join(lines)
+
+
+def get_chrome_trace(records=None):
+    """Return the records as a :class:`dict` in the Trace Event Format
+    understood by ``chrome://tracing`` and Perfetto.
+
+    Operations with device times become complete events, placed on one
+    track per stream. Others are shown as instant events at the time they
+    were issued.
+    """
+    if records is None:
+        records = get_records()
+
+    events = []
+    for record in records:
+        args = {"nbytes": record.nbytes, "thread": record.thread_id}
+        if record.kind == "kernel":
+            args.update(grid=record.grid, block=record.block,
+                    shared_size=record.shared_size)
+
+        event = {
+                "name": record.name,
+                "cat": record.kind,
+                "pid": "pycuda",
+                "tid": "stream %#x" % record.stream,
+                "args": args,
+                }
+
+        if record.device_time is not None:
+            event.update(ph="X", ts=record.device_start*1e6,
+                    dur=record.device_time*1e6)
+        else:
+            event.update(ph="i", s="t", ts=record.host_time*1e6)
+
+        events.append(event)
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(filename, records=None):
+    """Write the result of :func:`get_chrome_trace` to the file *filename*
+    as JSON.
+    """
+    with open(filename, "w") as outf:
+        json.dump(get_chrome_trace(records), outf)
+
+# }}}
+
+# vim: foldmethod=marker
@@ -0,0 +1,198 @@
+"""Overlapped, chunked host<->device processing."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from six.moves import range, zip
+
+import pycuda.driver as drv
+
+
+class _PipelineSlot(object):
+    def __init__(self, stream, event):
+        self.stream = stream
+        self.event = event
+        self.pending = None
+        self.keep_alive = None
+
+
+class ChunkedPipeline(object):
+    """Process host arrays that are split into chunks along their leading
+    axis, overlapping uploads, computation and downloads.
+
+    Chunks are assigned round-robin to *depth* slots, each of which owns a
+    :class:`pycuda.driver.Stream`, a set of page-locked staging buffers and
+    a set of device buffers. Every chunk is uploaded, processed and
+    downloaded on its slot's stream, so that the upload of chunk *k+1*, the
+    computation on chunk *k* and the download of chunk *k-1* proceed
+    concurrently on the device, while the host fills the staging buffers of
+    the next slot.
+
+    *chunk_size* is the approximate number of bytes per chunk of the widest
+    array involved. Device buffers are obtained from *allocator*.
+    Page-locked buffers come from the
+    :attr:`pycuda.tools.PinnedStagingPool.host_pool` of the current context.
+
+    The streams and events are taken from the pools of the context that is
+    current during each call (see :func:`pycuda.tools.get_stream_pool`), so
+    an instance may be used in any context.
+    """
+
+    def __init__(self, chunk_size=4 << 20, depth=3, allocator=drv.mem_alloc):
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+
+        self.chunk_size = chunk_size
+        self.depth = depth
+        self.allocator = allocator
+
+    def get_chunk_length(self, arrays):
+        """Return the number of leading-axis entries per chunk used when
+        processing *arrays*.
+        """
+        row_nbytes = max(
+                (ary.nbytes // ary.shape[0]) if ary.shape[0] else 0
+                for ary in arrays)
+        return max(1, self.chunk_size // max(row_nbytes, 1))
+
+    def __call__(self, func, inputs, outputs=(), chunk_callback=None):
+        """Run *func* over corresponding chunks of the host arrays *inputs*,
+        downloading the results into the host arrays *outputs*.
+
+        All arrays must have the same length along their leading axis; they
+        may be pageable, page-locked or memory-mapped, and need not be
+        contiguous. *func* is called as ``func(stream, *chunks)``, where
+        *chunks* are :class:`pycuda.gpuarray.GPUArray` instances holding the
+        current chunk of each of *inputs*, followed by (uninitialized) device
+        chunks for each of *outputs*. It must enqueue its work on *stream*.
+        Its return value is kept alive until the chunk's work is complete,
+        which makes it safe to return device temporaries allocated from a
+        memory pool.
+
+        *chunk_callback*, if given, is called as ``chunk_callback(start,
+        stop)`` on the host once the chunk ``[start:stop]`` has been fully
+        processed and downloaded.
+
+        Returns once all chunks have been processed.
+        """
+        from pycuda.gpuarray import GPUArray
+        from pycuda.tools import (get_staging_pool, get_stream_pool,
+                get_event_pool)
+
+        inputs = list(inputs)
+        outputs = list(outputs)
+        arrays = inputs + outputs
+
+        if not arrays:
+            raise ValueError("need at least one input or output array")
+
+        n = arrays[0].shape[0]
+        for ary in arrays:
+            if not ary.shape or ary.shape[0] != n:
+                raise ValueError("all arrays must have the same length "
+                        "along their leading axis")
+
+        if not n:
+            return
+
+        chunk_len = min(self.get_chunk_length(arrays), n)
+        host_pool = get_staging_pool().host_pool
+        stream_pool = get_stream_pool()
+        event_pool = get_event_pool()
+        slots = [_PipelineSlot(stream_pool.get(), event_pool.get())
+                for i in range(self.depth)]
+
+        def retire(slot, slot_buffers):
+            if slot.pending is None:
+                return
+
+            start, stop = slot.pending
+            slot.event.synchronize()
+
+            for host_ary, (pinned, _) in zip(
+                    outputs, slot_buffers[len(inputs):]):
+                host_ary[start:stop] = pinned[:stop-start]
+
+            slot.pending = None
+            slot.keep_alive = None
+
+            if chunk_callback is not None:
+                chunk_callback(start, stop)
+
+        try:
+            # per slot: (page-locked buffer, device buffer) for each array
+            buffers = [
+                    [(host_pool.allocate((chunk_len,)+ary.shape[1:], ary.dtype),
+                        GPUArray((chunk_len,)+ary.shape[1:], ary.dtype,
+                            allocator=self.allocator))
+                        for ary in arrays]
+                    for slot in slots]
+
+            for k, start in enumerate(range(0, n, chunk_len)):
+                stop = min(start + chunk_len, n)
+                m = stop - start
+
+                slot = slots[k % self.depth]
+                slot_buffers = buffers[k % self.depth]
+                retire(slot, slot_buffers)
+
+                stream = slot.stream
+                for host_ary, (pinned, dev) in zip(
+                        inputs, slot_buffers[:len(inputs)]):
+                    pinned[:m] = host_ary[start:stop]
+                    drv.memcpy_htod_async(dev.gpudata, pinned[:m], stream)
+
+                chunks = [dev[:m] for _, dev in slot_buffers]
+                slot.keep_alive = func(stream, *chunks)
+
+                for pinned, dev in slot_buffers[len(inputs):]:
+                    drv.memcpy_dtoh_async(pinned[:m], dev.gpudata, stream)
+
+                slot.event.record(stream)
+                slot.pending = start, stop
+
+            # retire in issue order
+            first = (k + 1) % self.depth
+            for j in range(self.depth):
+                i = (first + j) % self.depth
+                retire(slots[i], buffers[i])
+        finally:
+            # If an exception got us out early, copies into or out of the
+            # page-locked buffers may still be in flight. Wait for them
+            # before the buffers go back to the host pool.
+            for slot in slots:
+                try:
+                    slot.stream.synchronize()
+                except drv.Error:
+                    # the context is unusable, do not reuse its objects
+                    continue
+
+                slot.keep_alive = None
+                stream_pool.put(slot.stream)
+                event_pool.put(slot.event)
+
@@ -0,0 +1,335 @@
+"""Recording sequences of launches and copies for repeated replay."""
+
+from __future__ import division
+from __future__ import absolute_import
+
+import re
+import struct
+import threading
+
+import numpy as np
+
+import pycuda.driver as drv
+
+__copyright__ = "Copyright (C) 2026 PyCUDA contributors"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person
+obtaining a copy of this software and associated documentation
+files (the "Software"), to deal in the Software without
+restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following
+conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+# {{{ recorded operations
+
+_FORMAT_ITEM_RE = re.compile(r"(\d*[a-zA-Z?])")
+
+
+
+def _get_address_range(obj):
+    """Return the range ``[start, end)`` of device addresses covered by
+    *obj*, a :class:`pycuda.gpuarray.GPUArray`, a device allocation or an
+    address.
+    """
+    from pycuda.gpuarray import GPUArray
+
+    if isinstance(obj, GPUArray):
+        start = int(obj.gpudata)
+        extent = obj.dtype.itemsize + sum(
+                (n - 1)*abs(stride)
+                for n, stride in zip(obj.shape, obj.strides) if n)
+        return start, start + extent
+    else:
+        start = int(obj)
+        return start, start + 1
+
+
+def _get_arg_codes(func, args, arg_buf):
+    """Return a list of the :mod:`struct` codes with which each of *args*
+    was packed into *arg_buf*, or *None* if they cannot be determined.
+    """
+    from pycuda._pvt_struct import calcsize
+
+    # prepared call
+    arg_format = getattr(func, "arg_format", None)
+    if arg_format is not None:
+        codes = _FORMAT_ITEM_RE.findall(arg_format)
+        if len(codes) == len(args) and calcsize(arg_format) == len(arg_buf):
+            return codes
+
+    # packed by Function.__call__
+    codes = []
+    for arg in args:
+        if isinstance(arg, np.number):
+            codes.append(arg.dtype.char)
+        elif (isinstance(arg, np.ndarray)
+                and not isinstance(arg.base, drv.ManagedAllocationOrStub)):
+            codes.append("%ds" % arg.nbytes)
+        elif isinstance(arg, np.void):
+            codes.append("%ds" % arg.itemsize)
+        else:
+            codes.append("P")
+
+    if calcsize("".join(codes)) != len(arg_buf):
+        return None
+    return codes
+
+
+def _get_pointer_offsets(func, args, arg_buf):
+    """Return a list of the offsets of the pointer parameters in *arg_buf*,
+    or *None* if they cannot be determined.
+    """
+    from pycuda._pvt_struct import calcsize
+
+    codes = _get_arg_codes(func, args, arg_buf)
+    if codes is None:
+        return None
+
+    uintp_code = np.dtype(np.uintp).char
+
+    offsets = []
+    arg_format = ""
+    for arg, code in zip(args, codes):
+        arg_format += code
+        if code == "P" or (code == uintp_code and (
+                hasattr(arg, "gpudata")
+                or isinstance(arg, (drv.DeviceAllocation,
+                    drv.PooledDeviceAllocation)))):
+            # the size of the buffer up to here, minus the parameter itself
+            offsets.append(calcsize(arg_format) - calcsize(code))
+
+    return offsets
+
+
+class _LaunchEntry(object):
+    def __init__(self, func, grid, block, stream, args, arg_buf,
+            shared_size):
+        self.func = func
+        self.grid = grid
+        self.block = block
+        self.stream = stream
+        # keeps the memory referred to by the parameters alive
+        self.args = list(args)
+        self.arg_buf = bytes(arg_buf)
+        self.shared_size = shared_size
+        self.pointer_offsets = _get_pointer_offsets(func, args, arg_buf)
+
+    def run(self, stream):
+        after_launch = (drv._run_launch_hooks(self.func, self.grid,
+                    self.block, stream, self.args, self.arg_buf,
+                    self.shared_size)
+                if drv._launch_hooks else ())
+
+        self.func._launch_kernel(self.grid, self.block, self.arg_buf,
+                self.shared_size, stream)
+
+        for after in after_launch:
+            after()
+
+    def update(self, old, new, old_start, old_end, new_start):
+        self.args = [new if arg is old else arg for arg in self.args]
+
+        arg_buf = bytearray(self.arg_buf)
+        updated = False
+        for offset in self.pointer_offsets:
+            address, = struct.unpack_from("P", arg_buf, offset)
+            if old_start <= address < old_end:
+                struct.pack_into("P", arg_buf, offset,
+                        address - old_start + new_start)
+                updated = True
+
+        if updated:
+            self.arg_buf = bytes(arg_buf)
+        return updated
+
+
+class _CopyEntry(object):
+    def __init__(self, dst, src, stream):
+        self.dst = dst
+        self.src = src
+        self.stream = stream
+
+    def run(self, stream):
+        from pycuda.gpuarray import _memcpy_discontig
+        _memcpy_discontig(self.dst, self.src, async=True, stream=stream)
+
+    def update(self, old, new, old_start, old_end, new_start):
+        updated = False
+        if self.dst is old:
+            self.dst = new
+            updated = True
+        if self.src is old:
+            self.src = new
+            updated = True
+        return updated
+
+# }}}
+
+
+# {{{ recording
+
+_state = threading.local()
+
+_hook_lock = threading.Lock()
+_active_recordings = 0
+
+
+def _record_launch(func, grid, block, stream, args, arg_buf, shared_size):
+    recording = getattr(_state, "recording", None)
+    if recording is not None:
+        recording._entries.append(_LaunchEntry(
+            func, grid, block, stream, args, arg_buf, shared_size))
+
+
+def _record_copy(dst, src, stream):
+    recording = getattr(_state, "recording", None)
+    if recording is not None:
+        recording._entries.append(_CopyEntry(dst, src, stream))
+
+
+class LaunchRecording(object):
+    """A sequence of kernel launches and :mod:`pycuda.gpuarray` copies that
+    can be issued again with a single call to :meth:`replay`.
+
+    Operations are recorded while they are issued by the thread that
+    called :meth:`start` (or entered the recording as a context manager)
+    and run as usual at that time. This covers :class:`GPUArray
+    <pycuda.gpuarray.GPUArray>` arithmetic, :mod:`pycuda.cumath`,
+    reductions, scans and copies, as well as any kernel launched through
+    :meth:`pycuda.driver.Function.__call__` or the prepared call interface.
+
+    Each launch is replayed with the parameter buffer packed when it was
+    recorded, so the memory of all arrays involved, including temporaries
+    such as partial sums, is kept alive and reused by every replay. Code
+    whose course depends on results read back to the host, as well as
+    copies through :class:`pycuda.driver.In` and friends and direct calls
+    to the copy and memset functions of :mod:`pycuda.driver`, are not
+    captured.
+    """
+
+    def __init__(self):
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        """Start recording the operations issued by the calling thread."""
+        global _active_recordings
+
+        if getattr(_state, "recording", None) is not None:
+            raise RuntimeError("a recording is already in progress "
+                    "in this thread")
+
+        with _hook_lock:
+            if not _active_recordings:
+                drv.add_launch_hook(_record_launch)
+                drv.add_copy_hook(_record_copy)
+            _active_recordings += 1
+
+        _state.recording = self
+
+    def stop(self):
+        """Stop recording."""
+        global _active_recordings
+
+        if getattr(_state, "recording", None) is not self:
+            raise RuntimeError("not recording in this thread")
+
+        _state.recording = None
+
+        with _hook_lock:
+            _active_recordings -= 1
+            if not _active_recordings:
+                drv.remove_launch_hook(_record_launch)
+                drv.remove_copy_hook(_record_copy)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def replay(self, stream=None):
+        """Issue the recorded operations again, on the streams on which they
+        were recorded or, if *stream* is given, all of them on *stream*.
+        Copies are issued asynchronously, even if they were recorded as
+        synchronous.
+        """
+        for entry in self._entries:
+            entry.run(stream if stream is not None else entry.stream)
+
+    def update(self, old, new):
+        """Make the recorded operations use the memory of *new* where they
+        used that of *old*, and return the number of operations affected.
+
+        If *old* is a :class:`pycuda.gpuarray.GPUArray`, *new* must be one of
+        the same shape, dtype and strides, and kernel parameters pointing
+        anywhere into *old* (e.g. into a view of it) are moved along. Copies
+        are only redirected if they involved *old* itself. Otherwise, *old*
+        and *new* are device allocations or addresses, and only kernel
+        parameters equal to *old* are replaced. Only pointer parameters are
+        changed, never scalars that happen to hold a matching value.
+        """
+        from pycuda.gpuarray import GPUArray
+
+        if isinstance(old, GPUArray):
+            if not isinstance(new, GPUArray) or (
+                    old.shape != new.shape or old.dtype != new.dtype
+                    or old.strides != new.strides):
+                raise ValueError("new array must have the same shape, "
+                        "dtype and strides as the old one")
+
+            if not old.size:
+                return 0
+
+        old_start, old_end = _get_address_range(old)
+        new_start, _ = _get_address_range(new)
+
+        for entry in self._entries:
+            if (isinstance(entry, _LaunchEntry)
+                    and entry.pointer_offsets is None):
+                raise ValueError("cannot locate the pointer parameters of "
+                        "the recorded launch of '%s'" % entry.func.name)
+
+        count = 0
+        for entry in self._entries:
+            if entry.update(old, new, old_start, old_end, new_start):
+                count += 1
+
+        return count
+
+
+def record():
+    """Return a new :class:`LaunchRecording` for use as a context manager::
+
+        with record() as rec:
+            y = a*x + y
+            total = gpuarray.sum(y)
+
+        for i in range(1000):
+            rec.replay()
+    """
+    return LaunchRecording()
+
+# }}}
+
+# vim: foldmethod=marker
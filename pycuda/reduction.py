@@ -61,15 +61,186 @@ source code with only those rights set forth herein.
 """
 
 from pycuda.tools import context_dependent_memoize
-from pycuda.tools import dtype_to_ctype
+from pycuda.tools import dtype_to_ctype, _get_stream_key
+from pytools import memoize_method
 import numpy as np
+import weakref
+
+
+BLOCK_REDUCTION_SOURCE = """
+          sdata[tid] = acc;
+
+          __syncthreads();
+
+          #if (BLOCK_SIZE >= 1024)
+            if (tid < 512) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 512]); }
+            __syncthreads();
+          #endif
+
+          #if (BLOCK_SIZE >= 512)
+            if (tid < 256) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 256]); }
+            __syncthreads();
+          #endif
+
+          #if (BLOCK_SIZE >= 256)
+            if (tid < 128) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 128]); }
+            __syncthreads();
+          #endif
+
+          #if (BLOCK_SIZE >= 128)
+            if (tid < 64) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 64]); }
+            __syncthreads();
+          #endif
+
+          if (tid < 32)
+          {
+            // 'volatile' required according to Fermi compatibility guide 1.2.2
+            volatile out_type *smem = sdata;
+            if (BLOCK_SIZE >= 64) smem[tid] = REDUCE(smem[tid], smem[tid + 32]);
+            if (BLOCK_SIZE >= 32) smem[tid] = REDUCE(smem[tid], smem[tid + 16]);
+            if (BLOCK_SIZE >= 16) smem[tid] = REDUCE(smem[tid], smem[tid + 8]);
+            if (BLOCK_SIZE >= 8)  smem[tid] = REDUCE(smem[tid], smem[tid + 4]);
+            if (BLOCK_SIZE >= 4)  smem[tid] = REDUCE(smem[tid], smem[tid + 2]);
+            if (BLOCK_SIZE >= 2)  smem[tid] = REDUCE(smem[tid], smem[tid + 1]);
+          }
+"""
+
+# Values of struct types cannot be accessed through volatile pointers, so
+# their reduction synchronizes the whole block after every level.
+SYNCED_BLOCK_REDUCTION_SOURCE = """
+          sdata[tid] = acc;
+
+          __syncthreads();
+""" + "".join("""
+          #if (BLOCK_SIZE >= %(twice)d)
+            if (tid < %(half)d)
+              sdata[tid] = REDUCE(sdata[tid], sdata[tid + %(half)d]);
+            __syncthreads();
+          #endif
+""" % {"twice": 2*half, "half": half}
+        for half in [512, 256, 128, 64, 32, 16, 8, 4, 2, 1])
+
+
+# Intra-warp stages use register shuffles; shared memory only carries the
+# per-warp results. Requires BLOCK_SIZE to be a multiple of the warp size.
+SHUFFLE_PREAMBLE_SOURCE = """
+        #if defined(__CUDACC_VER_MAJOR__) && __CUDACC_VER_MAJOR__ >= 9
+          #define PYCUDA_SHFL_DOWN(v, delta) __shfl_down_sync(0xffffffffu, v, delta)
+        #else
+          #define PYCUDA_SHFL_DOWN(v, delta) __shfl_down(v, delta)
+        #endif
+
+        // shuffle values of any type as a sequence of 32-bit words
+        template <class T>
+        __device__ __forceinline__ T pycuda_shfl_down(T val, unsigned int delta)
+        {
+          T result;
+          int *src = reinterpret_cast<int *>(&val);
+          int *dest = reinterpret_cast<int *>(&result);
+          #pragma unroll
+          for (unsigned int k = 0; k < sizeof(T) / sizeof(int); ++k)
+            dest[k] = PYCUDA_SHFL_DOWN(src[k], delta);
+          return result;
+        }
+"""
+
+SHUFFLE_BLOCK_REDUCTION_SOURCE = """
+          {
+            const unsigned int lane = tid %% 32;
+            const unsigned int warp = tid / 32;
+
+            #pragma unroll
+            for (unsigned int offset = 16; offset > 0; offset /= 2)
+              acc = REDUCE(acc, pycuda_shfl_down(acc, offset));
+
+            if (lane == 0) sdata[warp] = acc;
+
+            __syncthreads();
+
+            if (warp == 0)
+            {
+              acc = (tid < BLOCK_SIZE / 32) ? sdata[tid] : %(neutral)s;
+
+              #pragma unroll
+              for (unsigned int offset = 16; offset > 0; offset /= 2)
+                acc = REDUCE(acc, pycuda_shfl_down(acc, offset));
+
+              if (tid == 0) sdata[0] = acc;
+            }
+          }
+"""
+
+
+def use_warp_shuffle(dtype_out, block_size, dev=None):
+    """Return whether reductions to *dtype_out* with blocks of *block_size*
+    threads on *dev* (by default, that of the current context) are
+    generated using warp shuffles.
+    """
+    import pycuda.driver as drv
+
+    if dev is None:
+        dev = drv.Context.get_device()
+
+    return (dev.compute_capability() >= (3, 0)
+            and np.dtype(dtype_out).itemsize % 4 == 0
+            and block_size >= 32 and block_size % 32 == 0)
+
+
+# The last block to finish combines the partial results of all blocks. The
+# counter wraps back to zero in the process, leaving it ready for the next
+# launch.
+SINGLE_LAUNCH_TAIL_SOURCE = """
+          __shared__ bool am_last_block;
+
+          if (tid == 0)
+          {
+            partials[blockIdx.x] = sdata[0];
+            __threadfence();
+
+            unsigned int ticket = atomicInc(done_count, gridDim.x - 1);
+            am_last_block = (ticket == gridDim.x - 1);
+          }
+
+          __syncthreads();
+
+          if (am_last_block)
+          {
+            acc = %(neutral)s;
+            for (unsigned int j = tid; j < gridDim.x; j += BLOCK_SIZE)
+              acc = REDUCE(acc, partials[j]);
+
+            %(block_reduction)s
+
+            if (tid == 0) out[0] = sdata[0];
+          }
+"""
 
 
 def get_reduction_module(out_type, block_size,
         neutral, reduce_expr, map_expr, arguments,
-        name="reduce_kernel", keep=False, options=None, preamble=""):
+        name="reduce_kernel", keep=False, options=None, preamble="",
+        single_launch=False, warp_shuffle=False, warp_synchronous=True):
 
     from pycuda.compiler import SourceModule
+
+    if warp_shuffle:
+        block_reduction = SHUFFLE_BLOCK_REDUCTION_SOURCE % {"neutral": neutral}
+        preamble = SHUFFLE_PREAMBLE_SOURCE + preamble
+    elif warp_synchronous:
+        block_reduction = BLOCK_REDUCTION_SOURCE
+    else:
+        block_reduction = SYNCED_BLOCK_REDUCTION_SOURCE
+
+    if single_launch:
+        extra_arguments = ", out_type *partials, unsigned int *done_count"
+        tail = SINGLE_LAUNCH_TAIL_SOURCE % {
+                "neutral": neutral,
+                "block_reduction": block_reduction,
+                }
+    else:
+        extra_arguments = ""
+        tail = "if (tid == 0) out[blockIdx.x] = sdata[0];"
+
     src = """
         #include <pycuda-complex.hpp>
 
@@ -84,7 +255,7 @@ def get_reduction_module(out_type, block_size,
         extern "C"
         __global__
         void %(name)s(out_type *out, %(arguments)s,
-          unsigned int seq_count, unsigned int n)
+          unsigned int seq_count, unsigned int n%(extra_arguments)s)
         {
           // Needs to be variable-size to prevent the braindead CUDA compiler from
           // running constructors on this array. Grrrr.
@@ -104,48 +275,22 @@ def get_reduction_module(out_type, block_size,
             i += BLOCK_SIZE;
           }
 
-          sdata[tid] = acc;
-
-          __syncthreads();
-
-          #if (BLOCK_SIZE >= 512)
-            if (tid < 256) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 256]); }
-            __syncthreads();
-          #endif
-
-          #if (BLOCK_SIZE >= 256)
-            if (tid < 128) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 128]); }
-            __syncthreads();
-          #endif
+          %(block_reduction)s
 
-          #if (BLOCK_SIZE >= 128)
-            if (tid < 64) { sdata[tid] = REDUCE(sdata[tid], sdata[tid + 64]); }
-            __syncthreads();
-          #endif
-
-          if (tid < 32)
-          {
-            // 'volatile' required according to Fermi compatibility guide 1.2.2
-            volatile out_type *smem = sdata;
-            if (BLOCK_SIZE >= 64) smem[tid] = REDUCE(smem[tid], smem[tid + 32]);
-            if (BLOCK_SIZE >= 32) smem[tid] = REDUCE(smem[tid], smem[tid + 16]);
-            if (BLOCK_SIZE >= 16) smem[tid] = REDUCE(smem[tid], smem[tid + 8]);
-            if (BLOCK_SIZE >= 8)  smem[tid] = REDUCE(smem[tid], smem[tid + 4]);
-            if (BLOCK_SIZE >= 4)  smem[tid] = REDUCE(smem[tid], smem[tid + 2]);
-            if (BLOCK_SIZE >= 2)  smem[tid] = REDUCE(smem[tid], smem[tid + 1]);
-          }
-
-          if (tid == 0) out[blockIdx.x] = sdata[0];
+          %(tail)s
         }
         """ % {
             "out_type": out_type,
             "arguments": arguments,
+            "extra_arguments": extra_arguments,
             "block_size": block_size,
             "neutral": neutral,
             "reduce_expr": reduce_expr,
             "map_expr": map_expr,
             "name": name,
-            "preamble": preamble
+            "preamble": preamble,
+            "block_reduction": block_reduction,
+            "tail": tail,
             }
     return SourceModule(src, options=options, keep=keep, no_extern_c=True)
 
@@ -154,7 +299,8 @@ def get_reduction_module(out_type, block_size,
 
 def get_reduction_kernel_and_types(stage, out_type, block_size,
         neutral, reduce_expr, map_expr=None, arguments=None,
-        name="reduce_kernel", keep=False, options=None, preamble=""):
+        name="reduce_kernel", keep=False, options=None, preamble="",
+        single_launch=False, warp_shuffle=False, warp_synchronous=True):
 
     if stage == 1:
         if map_expr is None:
@@ -175,12 +321,16 @@ def get_reduction_kernel_and_types(stage, out_type, block_size,
 
     mod = get_reduction_module(out_type, block_size,
             neutral, reduce_expr, map_expr, arguments,
-            name, keep, options, preamble)
+            name, keep, options, preamble, single_launch=single_launch,
+            warp_shuffle=warp_shuffle, warp_synchronous=warp_synchronous)
 
     from pycuda.tools import get_arg_type
     func = mod.get_function(name)
     arg_types = [get_arg_type(arg) for arg in arguments.split(",")]
-    func.prepare("P%sII" % "".join(arg_types))
+    if single_launch:
+        func.prepare("P%sIIPP" % "".join(arg_types))
+    else:
+        func.prepare("P%sII" % "".join(arg_types))
 
     return func, arg_types
 
@@ -190,101 +340,581 @@ def get_reduction_kernel_and_types(stage, out_type, block_size,
 class ReductionKernel:
     def __init__(self, dtype_out,
             neutral, reduce_expr, map_expr=None, arguments=None,
-            name="reduce_kernel", keep=False, options=None, preamble=""):
+            name="reduce_kernel", keep=False, options=None, preamble="",
+            single_launch=False):
 
         self.dtype_out = np.dtype(dtype_out)
-
+        self.neutral = neutral
+        self.reduce_expr = reduce_expr
+        self.map_expr = map_expr
+        self.arguments = arguments
+        self.name = name
+        self.keep = keep
+        self.options = options
+        self.preamble = preamble
+        self.single_launch = single_launch
+
+        # defaults, used unless the tuning database has better values
         self.block_size = 512
+        self.max_block_count = 1024
+        self.small_seq_count = 4
 
-        s1_func, self.stage1_arg_types = get_reduction_kernel_and_types(
-                1, dtype_to_ctype(dtype_out), self.block_size,
-                neutral, reduce_expr, map_expr,
-                arguments, name=name+"_stage1", keep=keep, options=options,
-                preamble=preamble)
-        self.stage1_func = s1_func.prepared_async_call
+        if single_launch:
+            self.single_launch_func, self.stage1_arg_types = \
+                    self._get_single_launch_func(self.block_size)
 
-        # stage 2 has only one input and no map expression
-        s2_func, self.stage2_arg_types = get_reduction_kernel_and_types(
-                2, dtype_to_ctype(dtype_out), self.block_size,
-                neutral, reduce_expr, arguments=arguments,
-                name=name+"_stage2", keep=keep, options=options,
-                preamble=preamble)
-        self.stage2_func = s2_func.prepared_async_call
+            # stream (or None) -> (partials capacity, partials, counter)
+            self._workspaces = {}
+            self._stream_workspaces = weakref.WeakKeyDictionary()
+        else:
+            (self.stage1_func, self.stage1_arg_types,
+                    self.stage2_func, self.stage2_arg_types) = \
+                            self._get_stage_funcs(self.block_size)
 
         assert [i for i, arg_tp in enumerate(self.stage1_arg_types) if arg_tp == "P"], \
                 "ReductionKernel can only be used with functions that have at least one " \
                 "vector argument"
 
-    def __call__(self, *args, **kwargs):
-        MAX_BLOCK_COUNT = 1024
-        SMALL_SEQ_COUNT = 4
+    @memoize_method
+    def _get_stage_funcs(self, block_size):
+        s1_func, stage1_arg_types = get_reduction_kernel_and_types(
+                1, dtype_to_ctype(self.dtype_out), block_size,
+                self.neutral, self.reduce_expr, self.map_expr,
+                self.arguments, name=self.name+"_stage1", keep=self.keep,
+                options=self.options, preamble=self.preamble,
+                warp_shuffle=self._uses_warp_shuffle(block_size),
+                warp_synchronous=self.dtype_out.fields is None)
 
-        s1_func = self.stage1_func
-        s2_func = self.stage2_func
+        # stage 2 has only one input and no map expression
+        s2_func, stage2_arg_types = get_reduction_kernel_and_types(
+                2, dtype_to_ctype(self.dtype_out), block_size,
+                self.neutral, self.reduce_expr, arguments=self.arguments,
+                name=self.name+"_stage2", keep=self.keep, options=self.options,
+                preamble=self.preamble,
+                warp_shuffle=self._uses_warp_shuffle(block_size),
+                warp_synchronous=self.dtype_out.fields is None)
+
+        return (s1_func.prepared_async_call, stage1_arg_types,
+                s2_func.prepared_async_call, stage2_arg_types)
+
+    @memoize_method
+    def _get_single_launch_func(self, block_size):
+        func, arg_types = get_reduction_kernel_and_types(
+                1, dtype_to_ctype(self.dtype_out), block_size,
+                self.neutral, self.reduce_expr, self.map_expr,
+                self.arguments, name=self.name+"_single", keep=self.keep,
+                options=self.options, preamble=self.preamble,
+                single_launch=True,
+                warp_shuffle=self._uses_warp_shuffle(block_size),
+                warp_synchronous=self.dtype_out.fields is None)
+
+        return func.prepared_async_call, arg_types
+
+    @memoize_method
+    def _uses_warp_shuffle(self, block_size):
+        return use_warp_shuffle(self.dtype_out, block_size)
+
+    def _get_shared_size(self, block_size):
+        if self._uses_warp_shuffle(block_size):
+            # one entry per warp
+            return (block_size // 32) * self.dtype_out.itemsize
+        else:
+            return block_size * self.dtype_out.itemsize
+
+    def _get_workspace(self, block_count, stream):
+        """Return the buffers for partial results and the block completion
+        counter used by single-launch reductions on *stream*. Launches on
+        the same stream are serialized, so they can share them. (With a
+        per-thread default stream, each thread gets its own for *None*.)
+        """
+        import pycuda.driver as drv
+
+        key = _get_stream_key(stream)
+        if key is None:
+            cache = self._workspaces
+        else:
+            cache = self._stream_workspaces
+
+        workspace = cache.get(key)
+        if workspace is None or workspace[0] < block_count:
+            capacity = max(block_count, self.max_block_count)
+            counter = drv.mem_alloc(4)
+            drv.memset_d32(counter, 0, 1)
+            workspace = (capacity,
+                    drv.mem_alloc(capacity*self.dtype_out.itemsize), counter)
+            cache[key] = workspace
+
+        return workspace
+
+    def _get_tuning_family(self):
+        if self.single_launch:
+            return "reduction_single:"+self.name
+        else:
+            return "reduction:"+self.name
+
+    def _get_default_config(self):
+        return dict(
+                block_size=self.block_size,
+                max_block_count=self.max_block_count,
+                small_seq_count=self.small_seq_count)
+
+    def get_tuning_candidates(self):
+        """Return the launch configurations considered by :meth:`autotune`."""
+        import pycuda.driver as drv
+        from pycuda.autotune import parameter_space
+
+        dev = drv.Context.get_device()
+        max_threads = dev.get_attribute(
+                drv.device_attribute.MAX_THREADS_PER_BLOCK)
+        mp_count = dev.get_attribute(
+                drv.device_attribute.MULTIPROCESSOR_COUNT)
+
+        return parameter_space(
+                block_size=[bs for bs in (128, 256, 512, 1024)
+                    if bs <= max_threads],
+                max_block_count=sorted(set([4*mp_count, 16*mp_count, 1024])),
+                small_seq_count=[1, 4, 16])
+
+    def autotune(self, *args, **kwargs):
+        """Find the fastest launch configuration for reducing *args* (as
+        they would be passed to :meth:`__call__`) on the current device, and
+        store it in the tuning database (see :mod:`pycuda.autotune`) for
+        arrays of similar size. Returns the configuration.
+        """
+        from pycuda.autotune import tune
 
-        kernel_wrapper = kwargs.get("kernel_wrapper")
-        if kernel_wrapper is not None:
-            s1_func = kernel_wrapper(s1_func)
-            s2_func = kernel_wrapper(s2_func)
+        stream = kwargs.get("stream")
+        allocator = kwargs.get("allocator")
+        sz = self._get_size(args, self.stage1_arg_types)
 
+        def run(config):
+            self._launch(args, config, stream=stream, allocator=allocator)
+
+        return tune(self._get_tuning_family(), self.dtype_out, sz,
+                self.get_tuning_candidates(), run, stream=stream)
+
+    @staticmethod
+    def _get_size(args, arg_types):
+        for arg, arg_tp in zip(args, arg_types):
+            if arg_tp == "P":
+                return arg.size
+
+    def _get_config(self, sz, args=None, kwargs={}):
+        from pycuda.autotune import get_parameters
+
+        tuner = None
+        if args is not None:
+            def tuner():
+                return self.autotune(*args, **kwargs)
+
+        return get_parameters(self._get_tuning_family(), self.dtype_out, sz,
+                self._get_default_config(), tuner)
+
+    def __call__(self, *args, **kwargs):
         stream = kwargs.get("stream")
+        tune_kwargs = dict(stream=stream, allocator=kwargs.get("allocator"))
 
+        config = self._get_config(
+                self._get_size(args, self.stage1_arg_types), args, tune_kwargs)
+
+        return self._launch(args, config,
+                stream=stream, allocator=kwargs.get("allocator", None),
+                kernel_wrapper=kwargs.get("kernel_wrapper"),
+                out=kwargs.get("out"))
+
+    def _get_block_count(self, sz, config):
+        block_size = config["block_size"]
+        max_block_count = config["max_block_count"]
+        small_seq_count = config["small_seq_count"]
+
+        if sz <= block_size*small_seq_count*max_block_count:
+            total_block_size = small_seq_count*block_size
+            block_count = (sz + total_block_size - 1) // total_block_size
+            seq_count = small_seq_count
+        else:
+            block_count = max_block_count
+            macroblock_size = block_count*block_size
+            seq_count = (sz + macroblock_size - 1) // macroblock_size
+
+        return block_count, seq_count
+
+    @staticmethod
+    def _get_invocation_args(args, arg_types):
+        invocation_args = []
+        vectors = []
+
+        for arg, arg_tp in zip(args, arg_types):
+            if arg_tp == "P":
+                if not arg.flags.forc:
+                    raise RuntimeError("ReductionKernel cannot "
+                            "deal with non-contiguous arrays")
+
+                vectors.append(arg)
+                invocation_args.append(arg)
+            else:
+                invocation_args.append(arg)
+
+        return invocation_args, vectors
+
+    def _get_output(self, out, allocator):
         from .gpuarray import empty
 
-        f = s1_func
-        arg_types = self.stage1_arg_types
+        if out is None:
+            return empty((), self.dtype_out, allocator=allocator)
+
+        if out.dtype != self.dtype_out or out.size != 1:
+            raise ValueError("out must be a single element of type %s"
+                    % self.dtype_out)
+        return out
+
+    def _launch(self, args, config, stream=None, allocator=None,
+            kernel_wrapper=None, out=None):
+        if self.single_launch:
+            return self._launch_single(args, config, stream, allocator,
+                    kernel_wrapper, out)
+
+        from .gpuarray import empty
 
         stage1_args = args
+        stage = 1
 
         while True:
-            invocation_args = []
-            vectors = []
+            block_size = config["block_size"]
+
+            s1_func, stage1_arg_types, s2_func, stage2_arg_types = \
+                    self._get_stage_funcs(block_size)
 
-            for arg, arg_tp in zip(args, arg_types):
-                if arg_tp == "P":
-                    if not arg.flags.forc:
-                        raise RuntimeError("ReductionKernel cannot "
-                                "deal with non-contiguous arrays")
+            if stage == 1:
+                f = s1_func
+                arg_types = stage1_arg_types
+            else:
+                f = s2_func
+                arg_types = stage2_arg_types
 
-                    vectors.append(arg)
-                    invocation_args.append(arg.gpudata)
-                else:
-                    invocation_args.append(arg)
+            if kernel_wrapper is not None:
+                f = kernel_wrapper(f)
+
+            invocation_args, vectors = self._get_invocation_args(
+                    args, arg_types)
 
             repr_vec = vectors[0]
             sz = repr_vec.size
 
-            allocator = kwargs.get("allocator", None)
             if allocator is None:
                 allocator = repr_vec.allocator
 
-            if sz <= self.block_size*SMALL_SEQ_COUNT*MAX_BLOCK_COUNT:
-                total_block_size = SMALL_SEQ_COUNT*self.block_size
-                block_count = (sz + total_block_size - 1) // total_block_size
-                seq_count = SMALL_SEQ_COUNT
-            else:
-                block_count = MAX_BLOCK_COUNT
-                macroblock_size = block_count*self.block_size
-                seq_count = (sz + macroblock_size - 1) // macroblock_size
+            block_count, seq_count = self._get_block_count(sz, config)
 
             if block_count == 1:
-                result = empty((), self.dtype_out, allocator=allocator)
+                result = self._get_output(out, allocator)
             else:
                 result = empty((block_count,), self.dtype_out, allocator=allocator)
 
-            kwargs = dict(shared_size=self.block_size*self.dtype_out.itemsize)
+            kwargs = dict(shared_size=self._get_shared_size(block_size))
 
-            # print block_count, seq_count, self.block_size, sz
-            f((block_count, 1), (self.block_size, 1, 1), stream,
-                    *([result.gpudata]+invocation_args+[seq_count, sz]),
+            # print block_count, seq_count, block_size, sz
+            f((block_count, 1), (block_size, 1, 1), stream,
+                    *([result]+invocation_args+[seq_count, sz]),
                     **kwargs)
 
             if block_count == 1:
                 return result
             else:
-                f = s2_func
-                arg_types = self.stage2_arg_types
+                stage = 2
                 args = (result,) + stage1_args
+                config = self._get_config(block_count)
+
+    def _launch_single(self, args, config, stream, allocator, kernel_wrapper,
+            out):
+        block_size = config["block_size"]
+        f, arg_types = self._get_single_launch_func(block_size)
+
+        if kernel_wrapper is not None:
+            f = kernel_wrapper(f)
+
+        invocation_args, vectors = self._get_invocation_args(args, arg_types)
+
+        repr_vec = vectors[0]
+        sz = repr_vec.size
+
+        if allocator is None:
+            allocator = repr_vec.allocator
+
+        block_count, seq_count = self._get_block_count(sz, config)
+        block_count = max(block_count, 1)
+        _, partials, counter = self._get_workspace(block_count, stream)
+
+        result = self._get_output(out, allocator)
+
+        f((block_count, 1), (block_size, 1, 1), stream,
+                *([result]+invocation_args
+                    + [seq_count, sz, partials, counter]),
+                shared_size=self._get_shared_size(block_size))
+
+        return result
+
+    @memoize_method
+    def get_partials_kernel(self):
+        """Return a :class:`ReductionKernel` that combines an array of
+        partial results of *self* using the same reduction.
+        """
+        return ReductionKernel(self.dtype_out, self.neutral, self.reduce_expr,
+                arguments="const %s *in" % dtype_to_ctype(self.dtype_out),
+                name=self.name+"_partials", options=self.options,
+                preamble=self.preamble)
+
+
+
+
+BATCHED_REDUCTION_SOURCE = """
+        #include <pycuda-complex.hpp>
+
+        #define BLOCK_SIZE %(block_size)d
+        #define READ_AND_MAP(i) (%(map_expr)s)
+        #define REDUCE(a, b) (%(reduce_expr)s)
+
+        %(preamble)s
+
+        typedef %(out_type)s out_type;
+        typedef %(in_type)s in_type;
+
+        extern "C"
+        __global__
+        void %(name)s(out_type *all_out,
+          const in_type *const *pointers, const unsigned int *lengths,
+          unsigned int array_count,
+          out_type *all_partials, unsigned int *done_counts)
+        {
+          extern __shared__ out_type sdata[];
+
+          unsigned int tid = threadIdx.x;
+
+          // blockIdx.x indexes the blocks working on the same array
+          for (unsigned int array_idx = blockIdx.y; array_idx < array_count;
+              array_idx += gridDim.y)
+          {
+            const in_type *in = pointers[array_idx];
+            const unsigned int n = lengths[array_idx];
+
+            out_type *out = all_out + array_idx;
+            out_type *partials = all_partials + array_idx*gridDim.x;
+            unsigned int *done_count = done_counts + array_idx;
+
+            out_type acc = %(neutral)s;
+            for (unsigned int i = blockIdx.x*BLOCK_SIZE + tid; i < n;
+                i += gridDim.x*BLOCK_SIZE)
+              acc = REDUCE(acc, READ_AND_MAP(i));
+
+            %(block_reduction)s
+
+            if (gridDim.x == 1)
+            {
+              if (tid == 0) out[0] = sdata[0];
+            }
+            else
+            {
+              %(tail)s
+            }
+
+            // sdata is reused for the next array
+            __syncthreads();
+          }
+        }
+"""
+
+
+class BatchedReductionKernel:
+    """Reduce each of a number of arrays of the same type in a single
+    launch. *map_expr* may refer to the current array as *in* and to the
+    index as *i*.
+    """
+
+    def __init__(self, dtype_out, dtype_in, neutral, reduce_expr,
+            map_expr="in[i]", name="batched_reduce_kernel", keep=False,
+            options=None, preamble=""):
+        self.dtype_out = np.dtype(dtype_out)
+        self.dtype_in = np.dtype(dtype_in)
+        self.neutral = neutral
+        self.reduce_expr = reduce_expr
+        self.map_expr = map_expr
+        self.name = name
+        self.keep = keep
+        self.options = options
+        self.preamble = preamble
+
+        self.block_size = 256
+        self.small_seq_count = 4
+
+        # compile eagerly to report errors early
+        self._get_func(self.block_size)
+
+        # stream (or None) -> (capacity, partials, counters)
+        self._workspaces = {}
+        self._stream_workspaces = weakref.WeakKeyDictionary()
+
+        # pointer/length tables of recently reduced sets of arrays
+        self._tables = {}
+
+    @memoize_method
+    def _get_func(self, block_size):
+        from pycuda.compiler import SourceModule
+
+        warp_shuffle = use_warp_shuffle(self.dtype_out, block_size)
+        if warp_shuffle:
+            block_reduction = SHUFFLE_BLOCK_REDUCTION_SOURCE % {
+                    "neutral": self.neutral}
+            preamble = SHUFFLE_PREAMBLE_SOURCE + self.preamble
+            shared_size = (block_size // 32) * self.dtype_out.itemsize
+        else:
+            if self.dtype_out.fields is None:
+                block_reduction = BLOCK_REDUCTION_SOURCE
+            else:
+                block_reduction = SYNCED_BLOCK_REDUCTION_SOURCE
+            preamble = self.preamble
+            shared_size = block_size * self.dtype_out.itemsize
+
+        src = BATCHED_REDUCTION_SOURCE % {
+                "out_type": dtype_to_ctype(self.dtype_out),
+                "in_type": dtype_to_ctype(self.dtype_in),
+                "block_size": block_size,
+                "neutral": self.neutral,
+                "reduce_expr": self.reduce_expr,
+                "map_expr": self.map_expr,
+                "name": self.name,
+                "preamble": preamble,
+                "block_reduction": block_reduction,
+                "tail": SINGLE_LAUNCH_TAIL_SOURCE % {
+                    "neutral": self.neutral,
+                    "block_reduction": block_reduction,
+                    },
+                }
+
+        mod = SourceModule(src, options=self.options, keep=self.keep,
+                no_extern_c=True)
+        func = mod.get_function(self.name)
+        func.prepare("PPPIPP")
+        return func, shared_size
+
+    def _get_workspace(self, size, stream):
+        import pycuda.driver as drv
+
+        key = _get_stream_key(stream)
+        if key is None:
+            cache = self._workspaces
+        else:
+            cache = self._stream_workspaces
+
+        workspace = cache.get(key)
+        if workspace is None or workspace[0] < size:
+            capacity = max(size, 2*workspace[0] if workspace else 0)
+            counters = drv.mem_alloc(4*capacity)
+            drv.memset_d32(counters, 0, capacity)
+            workspace = (capacity,
+                    drv.mem_alloc(capacity*self.dtype_out.itemsize), counters)
+            cache[key] = workspace
+
+        return workspace
+
+    def _get_tables(self, arrays):
+        from pycuda.gpuarray import to_gpu
+
+        key = tuple((ary.ptr if ary.size else 0, ary.size) for ary in arrays)
+
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+
+        if len(self._tables) >= 16:
+            self._tables.clear()
+
+        pointers = np.array([ptr for ptr, _ in key], dtype=np.uintp)
+        lengths = np.array([size for _, size in key], dtype=np.uint32)
+
+        result = self._tables[key] = (
+                to_gpu(pointers), to_gpu(lengths), int(lengths.max()))
+        return result
+
+    def __call__(self, arrays, stream=None, allocator=None, out=None):
+        """Return a :class:`pycuda.gpuarray.GPUArray` with one entry for the
+        reduction of each of the contiguous arrays in the sequence *arrays*.
+        """
+        arrays = list(arrays)
+
+        for ary in arrays:
+            if ary.dtype != self.dtype_in:
+                raise TypeError("all arrays must have type %s"
+                        % self.dtype_in)
+            if not ary.flags.forc:
+                raise RuntimeError("BatchedReductionKernel cannot "
+                        "deal with non-contiguous arrays")
+
+        if allocator is None and arrays:
+            allocator = arrays[0].allocator
+
+        pointers, lengths, max_length = self._get_tables(arrays) \
+                if arrays else (None, None, 0)
+
+        # the kernel only sees the arrays through the pointer table
+        from pycuda.gpuarray import wait_for_access, record_access
+        wait_for_access(arrays, stream)
+        result = self.reduce_pointers(pointers, lengths, max_length,
+                stream=stream, allocator=allocator, out=out)
+        record_access(arrays, stream)
+
+        return result
+
+    def reduce_pointers(self, pointers, lengths, max_length=None,
+            stream=None, allocator=None, out=None):
+        """Like :meth:`__call__`, but take the arrays to be reduced from
+        the :class:`pycuda.gpuarray.GPUArray` instances *pointers*, holding
+        device addresses as :class:`numpy.uintp`, and *lengths*, holding
+        element counts as :class:`numpy.uint32`. *max_length*, the largest
+        of *lengths*, determines how many blocks work on each array. If not
+        given, it is read back from the device.
+        """
+        import pycuda.driver as drv
+        from pycuda.gpuarray import empty
+
+        array_count = 0 if pointers is None else pointers.size
+
+        if out is None:
+            out = empty((array_count,), self.dtype_out,
+                    allocator=allocator or drv.mem_alloc)
+        elif out.dtype != self.dtype_out or out.shape != (array_count,):
+            raise ValueError("out must have shape (%d,) and type %s"
+                    % (array_count, self.dtype_out))
+
+        if not array_count:
+            return out
+
+        if max_length is None:
+            from pycuda.gpuarray import max as gpu_max
+            max_length = int(gpu_max(lengths, stream=stream).get())
+
+        func, shared_size = self._get_func(self.block_size)
+
+        # Small arrays get a single block each. Large ones are split so
+        # that the device is filled.
+        dev = drv.Context.get_device()
+        max_blocks = 4*dev.get_attribute(
+                drv.device_attribute.MULTIPROCESSOR_COUNT)
+        chunk = self.block_size*self.small_seq_count
+        blocks_per_array = max(1, min(
+            (max_length + chunk - 1) // chunk,
+            max_blocks // min(array_count, max_blocks)))
+
+        grid_y = min(array_count, 65535)
+        _, partials, counters = self._get_workspace(
+                max(blocks_per_array*array_count, array_count), stream)
+
+        func.prepared_async_call(
+                (blocks_per_array, grid_y), (self.block_size, 1, 1), stream,
+                out, pointers, lengths, array_count,
+                partials, counters,
+                shared_size=shared_size)
+
+        return out
 
 
 
@@ -295,7 +925,19 @@ def get_sum_kernel(dtype_out, dtype_in):
         dtype_out = dtype_in
 
     return ReductionKernel(dtype_out, "0", "a+b",
-            arguments="const %(tp)s *in" % {"tp": dtype_to_ctype(dtype_in)})
+            arguments="const %(tp)s *in" % {"tp": dtype_to_ctype(dtype_in)},
+            single_launch=True)
+
+
+
+
+@context_dependent_memoize
+def get_batched_sum_kernel(dtype_out, dtype_in):
+    if dtype_out is None:
+        dtype_out = dtype_in
+
+    return BatchedReductionKernel(dtype_out, dtype_in, "0", "a+b",
+            name="batched_sum")
 
 
 
@@ -323,7 +965,7 @@ def get_dot_kernel(dtype_out, dtype_a, dtype_b):
             arguments="const %(tp_a)s *a, const %(tp_b)s *b" % {
                 "tp_a": dtype_to_ctype(dtype_a),
                 "tp_b": dtype_to_ctype(dtype_b),
-                }, keep=True)
+                }, keep=True, single_launch=True)
 
 
 
@@ -416,3 +1058,205 @@ def get_subset_minmax_kernel(what, dtype, dtype_subset):
             "tp": dtype_to_ctype(dtype),
             "tp_lut": dtype_to_ctype(dtype_subset),
             }, preamble="#define MY_INFINITY (1./0)")
+
+
+
+
+# {{{ struct-valued reductions
+
+def _get_struct_type_name(prefix, dtype):
+    return prefix + "_" + "".join(
+            c if c.isalnum() else "_" for c in dtype_to_ctype(dtype))
+
+
+ARG_MINMAX_PREAMBLE = """
+struct %(pair_type)s
+{
+    %(value_type)s value;
+    long long index;
+};
+
+__device__ %(pair_type)s %(pair_type)s_make(%(value_type)s value, long long index)
+{
+    %(pair_type)s result;
+    result.value = value;
+    result.index = index;
+    return result;
+}
+
+// Pairs with a negative index are neutral. Among equal values, and among
+// NaNs, which win over all other values, the smaller index wins, as in numpy.
+__device__ %(pair_type)s %(pair_type)s_combine(%(pair_type)s a, %(pair_type)s b)
+{
+    if (a.index < 0)
+        return b;
+    if (b.index < 0)
+        return a;
+
+    bool a_nan = a.value != a.value;
+    bool b_nan = b.value != b.value;
+    if (a_nan || b_nan)
+        return (a_nan && (!b_nan || a.index < b.index)) ? a : b;
+
+    if (a.value %(op)s b.value || (a.value == b.value && a.index < b.index))
+        return a;
+    else
+        return b;
+}
+"""
+
+
+def get_arg_minmax_pair_dtype(dtype):
+    """Return the struct dtype of (value, index) pairs used by
+    :func:`get_arg_minmax_kernel` and its C type name.
+    """
+    from pycuda.tools import get_or_register_dtype
+
+    dtype = np.dtype(dtype)
+    pair_type = _get_struct_type_name("arg_minmax_pair", dtype)
+    pair_dtype = np.dtype([("value", dtype), ("index", np.int64)], align=True)
+    get_or_register_dtype(pair_type, pair_dtype)
+    return pair_dtype, pair_type
+
+
+@context_dependent_memoize
+def get_arg_minmax_kernel(what, dtype):
+    """Return a kernel that finds the first (value, index) pair holding the
+    minimum or maximum (depending on *what*) of its argument *in*.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in "iuf":
+        raise TypeError("unsupported dtype specified")
+
+    if what == "min":
+        op = "<"
+    elif what == "max":
+        op = ">"
+    else:
+        raise ValueError("what is not min or max.")
+
+    pair_dtype, pair_type = get_arg_minmax_pair_dtype(dtype)
+
+    preamble = ARG_MINMAX_PREAMBLE % {
+            "pair_type": pair_type,
+            "value_type": dtype_to_ctype(dtype),
+            "op": op,
+            }
+
+    return ReductionKernel(pair_dtype,
+            neutral="%s_make(0, -1)" % pair_type,
+            reduce_expr="%s_combine(a, b)" % pair_type,
+            map_expr="%s_make(in[i], i)" % pair_type,
+            arguments="const %s *in" % dtype_to_ctype(dtype),
+            name="arg%s" % what, preamble=preamble, single_launch=True)
+
+
+@context_dependent_memoize
+def get_arg_minmax_index_kernel(dtype):
+    from pycuda.elementwise import get_elwise_kernel
+
+    pair_dtype, pair_type = get_arg_minmax_pair_dtype(dtype)
+    return get_elwise_kernel(
+            "long long *z, const %s *pair" % pair_type,
+            "z[z_i] = pair[pair_i].index",
+            "arg_minmax_index",
+            preamble="struct %s { %s value; long long index; };" % (
+                pair_type, dtype_to_ctype(dtype)))
+
+
+MOMENTS_PREAMBLE = """
+struct %(state_type)s
+{
+    %(acc_type)s count;
+    %(acc_type)s mean;
+    %(acc_type)s m2;
+};
+
+__device__ %(state_type)s %(state_type)s_make(
+        %(acc_type)s count, %(acc_type)s mean, %(acc_type)s m2)
+{
+    %(state_type)s result;
+    result.count = count;
+    result.mean = mean;
+    result.m2 = m2;
+    return result;
+}
+
+// Chan et al.'s pairwise update of Welford's running mean and sum of
+// squared deviations
+__device__ %(state_type)s %(state_type)s_combine(
+        %(state_type)s a, %(state_type)s b)
+{
+    %(acc_type)s count = a.count + b.count;
+    if (b.count == 0)
+        return a;
+    if (a.count == 0)
+        return b;
+
+    %(acc_type)s delta = b.mean - a.mean;
+    return %(state_type)s_make(count,
+        a.mean + delta * (b.count / count),
+        a.m2 + b.m2 + delta * delta * (a.count * b.count / count));
+}
+"""
+
+
+def get_moments_state_dtype(dtype_acc):
+    """Return the struct dtype of (count, mean, sum of squared deviations)
+    triples used by :func:`get_moments_kernel` and its C type name.
+    """
+    from pycuda.tools import get_or_register_dtype
+
+    dtype_acc = np.dtype(dtype_acc)
+    state_type = _get_struct_type_name("moments_state", dtype_acc)
+    state_dtype = np.dtype(
+            [("count", dtype_acc), ("mean", dtype_acc), ("m2", dtype_acc)],
+            align=True)
+    get_or_register_dtype(state_type, state_dtype)
+    return state_dtype, state_type
+
+
+@context_dependent_memoize
+def get_moments_kernel(dtype_acc, dtype_in):
+    """Return a kernel that computes the count, mean and sum of squared
+    deviations from the mean of its argument *in* in a single pass, with
+    accumulation in *dtype_acc*.
+    """
+    state_dtype, state_type = get_moments_state_dtype(dtype_acc)
+    acc_type = dtype_to_ctype(dtype_acc)
+
+    preamble = MOMENTS_PREAMBLE % {
+            "state_type": state_type,
+            "acc_type": acc_type,
+            }
+
+    return ReductionKernel(state_dtype,
+            neutral="%s_make(0, 0, 0)" % state_type,
+            reduce_expr="%s_combine(a, b)" % state_type,
+            map_expr="%s_make(1, (%s) in[i], 0)" % (state_type, acc_type),
+            arguments="const %s *in" % dtype_to_ctype(dtype_in),
+            name="moments", preamble=preamble, single_launch=True)
+
+
+@context_dependent_memoize
+def get_moments_finish_kernel(dtype_acc):
+    from pycuda.elementwise import get_elwise_kernel
+
+    state_dtype, state_type = get_moments_state_dtype(dtype_acc)
+    acc_type = dtype_to_ctype(dtype_acc)
+    return get_elwise_kernel(
+            "%(tp)s *mean, %(tp)s *var, const %(state)s *state, %(tp)s ddof" % {
+                "tp": acc_type,
+                "state": state_type,
+                },
+            "mean[mean_i] = state[state_i].mean; "
+            "var[var_i] = state[state_i].m2 / (state[state_i].count - ddof)",
+            "moments_finish",
+            preamble="struct %(state)s { %(tp)s count, mean, m2; };" % {
+                "tp": acc_type,
+                "state": state_type,
+                })
+
+# }}}
+
+# vim: foldmethod=marker
@@ -30,12 +30,16 @@ Derived from code within the Thrust project, https://github.com/thrust/thrust/
 
 
 
+import weakref
+
 import numpy as np
 
 import pycuda.driver as driver
 import pycuda.gpuarray as gpuarray
 from pycuda.compiler import SourceModule
-from pycuda.tools import dtype_to_ctype
+from pycuda.tools import (dtype_to_ctype, context_dependent_memoize,
+        _get_stream_key)
+from pytools import memoize_method
 import pycuda._mymako as mako
 from pycuda._cluda import CLUDA_PREAMBLE
 
@@ -54,9 +58,7 @@ typedef ${scan_type} scan_type;
 
 
 
-SCAN_INTERVALS_SOURCE = mako.template.Template(SHARED_PREAMBLE + """//CL//
-#define K ${wg_seq_batches}
-
+GROUP_SCAN_SOURCE = """//CL//
 <%def name="make_group_scan(name, with_bounds_check)">
     WITHIN_KERNEL
     void ${name}(LOCAL_MEM_ARG scan_type *array
@@ -91,6 +93,14 @@ SCAN_INTERVALS_SOURCE = mako.template.Template(SHARED_PREAMBLE + """//CL//
 
 ${make_group_scan("scan_group", False)}
 ${make_group_scan("scan_group_n", True)}
+"""
+
+
+
+
+SCAN_INTERVALS_SOURCE = mako.template.Template(SHARED_PREAMBLE + """//CL//
+#define K ${wg_seq_batches}
+""" + GROUP_SCAN_SOURCE + """
 
 KERNEL
 REQD_WG_SIZE(WG_SIZE, 1, 1)
@@ -342,48 +352,438 @@ void ${name_prefix}_final_update(
 
 
 
+SINGLE_PASS_SOURCE = mako.template.Template(SHARED_PREAMBLE + """//CL//
+#define K ${wg_seq_batches}
+
+#define TILE_INVALID 0
+#define TILE_AGGREGATE_AVAILABLE 1
+#define TILE_PREFIX_AVAILABLE 2
+""" + GROUP_SCAN_SOURCE + """
+
+// Read a value published by another block, bypassing non-coherent caches.
+WITHIN_KERNEL
+scan_type load_published(GLOBAL_MEM const scan_type *p)
+{
+    scan_type result;
+    % if scan_type_size % 4 == 0:
+    volatile const unsigned int *src = (volatile const unsigned int *) p;
+    unsigned int *dest = (unsigned int *) &result;
+    for (unsigned int k = 0; k < ${scan_type_size // 4}; ++k)
+        dest[k] = src[k];
+    % else:
+    volatile const unsigned char *src = (volatile const unsigned char *) p;
+    unsigned char *dest = (unsigned char *) &result;
+    for (unsigned int k = 0; k < ${scan_type_size}; ++k)
+        dest[k] = src[k];
+    % endif
+    return result;
+}
+
+KERNEL
+REQD_WG_SIZE(WG_SIZE, 1, 1)
+void ${name_prefix}_single_pass(
+    GLOBAL_MEM scan_type *input,
+    GLOBAL_MEM scan_type *output,
+    const unsigned int N,
+    const unsigned int num_tiles,
+    GLOBAL_MEM unsigned int *tile_counter,
+    GLOBAL_MEM unsigned int *tile_flags,
+    GLOBAL_MEM scan_type *tile_aggregates,
+    GLOBAL_MEM scan_type *tile_prefixes)
+{
+    // Tiles are processed in the order in which blocks claim them from
+    // tile_counter, so that each tile only waits (in the look-back below)
+    // for tiles that have already been claimed by running blocks.
+
+    LOCAL_MEM scan_type ldata[K + 1][WG_SIZE + 1];
+    LOCAL_MEM unsigned int tile_shared;
+    LOCAL_MEM scan_type tile_prefix_shared;
+
+    const unsigned int tile_size = K * WG_SIZE;
+
+    while (true)
+    {
+        if (LID_0 == 0)
+            tile_shared = atomicAdd(tile_counter, 1);
+        local_barrier();
+
+        const unsigned int tile = tile_shared;
+        if (tile >= num_tiles)
+            return;
+
+        const unsigned int tile_base = tile * tile_size;
+        const unsigned int tile_count = min(tile_size, N - tile_base);
+
+        // read tile
+        for (unsigned int k = 0; k < K; k++)
+        {
+            const unsigned int offset = k*WG_SIZE + LID_0;
+            if (offset < tile_count)
+                ldata[offset % K][offset / K] = input[tile_base + offset];
+        }
+
+        local_barrier();
+
+        // scan along k (sequentially in each work item)
+        scan_type sum = ldata[0][LID_0];
+        for (unsigned int k = 1; k < K; k++)
+        {
+            if (K * LID_0 + k < tile_count)
+            {
+                scan_type tmp = ldata[k][LID_0];
+                sum = SCAN_EXPR(sum, tmp);
+                ldata[k][LID_0] = sum;
+            }
+        }
+
+        ldata[K][LID_0] = sum;
+        local_barrier();
+
+        // tree-based parallel scan along local id
+        if (tile_count == tile_size)
+            scan_group(&ldata[K][0]);
+        else
+            scan_group_n(&ldata[K][0], (tile_count + K - 1) / K);
+
+        // update local values
+        if (LID_0 > 0)
+        {
+            sum = ldata[K][LID_0 - 1];
+
+            for (unsigned int k = 0; k < K; k++)
+            {
+                if (K * LID_0 + k < tile_count)
+                {
+                    scan_type tmp = ldata[k][LID_0];
+                    ldata[k][LID_0] = SCAN_EXPR(sum, tmp);
+                }
+            }
+        }
+
+        local_barrier();
+
+        // decoupled look-back
+        if (LID_0 == 0)
+        {
+            const unsigned int last = tile_count - 1;
+            scan_type aggregate = ldata[last % K][last / K];
+
+            if (tile == 0)
+            {
+                tile_prefixes[0] = aggregate;
+                __threadfence();
+                ((volatile unsigned int *) tile_flags)[0] =
+                    TILE_PREFIX_AVAILABLE;
+            }
+            else
+            {
+                tile_aggregates[tile] = aggregate;
+                __threadfence();
+                ((volatile unsigned int *) tile_flags)[tile] =
+                    TILE_AGGREGATE_AVAILABLE;
+
+                unsigned int pred = tile - 1;
+                scan_type prefix;
+                bool have_prefix = false;
+
+                while (true)
+                {
+                    unsigned int flag;
+                    do
+                        flag = ((volatile unsigned int *) tile_flags)[pred];
+                    while (flag == TILE_INVALID);
+
+                    __threadfence();
+
+                    scan_type value = load_published(
+                        flag == TILE_PREFIX_AVAILABLE
+                        ? tile_prefixes + pred : tile_aggregates + pred);
+
+                    if (have_prefix)
+                        prefix = SCAN_EXPR(value, prefix);
+                    else
+                        prefix = value;
+                    have_prefix = true;
+
+                    if (flag == TILE_PREFIX_AVAILABLE)
+                        break;
+
+                    --pred;
+                }
+
+                tile_prefixes[tile] = SCAN_EXPR(prefix, aggregate);
+                __threadfence();
+                ((volatile unsigned int *) tile_flags)[tile] =
+                    TILE_PREFIX_AVAILABLE;
+
+                tile_prefix_shared = prefix;
+            }
+        }
+
+        local_barrier();
+
+        // write tile
+        for (unsigned int k = 0; k < K; k++)
+        {
+            const unsigned int offset = k*WG_SIZE + LID_0;
+
+            if (offset < tile_count)
+            {
+            % if exclusive:
+                scan_type val;
+                if (offset == 0)
+                {
+                    if (tile == 0)
+                        val = ${neutral};
+                    else
+                        val = tile_prefix_shared;
+                }
+                else
+                {
+                    const unsigned int prev = offset - 1;
+                    val = ldata[prev % K][prev / K];
+                    if (tile != 0)
+                        val = SCAN_EXPR(tile_prefix_shared, val);
+                }
+            % else:
+                scan_type val = ldata[offset % K][offset / K];
+                if (tile != 0)
+                    val = SCAN_EXPR(tile_prefix_shared, val);
+            % endif
+                output[tile_base + offset] = val;
+            }
+        }
+
+        // ldata and tile_shared are reused by the next tile
+        local_barrier();
+    }
+}
+""", strict_undefined=True)
+
+
+
+
+@context_dependent_memoize
+def _get_zero_fill_kernel():
+    from pycuda.elementwise import get_elwise_kernel
+    return get_elwise_kernel("unsigned int *a", "a[i] = 0", "zero_fill")
+
+
 class _ScanKernelBase(object):
     def __init__(self, dtype,
             scan_expr, neutral=None,
-            name_prefix="scan", options=[], preamble="", devices=None):
+            name_prefix="scan", options=[], preamble="", devices=None,
+            single_pass=False):
 
         if isinstance(self, ExclusiveScanKernel) and neutral is None:
             raise ValueError("neutral element is required for exclusive scan")
 
         dtype = self.dtype = np.dtype(dtype)
         self.neutral = neutral
+        self.name_prefix = name_prefix
+        self.options = options
 
-        # Thrust says these are good for GT200
+        # Thrust says these are good for GT200. They are only defaults,
+        # superseded by entries in the tuning database (see
+        # pycuda.autotune).
         self.scan_wg_size = 128
         self.update_wg_size = 256
         self.scan_wg_seq_batches = 6
 
-        kw_values = dict(
+        self.kw_values = dict(
             preamble=preamble,
             name_prefix=name_prefix,
             scan_type=dtype_to_ctype(dtype),
             scan_expr=scan_expr,
             neutral=neutral)
 
+        self.scan_intervals_knl = self._get_scan_intervals_kernel(
+                self.scan_wg_size, self.scan_wg_seq_batches)
+        self.final_update_knl = self._get_final_update_kernel(
+                self.update_wg_size)
+
+        self.single_pass = single_pass
+        if single_pass:
+            self.single_pass_wg_size = 256
+            # as many items per work item as fit into 32K of shared memory
+            self.single_pass_seq_batches = max(1, min(8,
+                32768 // ((self.single_pass_wg_size+1)*dtype.itemsize) - 1))
+
+            self.single_pass_knl = self._get_single_pass_kernel(
+                    self.single_pass_wg_size, self.single_pass_seq_batches)
+
+            # stream (or None) -> (tile capacity, flags, aggregates, prefixes)
+            self._tile_state = {}
+            self._stream_tile_state = weakref.WeakKeyDictionary()
+
+    # {{{ kernel generation
+
+    @memoize_method
+    def _get_scan_intervals_kernel(self, wg_size, wg_seq_batches):
         scan_intervals_src = str(SCAN_INTERVALS_SOURCE.render(
-            wg_size=self.scan_wg_size,
-            wg_seq_batches=self.scan_wg_seq_batches,
-            **kw_values))
+            wg_size=wg_size,
+            wg_seq_batches=wg_seq_batches,
+            **self.kw_values))
         scan_intervals_prg = SourceModule(
-                scan_intervals_src, options=options, no_extern_c=True)
-        self.scan_intervals_knl = scan_intervals_prg.get_function(
-                name_prefix+"_scan_intervals")
-        self.scan_intervals_knl.prepare("PIIPP")
-
+                scan_intervals_src, options=self.options, no_extern_c=True)
+        knl = scan_intervals_prg.get_function(
+                self.name_prefix+"_scan_intervals")
+        knl.prepare("PIIPP")
+        return knl
+
+    @memoize_method
+    def _get_final_update_kernel(self, wg_size):
         final_update_src = str(self.final_update_tp.render(
-            wg_size=self.update_wg_size,
-            **kw_values))
+            wg_size=wg_size,
+            **self.kw_values))
 
         final_update_prg = SourceModule(
-                final_update_src, options=options, no_extern_c=True)
-        self.final_update_knl = final_update_prg.get_function(
-                name_prefix+"_final_update")
-        self.final_update_knl.prepare("PIIP")
+                final_update_src, options=self.options, no_extern_c=True)
+        knl = final_update_prg.get_function(
+                self.name_prefix+"_final_update")
+        knl.prepare("PIIP")
+        return knl
+
+    @memoize_method
+    def _get_single_pass_kernel(self, wg_size, wg_seq_batches):
+        single_pass_src = str(SINGLE_PASS_SOURCE.render(
+            wg_size=wg_size,
+            wg_seq_batches=wg_seq_batches,
+            scan_type_size=self.dtype.itemsize,
+            exclusive=isinstance(self, ExclusiveScanKernel),
+            **self.kw_values))
+        single_pass_prg = SourceModule(
+                single_pass_src, options=self.options, no_extern_c=True)
+        knl = single_pass_prg.get_function(
+                self.name_prefix+"_single_pass")
+        knl.prepare("PPIIPPPP")
+        return knl
+
+    # }}}
+
+    # {{{ tuning
+
+    def _get_tuning_family(self):
+        if self.single_pass:
+            return "scan_single_pass:"+self.name_prefix
+        else:
+            return "scan:"+self.name_prefix
+
+    def _get_default_config(self):
+        if self.single_pass:
+            return dict(
+                    single_pass_wg_size=self.single_pass_wg_size,
+                    single_pass_seq_batches=self.single_pass_seq_batches)
+        else:
+            return dict(
+                    scan_wg_size=self.scan_wg_size,
+                    update_wg_size=self.update_wg_size,
+                    scan_wg_seq_batches=self.scan_wg_seq_batches)
+
+    def get_tuning_candidates(self):
+        """Return the launch configurations considered by :meth:`autotune`."""
+        from pycuda.autotune import parameter_space
+
+        dev = driver.Context.get_device()
+        max_threads = dev.get_attribute(
+                driver.device_attribute.MAX_THREADS_PER_BLOCK)
+        shared_memory = dev.get_attribute(
+                driver.device_attribute.MAX_SHARED_MEMORY_PER_BLOCK)
+
+        def fits(wg_size, seq_batches):
+            # size of ldata, plus some slack for the remaining variables
+            return (wg_size <= max_threads
+                    and (seq_batches+1)*(wg_size+1)*self.dtype.itemsize
+                    + 64 <= shared_memory)
+
+        if self.single_pass:
+            return [config for config in parameter_space(
+                    single_pass_wg_size=[128, 256, 512],
+                    single_pass_seq_batches=[4, 8, 12, 16])
+                if fits(config["single_pass_wg_size"],
+                    config["single_pass_seq_batches"])]
+        else:
+            return [config for config in parameter_space(
+                    scan_wg_size=[128, 256, 512],
+                    update_wg_size=[256, 512],
+                    scan_wg_seq_batches=[4, 6, 8, 12])
+                if fits(config["scan_wg_size"], config["scan_wg_seq_batches"])
+                and config["update_wg_size"] <= max_threads]
+
+    def autotune(self, input_ary, allocator=None, stream=None):
+        """Find the fastest launch configuration for scanning arrays like
+        *input_ary* on the current device, and store it in the tuning
+        database (see :mod:`pycuda.autotune`) for arrays of similar size.
+        *input_ary* is not modified. Returns the configuration.
+        """
+        from pycuda.autotune import tune
+
+        allocator = allocator or input_ary.allocator
+        n, = input_ary.shape
+        output_ary = gpuarray.GPUArray(input_ary.shape, input_ary.dtype,
+                allocator=allocator)
+
+        def run(config):
+            self._launch(input_ary, output_ary, n, config, allocator, stream)
+
+        return tune(self._get_tuning_family(), self.dtype, n,
+                self.get_tuning_candidates(), run, stream=stream)
+
+    # }}}
+
+    def _get_tile_state(self, num_tiles, stream):
+        key = _get_stream_key(stream)
+        if key is None:
+            cache = self._tile_state
+        else:
+            cache = self._stream_tile_state
+
+        state = cache.get(key)
+        if state is None or state[0] < num_tiles:
+            # grow geometrically to avoid reallocating for slowly
+            # increasing sizes
+            capacity = max(num_tiles, 2*state[0] if state else 0)
+            state = (capacity,
+                    driver.mem_alloc(4*(1+capacity)),
+                    driver.mem_alloc(self.dtype.itemsize*capacity),
+                    driver.mem_alloc(self.dtype.itemsize*capacity))
+            cache[key] = state
+
+        return state
+
+    def _single_pass_call(self, input_ary, output_ary, n, config, stream):
+        wg_size = config["single_pass_wg_size"]
+        tile_size = wg_size * config["single_pass_seq_batches"]
+        num_tiles = (n + tile_size - 1) // tile_size
+
+        dev = driver.Context.get_device()
+        max_groups = 4*dev.get_attribute(
+                driver.device_attribute.MULTIPROCESSOR_COUNT)
+        num_groups = min(num_tiles, max_groups)
+
+        _, status, aggregates, prefixes = self._get_tile_state(
+                num_tiles, stream)
+
+        # The status buffer starts with the tile counter, followed by one
+        # flag per tile. Reusing it across calls on the same stream is safe,
+        # since the reset is ordered after the previous scan. It is reset
+        # by a kernel rather than a memset, so that it is part of launch
+        # recordings.
+        reset_knl = _get_zero_fill_kernel()
+        grid, block = gpuarray.splay(1+num_tiles)
+        reset_knl.prepared_async_call(grid, block, stream,
+                status, 1+num_tiles)
+
+        knl = self._get_single_pass_kernel(
+                wg_size, config["single_pass_seq_batches"])
+        knl.prepared_async_call(
+                (num_groups, 1), (wg_size, 1, 1), stream,
+                input_ary, output_ary,
+                n, num_tiles,
+                status, int(status)+4,
+                aggregates, prefixes)
+
+        return output_ary
 
     def __call__(self, input_ary, output_ary=None, allocator=None,
             stream=None):
@@ -393,7 +793,8 @@ class _ScanKernelBase(object):
             output_ary = input_ary
 
         if isinstance(output_ary, (str, six.text_type)) and output_ary == "new":
-            output_ary = gpuarray.empty_like(input_ary, allocator=allocator)
+            output_ary = gpuarray.GPUArray(input_ary.shape, input_ary.dtype,
+                    allocator=allocator)
 
         if input_ary.shape != output_ary.shape:
             raise ValueError("input and output must have the same shape")
@@ -407,7 +808,28 @@ class _ScanKernelBase(object):
         if not n:
             return output_ary
 
-        unit_size  = self.scan_wg_size * self.scan_wg_seq_batches
+        from pycuda.autotune import get_parameters
+        config = get_parameters(self._get_tuning_family(), self.dtype, n,
+                self._get_default_config(),
+                lambda: self.autotune(input_ary, allocator, stream))
+
+        return self._launch(input_ary, output_ary, n, config, allocator,
+                stream)
+
+    def _launch(self, input_ary, output_ary, n, config, allocator, stream):
+        if self.single_pass:
+            return self._single_pass_call(input_ary, output_ary, n, config,
+                    stream)
+
+        scan_wg_size = config["scan_wg_size"]
+        update_wg_size = config["update_wg_size"]
+        scan_wg_seq_batches = config["scan_wg_seq_batches"]
+
+        scan_intervals_knl = self._get_scan_intervals_kernel(
+                scan_wg_size, scan_wg_seq_batches)
+        final_update_knl = self._get_final_update_kernel(update_wg_size)
+
+        unit_size  = scan_wg_size * scan_wg_seq_batches
         dev = driver.Context.get_device()
         max_groups = 3*dev.get_attribute(
                 driver.device_attribute.MULTIPROCESSOR_COUNT)
@@ -420,25 +842,25 @@ class _ScanKernelBase(object):
         dummy_results = allocator(self.dtype.itemsize)
 
         # first level scan of interval (one interval per block)
-        self.scan_intervals_knl.prepared_async_call(
-                (num_groups, 1), (self.scan_wg_size, 1, 1), stream,
-                input_ary.gpudata,
+        scan_intervals_knl.prepared_async_call(
+                (num_groups, 1), (scan_wg_size, 1, 1), stream,
+                input_ary,
                 n, interval_size,
-                output_ary.gpudata,
+                output_ary,
                 block_results)
 
         # second level inclusive scan of per-block results
-        self.scan_intervals_knl.prepared_async_call(
-                (1,1), (self.scan_wg_size, 1, 1), stream,
+        scan_intervals_knl.prepared_async_call(
+                (1,1), (scan_wg_size, 1, 1), stream,
                 block_results,
                 num_groups, interval_size,
                 block_results,
                 dummy_results)
 
         # update intervals with result of second level scan
-        self.final_update_knl.prepared_async_call(
-                (num_groups, 1,), (self.update_wg_size, 1, 1), stream,
-                output_ary.gpudata,
+        final_update_knl.prepared_async_call(
+                (num_groups, 1,), (update_wg_size, 1, 1), stream,
+                output_ary,
                 n, interval_size,
                 block_results)
 
@@ -452,3 +874,306 @@ class InclusiveScanKernel(_ScanKernelBase):
 
 class ExclusiveScanKernel(_ScanKernelBase):
     final_update_tp = EXCLUSIVE_UPDATE_SOURCE
+
+
+
+
+# {{{ segmented scan
+
+SEGMENTED_PAIR_PREAMBLE = """
+typedef ${value_type} seg_value_type;
+
+struct ${pair_type}
+{
+    seg_value_type value;
+    unsigned int flag;
+};
+"""
+
+SEGMENTED_COMBINE_SOURCE = """
+__device__ seg_value_type ${name_prefix}_op(seg_value_type a, seg_value_type b)
+{
+    return ${scan_expr};
+}
+
+// (flag_a, a) + (flag_b, b) = (flag_a | flag_b, flag_b ? b : a+b),
+// which is associative if + is.
+__device__ ${pair_type} ${name_prefix}_combine(${pair_type} a, ${pair_type} b)
+{
+    ${pair_type} result;
+    result.flag = a.flag | b.flag;
+    result.value = b.flag ? b.value : ${name_prefix}_op(a.value, b.value);
+    return result;
+}
+"""
+
+SEGMENTED_PACK_SOURCE = mako.template.Template(SEGMENTED_PAIR_PREAMBLE + """
+${preamble}
+
+% if flag_type is not None:
+typedef ${flag_type} flag_type;
+#define IS_HEAD(i) (i == 0 || flags[i] != 0)
+% else:
+typedef unsigned char flag_type;
+#define IS_HEAD(i) (i % segment_length == 0)
+% endif
+
+__global__ void ${name_prefix}_pack(
+    const seg_value_type *input, const flag_type *flags,
+    ${pair_type} *pairs, unsigned int segment_length, unsigned int n)
+{
+    for (unsigned int i = blockIdx.x*blockDim.x + threadIdx.x;
+            i < n; i += gridDim.x*blockDim.x)
+    {
+        ${pair_type} pair;
+        pair.value = input[i];
+        pair.flag = IS_HEAD(i);
+        pairs[i] = pair;
+    }
+}
+
+__global__ void ${name_prefix}_unpack(
+    const ${pair_type} *pairs, const flag_type *flags,
+    seg_value_type *output, unsigned int segment_length, unsigned int n)
+{
+    for (unsigned int i = blockIdx.x*blockDim.x + threadIdx.x;
+            i < n; i += gridDim.x*blockDim.x)
+    {
+    % if exclusive:
+        output[i] = IS_HEAD(i) ? (seg_value_type) (${neutral})
+            : pairs[i-1].value;
+    % else:
+        output[i] = pairs[i].value;
+    % endif
+    }
+}
+""", strict_undefined=True)
+
+
+def _get_pair_dtype(value_dtype):
+    from pycuda.tools import get_or_register_dtype
+
+    value_ctype = dtype_to_ctype(value_dtype)
+    pair_type = "segmented_scan_pair_" + "".join(
+            c if c.isalnum() else "_" for c in value_ctype)
+    pair_dtype = np.dtype([("value", value_dtype), ("flag", np.uint32)],
+            align=True)
+    get_or_register_dtype(pair_type, pair_dtype)
+    return pair_dtype, pair_type
+
+
+@context_dependent_memoize
+def _get_offsets_to_flags_kernel(offset_dtype):
+    from pycuda.elementwise import get_elwise_kernel
+    return get_elwise_kernel(
+            "unsigned char *flags, const %s *offsets"
+            % dtype_to_ctype(offset_dtype),
+            "flags[offsets[i]] = 1",
+            "offsets_to_flags")
+
+
+@context_dependent_memoize
+def _get_axis_last_copy_kernel(dtype, ndim, gather):
+    from pycuda.elementwise import get_elwise_kernel
+
+    ctype = dtype_to_ctype(dtype)
+    arguments = ", ".join(
+            ["%s *dst" % ctype, "const %s *src" % ctype]
+            + ["unsigned int d%d" % k for k in range(ndim)]
+            + ["long s%d" % k for k in range(ndim)])
+
+    # i indexes the contiguous array, offset the strided one
+    operation = ["unsigned int rest = i", "long offset = 0"]
+    for k in reversed(range(ndim)):
+        operation.append("offset += (rest %% d%d) * s%d" % (k, k))
+        operation.append("rest /= d%d" % k)
+    operation.append(
+            "dst[i] = src[offset]" if gather else "dst[offset] = src[i]")
+
+    return get_elwise_kernel(arguments, "; ".join(operation),
+            "gather_axis_last" if gather else "scatter_axis_last")
+
+
+def _copy_axis_last(dst, src, axes, gather, stream):
+    """Copy between an N-dimensional array with arbitrary strides and a
+    contiguous one-dimensional array holding its elements in C order with
+    the axes permuted by *axes*. If *gather* is true, *src* is the
+    N-dimensional array, otherwise *dst* is.
+    """
+    strided, flat = (src, dst) if gather else (dst, src)
+
+    shape = [strided.shape[k] for k in axes]
+    strides = [strided.strides[k] // strided.dtype.itemsize for k in axes]
+
+    func = _get_axis_last_copy_kernel(strided.dtype, len(axes), gather)
+    func.prepared_async_call(flat._grid, flat._block, stream,
+            dst, src, *(shape + strides + [flat.size]))
+
+
+class SegmentedScanKernel(object):
+    """A scan that restarts at the beginning of each segment of its input.
+
+    Segments are given either by head flags, by an array of segment
+    start offsets, or implicitly as the rows along an axis of an
+    N-dimensional array. The whole array is scanned in one sequence of
+    launches regardless of the number of segments, by scanning pairs of
+    (head flag, value) with an operator that discards the running value at
+    segment heads.
+    """
+
+    def __init__(self, dtype, scan_expr, neutral, exclusive=False,
+            name_prefix="segmented_scan", options=[], preamble=""):
+        self.dtype = dtype = np.dtype(dtype)
+        self.scan_expr = scan_expr
+        self.neutral = neutral
+        self.exclusive = exclusive
+        self.name_prefix = name_prefix
+        self.options = options
+        self.preamble = preamble
+
+        self.pair_dtype, self.pair_type = _get_pair_dtype(dtype)
+
+        kw_values = dict(
+                value_type=dtype_to_ctype(dtype),
+                pair_type=self.pair_type,
+                name_prefix=name_prefix,
+                scan_expr=scan_expr)
+
+        self.pair_scan = InclusiveScanKernel(self.pair_dtype,
+                "%s_combine(a, b)" % name_prefix,
+                name_prefix=name_prefix,
+                options=options,
+                preamble=str(mako.template.Template(
+                    SEGMENTED_PAIR_PREAMBLE
+                    + "${preamble}"
+                    + SEGMENTED_COMBINE_SOURCE).render(
+                        preamble=preamble, **kw_values)))
+
+    @memoize_method
+    def _get_pack_kernels(self, flag_dtype):
+        src = str(SEGMENTED_PACK_SOURCE.render(
+            value_type=dtype_to_ctype(self.dtype),
+            pair_type=self.pair_type,
+            flag_type=(dtype_to_ctype(flag_dtype)
+                if flag_dtype is not None else None),
+            name_prefix=self.name_prefix,
+            preamble=self.preamble,
+            neutral=self.neutral,
+            exclusive=self.exclusive))
+
+        mod = SourceModule(src, options=self.options)
+
+        pack_knl = mod.get_function(self.name_prefix+"_pack")
+        pack_knl.prepare("PPPII")
+        unpack_knl = mod.get_function(self.name_prefix+"_unpack")
+        unpack_knl.prepare("PPPII")
+        return pack_knl, unpack_knl
+
+    def __call__(self, input_ary, output_ary=None, segment_flags=None,
+            segment_offsets=None, axis=None, allocator=None, stream=None):
+        allocator = allocator or input_ary.allocator
+
+        if output_ary is None:
+            output_ary = input_ary
+
+        if isinstance(output_ary, (str, six.text_type)) and output_ary == "new":
+            output_ary = gpuarray.GPUArray(input_ary.shape, self.dtype,
+                    allocator=allocator)
+
+        if input_ary.shape != output_ary.shape:
+            raise ValueError("input and output must have the same shape")
+        if input_ary.dtype != self.dtype or output_ary.dtype != self.dtype:
+            raise TypeError("input and output must be of type '%s'"
+                    % self.dtype)
+
+        if sum(x is not None
+                for x in [segment_flags, segment_offsets, axis]) != 1:
+            raise ValueError("exactly one of segment_flags, segment_offsets "
+                    "and axis must be given")
+
+        if not input_ary.size:
+            return output_ary
+
+        segment_length = 0
+        flags = None
+        axes = None
+        scratch = None
+
+        if axis is not None:
+            ndim = len(input_ary.shape)
+            if axis < 0:
+                axis += ndim
+            if not 0 <= axis < ndim:
+                raise ValueError("axis out of range")
+
+            segment_length = input_ary.shape[axis]
+
+            axes = [i for i in range(ndim) if i != axis] + [axis]
+            if axis == ndim - 1 and input_ary.flags.c_contiguous:
+                ary = input_ary.reshape(input_ary.size)
+            else:
+                # scan rows of a C-contiguous copy with the scan axis last
+                ary = gpuarray.GPUArray(input_ary.size, self.dtype,
+                        allocator=allocator)
+                _copy_axis_last(ary, input_ary, axes, True, stream)
+                scratch = ary
+        else:
+            if len(input_ary.shape) != 1:
+                raise ValueError("segment_flags and segment_offsets "
+                        "require one-dimensional arrays (use axis "
+                        "for N-dimensional ones)")
+            if not (input_ary.flags.forc and output_ary.flags.forc):
+                raise RuntimeError("SegmentedScanKernel cannot "
+                        "deal with non-contiguous arrays")
+            ary = input_ary
+
+            if segment_offsets is not None:
+                flags = gpuarray.zeros(ary.shape, np.uint8,
+                        allocator=allocator)
+                if segment_offsets.size:
+                    func = _get_offsets_to_flags_kernel(segment_offsets.dtype)
+                    func.prepared_async_call(
+                            segment_offsets._grid, segment_offsets._block,
+                            stream, flags, segment_offsets,
+                            segment_offsets.size)
+            else:
+                if segment_flags.shape != ary.shape:
+                    raise ValueError("segment_flags must have the same "
+                            "shape as the input")
+                if not segment_flags.flags.forc:
+                    raise RuntimeError("SegmentedScanKernel cannot "
+                            "deal with non-contiguous flags")
+                flags = segment_flags
+
+        pack_knl, unpack_knl = self._get_pack_kernels(
+                flags.dtype if flags is not None else None)
+        flags_arg = flags if flags is not None else 0
+
+        n = ary.size
+        pairs = gpuarray.GPUArray(n, self.pair_dtype, allocator=allocator)
+
+        pack_knl.prepared_async_call(ary._grid, ary._block, stream,
+                ary, flags_arg, pairs, segment_length, n)
+        self.pair_scan(pairs, allocator=allocator, stream=stream)
+
+        if axes is None or (
+                axis == ndim - 1 and output_ary.flags.c_contiguous):
+            unpack_knl.prepared_async_call(ary._grid, ary._block, stream,
+                    pairs, flags_arg, output_ary,
+                    segment_length, n)
+        else:
+            # unpack into scratch space, then scatter into the output
+            if scratch is None:
+                scratch = gpuarray.GPUArray(n, self.dtype,
+                        allocator=allocator)
+
+            unpack_knl.prepared_async_call(ary._grid, ary._block, stream,
+                    pairs, flags_arg, scratch,
+                    segment_length, n)
+            _copy_axis_last(output_ary, scratch, axes, False, stream)
+
+        return output_ary
+
+# }}}
+
+# vim: foldmethod=marker
@@ -35,6 +35,7 @@ import pycuda.driver as cuda
 from decorator import decorator
 import pycuda._driver as _drv
 import numpy as np
+import threading
 
 
 bitlog2 = _drv.bitlog2
@@ -444,6 +445,480 @@ def clear_context_caches():
 
 # }}}
 
+# {{{ stream and event pools
+
+class _DriverObjectPool(object):
+    def __init__(self, flags, max_size):
+        self.flags = flags
+        self.max_size = max_size
+        self._idle = []
+
+    def get(self):
+        """Return an idle object, creating one if none is available."""
+        try:
+            return self._idle.pop()
+        except IndexError:
+            return self._create()
+
+    def put(self, obj):
+        """Return *obj* for reuse. It is dropped if :attr:`max_size`
+        objects are idle already.
+        """
+        if len(self._idle) < self.max_size:
+            self._idle.append(obj)
+
+    def clear(self):
+        """Drop all idle objects."""
+        del self._idle[:]
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+
+class StreamPool(_DriverObjectPool):
+    """Keeps up to *max_size* idle :class:`pycuda.driver.Stream` instances
+    created with *flags*, so that code needing a stream for a short while
+    does not create and destroy one each time.
+
+    A stream may be returned with work still pending on it. Work enqueued
+    on it by its next user is then ordered after that work.
+
+    All streams of a pool belong to the same context. Use
+    :func:`get_stream_pool` to obtain the pool of the current context.
+    """
+
+    def __init__(self, flags=0, max_size=16):
+        _DriverObjectPool.__init__(self, flags, max_size)
+
+    def _create(self):
+        return cuda.Stream(self.flags)
+
+
+class EventPool(_DriverObjectPool):
+    """Keeps up to *max_size* idle :class:`pycuda.driver.Event` instances
+    created with *flags* (see :class:`pycuda.driver.event_flags`).
+
+    An event may only be returned once nothing will query it, synchronize
+    with it or enqueue a wait for it any more, since its next user records
+    it again. (Waits enqueued by :meth:`pycuda.driver.Stream.wait_for_event`
+    before that are not affected.)
+
+    All events of a pool belong to the same context. Use
+    :func:`get_event_pool` to obtain the pool of the current context.
+    """
+
+    def __init__(self, flags=cuda.event_flags.DISABLE_TIMING, max_size=64):
+        _DriverObjectPool.__init__(self, flags, max_size)
+
+    def _create(self):
+        return cuda.Event(self.flags)
+
+
+@context_dependent_memoize
+def get_stream_pool(flags=0):
+    """Return the :class:`StreamPool` of streams created with *flags* in
+    the current context.
+    """
+    return StreamPool(flags)
+
+
+@context_dependent_memoize
+def get_event_pool(flags=cuda.event_flags.DISABLE_TIMING):
+    """Return the :class:`EventPool` of events created with *flags* in the
+    current context. Pass ``flags=0`` for events usable for timing.
+    """
+    return EventPool(flags)
+
+
+class _ThreadStreamKey(object):
+    """Stands for the per-thread default stream of one thread. It lives as
+    long as the thread, so state cached under it in a
+    :class:`weakref.WeakKeyDictionary` is released when the thread exits.
+    """
+
+
+_thread_stream_state = threading.local()
+
+
+def _get_stream_key(stream):
+    """Return the key under which state used by work on *stream* is cached.
+    With a per-thread default stream, *None* stands for a different stream
+    in each thread, which is represented by a weakly referenceable key
+    object owned by that thread. Otherwise, *None* is returned for *None*.
+    """
+    if stream is None and cuda.uses_per_thread_default_stream():
+        key = getattr(_thread_stream_state, "key", None)
+        if key is None:
+            key = _thread_stream_state.key = _ThreadStreamKey()
+        return key
+    return stream
+
+# }}}
+
+# {{{ event completion notifier
+
+class _EventCallback(object):
+    def __init__(self, event, fn):
+        self.event = event
+        self.fn = fn
+
+
+class EventNotifier(object):
+    """Calls functions once CUDA events complete.
+
+    A helper thread polls the events being watched, backing off from
+    *min_poll_interval* to *max_poll_interval* seconds while none of them
+    completes. The thread is started on first use and shared by all
+    watched events, so any number of them may be in flight at once.
+    """
+
+    _thread_name = "pycuda-event-notifier"
+
+    def __init__(self, min_poll_interval=1e-5, max_poll_interval=1e-3):
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+
+        # maps contexts to the list of callbacks on events in them
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def add_callback(self, event, fn, context=None):
+        """Arrange for ``fn(exc)`` to be called in the helper thread once
+        *event* has completed, with the context of *event* current. *exc* is
+        *None*, or the :exc:`pycuda.driver.Error` raised by querying the
+        event.
+
+        *event* must have been recorded in *context*, which defaults to the
+        current context.
+        """
+        ctx = context if context is not None else cuda.Context.get_current()
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("event notifier is closed")
+
+            self._pending.setdefault(ctx, []).append(_EventCallback(event, fn))
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                        target=self._run, name=self._thread_name)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._cond.notify()
+
+    def close(self):
+        """Wait for the events being watched to complete and stop the
+        helper thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+
+        if thread is not None:
+            thread.join()
+
+    def _poll_context(self, ctx):
+        # Runs with *ctx* current, so that the last references to events
+        # may be dropped here. Returns whether any event completed.
+        with self._cond:
+            callbacks = list(self._pending.get(ctx, ()))
+
+        done = []
+        for callback in callbacks:
+            try:
+                if callback.event.query():
+                    done.append((callback, None))
+            except cuda.Error as e:
+                done.append((callback, e))
+
+        if not done:
+            return False
+
+        with self._cond:
+            finished = frozenset(id(callback) for callback, exc in done)
+            remaining = [callback for callback in self._pending[ctx]
+                    if id(callback) not in finished]
+            if remaining:
+                self._pending[ctx] = remaining
+            else:
+                del self._pending[ctx]
+
+        for callback, exc in done:
+            try:
+                callback.fn(exc)
+            except Exception as e:
+                from warnings import warn
+                warn("exception in event completion callback: %r" % e)
+
+        return True
+
+    def _run(self):
+        interval = self.min_poll_interval
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                    interval = self.min_poll_interval
+
+                if not self._pending:
+                    return
+
+                contexts = list(self._pending)
+
+            any_done = False
+            for ctx in contexts:
+                ctx.push()
+                try:
+                    any_done = self._poll_context(ctx) or any_done
+                finally:
+                    cuda.Context.pop()
+
+            if any_done:
+                interval = self.min_poll_interval
+            else:
+                with self._cond:
+                    if self._pending:
+                        self._cond.wait(interval)
+                interval = min(2*interval, self.max_poll_interval)
+
+
+_event_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_event_notifier():
+    """Return the :class:`EventNotifier` shared within the process, starting
+    a new one if the previous one has been closed.
+    """
+    global _event_notifier
+
+    notifier = _event_notifier
+    if notifier is None or notifier.closed:
+        with _notifier_lock:
+            notifier = _event_notifier
+            if notifier is None or notifier.closed:
+                notifier = _event_notifier = EventNotifier()
+
+    return notifier
+
+# }}}
+
+# {{{ pinned staging buffers
+
+def _is_pagelocked(ary):
+    """Return *True* if *ary* lives in memory the driver can DMA directly,
+    i.e. page-locked, registered or managed memory.
+    """
+    # AlignedHostAllocation is a HostPointer too, but pageable
+    pagelocked_types = (cuda.PagelockedHostAllocation,
+            _drv.PooledHostAllocation, cuda.ManagedAllocationOrStub)
+    if hasattr(cuda, "RegisteredHostMemory"):
+        pagelocked_types += (cuda.RegisteredHostMemory,)
+
+    base = ary
+    while base is not None:
+        if isinstance(base, pagelocked_types):
+            return True
+        base = getattr(base, "base", None)
+
+    return False
+
+
+def _byte_view(ary):
+    if not ary.flags.forc:
+        raise ValueError("staged transfers require contiguous host arrays")
+    return ary.reshape(-1, order="A").view(np.uint8)
+
+
+class PinnedStagingPool(object):
+    """A set of reusable page-locked buffers through which transfers
+    between pageable host memory and the device are staged.
+
+    Transfers are split into chunks of *chunk_size* bytes that rotate
+    through *buffer_count* page-locked buffers on a dedicated stream, so
+    that the host-side copy of one chunk overlaps with the DMA of the
+    previous one. Buffers are drawn from :attr:`host_pool`, a
+    :class:`PageLockedMemoryPool`, which is also available for other
+    short-lived page-locked allocations.
+
+    Host arrays of fewer than *min_transfer_size* bytes are not staged.
+    Setting :attr:`min_transfer_size` to *None* disables staging.
+    """
+
+    def __init__(self, chunk_size=4 << 20, buffer_count=2,
+            min_transfer_size=8 << 20):
+        if buffer_count < 1:
+            raise ValueError("buffer_count must be at least 1")
+
+        # fixed, since the buffers are allocated with this size on first use
+        self._chunk_size = chunk_size
+        self._buffer_count = buffer_count
+        self.min_transfer_size = min_transfer_size
+
+        self.host_pool = PageLockedMemoryPool()
+
+        self._buffers = None
+        self._events = None
+        self._stream = None
+
+        from threading import Lock
+        self._lock = Lock()
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @property
+    def buffer_count(self):
+        return self._buffer_count
+
+    def _get_resources(self):
+        if self._buffers is None:
+            self._buffers = [
+                    self.host_pool.allocate((self.chunk_size,), np.uint8)
+                    for i in range(self.buffer_count)]
+            event_pool = get_event_pool()
+            self._events = [
+                    event_pool.get() for i in range(self.buffer_count)]
+            self._stream = get_stream_pool().get()
+
+        return self._buffers, self._events, self._stream
+
+    def should_stage(self, ary):
+        """Return *True* if transfers from or to the host array *ary*
+        would be routed through this pool.
+        """
+        return (self.min_transfer_size is not None
+                and ary.nbytes >= self.min_transfer_size
+                and ary.flags.forc
+                and not _is_pagelocked(ary))
+
+    def _wait_for(self, stream, staging_stream):
+        if stream is None and cuda.uses_per_thread_default_stream():
+            # The staging stream is only ordered with the legacy default
+            # stream, not with the calling thread's default stream.
+            stream = cuda.get_default_stream()
+
+        if stream is not None:
+            event_pool = get_event_pool()
+            evt = event_pool.get()
+            evt.record(stream)
+            staging_stream.wait_for_event(evt)
+            event_pool.put(evt)
+
+    def htod(self, dest, src, stream=None):
+        """Copy the contiguous host array *src* to the device address *dest*.
+
+        If *stream* is *None*, return once the copy is complete. Otherwise,
+        work subsequently enqueued on *stream* is ordered after the copy and
+        this function returns as soon as *src* may be reused.
+        """
+        src = _byte_view(src)
+
+        def readinto(offset, buf):
+            buf[:] = src[offset:offset+buf.size]
+
+        self.htod_from_reader(dest, src.size, readinto, stream=stream)
+
+    def dtoh(self, dest, src, stream=None):
+        """Copy from the device address *src* into the contiguous host array
+        *dest*. Returns once *dest* holds the data. If *stream* is given,
+        the copy is ordered after work previously enqueued on it.
+        """
+        dest = _byte_view(dest)
+
+        def write(offset, buf):
+            dest[offset:offset+buf.size] = buf
+
+        self.dtoh_to_writer(write, src, dest.size, stream=stream)
+
+    def htod_from_reader(self, dest, nbytes, readinto, stream=None):
+        """Copy *nbytes* bytes produced by *readinto* to the device address
+        *dest*. ``readinto(offset, buf)`` is called in order of increasing
+        *offset* and must fill the :class:`numpy.uint8` array *buf* with
+        the bytes starting at *offset*. Producing one chunk overlaps with
+        the DMA of the previous one. *stream* is treated as in :meth:`htod`.
+        """
+        dest = int(dest)
+
+        with self._lock:
+            buffers, events, staging_stream = self._get_resources()
+            self._wait_for(stream, staging_stream)
+
+            last_evt = None
+            for i, offset in enumerate(range(0, nbytes, self.chunk_size)):
+                size = min(self.chunk_size, nbytes - offset)
+                k = i % self.buffer_count
+
+                # wait until the DMA out of this buffer has finished
+                events[k].synchronize()
+                readinto(offset, buffers[k][:size])
+
+                cuda.memcpy_htod_async(dest + offset, buffers[k][:size],
+                        staging_stream)
+                last_evt = events[k].record(staging_stream)
+
+            if stream is None:
+                staging_stream.synchronize()
+            elif last_evt is not None:
+                stream.wait_for_event(last_evt)
+
+    def dtoh_to_writer(self, write, src, nbytes, stream=None):
+        """Copy *nbytes* bytes from the device address *src*, passing them
+        to *write*. ``write(offset, buf)`` is called in order of increasing
+        *offset* with a :class:`numpy.uint8` array *buf* that is only valid
+        for the duration of the call. Consuming one chunk overlaps with the
+        DMA of the next one. *stream* is treated as in :meth:`dtoh`.
+        """
+        src = int(src)
+
+        with self._lock:
+            buffers, events, staging_stream = self._get_resources()
+            self._wait_for(stream, staging_stream)
+
+            pending = [None] * self.buffer_count
+
+            def flush(k):
+                if pending[k] is not None:
+                    offset, size = pending[k]
+                    events[k].synchronize()
+                    write(offset, buffers[k][:size])
+                    pending[k] = None
+
+            i = 0
+            for i, offset in enumerate(range(0, nbytes, self.chunk_size)):
+                size = min(self.chunk_size, nbytes - offset)
+                k = i % self.buffer_count
+
+                flush(k)
+                cuda.memcpy_dtoh_async(buffers[k][:size], src + offset,
+                        staging_stream)
+                events[k].record(staging_stream)
+                pending[k] = offset, size
+
+            for j in range(1, self.buffer_count + 1):
+                flush((i + j) % self.buffer_count)
+
+
+@context_dependent_memoize
+def get_staging_pool():
+    """Return the :class:`PinnedStagingPool` used by
+    :mod:`pycuda.gpuarray` in the current context.
+    """
+    return PinnedStagingPool()
+
+# }}}
+
 # {{{ py.test interaction
 
 def mark_cuda_test(inner_f):
@@ -75,6 +75,17 @@ typedef Py_ssize_t PYCUDA_BUFFER_SIZE_T;
 // }}}
 
 
+namespace pycuda
+{
+  // The stream used for launches and asynchronous copies given no stream:
+  // the legacy default stream (0) or the per-thread default stream.
+  inline CUstream &default_stream_handle()
+  {
+    static CUstream handle = 0;
+    return handle;
+  }
+}
+
 #define PYCUDA_PARSE_STREAM_PY \
     CUstream s_handle; \
     if (stream_py.ptr() != Py_None) \
@@ -83,7 +94,7 @@ typedef Py_ssize_t PYCUDA_BUFFER_SIZE_T;
       s_handle = s.handle(); \
     } \
     else \
-      s_handle = 0;
+      s_handle = pycuda::default_stream_handle();
 
 
 
@@ -956,13 +967,23 @@ namespace pycuda
   {
     private:
       CUstream m_stream;
+      bool m_owned;
 
     public:
       stream(unsigned int flags=0)
+        : m_owned(true)
       { CUDAPP_CALL_GUARDED(cuStreamCreate, (&m_stream, flags)); }
 
+      // wraps an existing stream, such as one of the default streams
+      stream(CUstream handle, bool owned)
+        : m_stream(handle), m_owned(owned)
+      { }
+
       ~stream()
       {
+        if (!m_owned)
+          return;
+
         try
         {
           scoped_context_activation ca(get_context());
@@ -1315,6 +1336,9 @@ namespace pycuda
         : m_function(func), m_symbol(sym)
       { }
 
+      std::string name() const
+      { return m_symbol; }
+
       void set_block_shape(int x, int y, int z)
       {
         CUDAPP_CALL_GUARDED_WITH_TRACE_INFO(
@@ -633,6 +633,32 @@ namespace
 
   // }}}
 
+  // {{{ default stream
+
+  void set_per_thread_default_stream(bool enabled)
+  {
+#if CUDAPP_CUDA_VERSION >= 7000
+    default_stream_handle() = enabled ? CU_STREAM_PER_THREAD : 0;
+#else
+    if (enabled)
+      throw pycuda::error("set_per_thread_default_stream",
+          CUDA_ERROR_INVALID_VALUE,
+          "the per-thread default stream requires CUDA 7.0 or newer");
+#endif
+  }
+
+  bool uses_per_thread_default_stream()
+  {
+    return default_stream_handle() != 0;
+  }
+
+  shared_ptr<stream> get_default_stream()
+  {
+    return shared_ptr<stream>(new stream(default_stream_handle(), false));
+  }
+
+  // }}}
+
 
 
 
@@ -1162,6 +1188,10 @@ BOOST_PYTHON_MODULE(_driver)
       .add_property("handle", &cl::handle_int)
       ;
   }
+
+  DEF_SIMPLE_FUNCTION(set_per_thread_default_stream);
+  DEF_SIMPLE_FUNCTION(uses_per_thread_default_stream);
+  DEF_SIMPLE_FUNCTION(get_default_stream);
   // }}}
 
   // {{{ module
@@ -1224,6 +1254,7 @@ BOOST_PYTHON_MODULE(_driver)
       .def("_param_setf", (void (cl::*)(int, float )) &cl::param_set)
       .def("_param_setv", function_param_setv)
       .DEF_SIMPLE_METHOD(param_set_texref)
+      .add_property("name", &cl::name)
 
 
       .def("_launch", &cl::launch)
@@ -646,6 +646,156 @@ class TestDriver:
         del mem_b
         ctx2.detach()
 
+    @mark_cuda_test
+    def test_device_executor(self):
+        if drv.Context.get_device().compute_mode != drv.compute_mode.DEFAULT:
+            return
+
+        import pycuda.gpuarray as gpuarray
+        from pycuda.executor import DeviceExecutor, get_worker_device_index
+
+        def work(a):
+            a_gpu = gpuarray.to_gpu(a)
+            return get_worker_device_index(), (2*a_gpu).get()
+
+        a = np.random.randn(1000).astype(np.float32)
+        with DeviceExecutor(threads_per_device=2) as executor:
+            for future in executor.submit_to_all(work, a):
+                assert (future.result()[1] == 2*a).all()
+
+            results = list(executor.map(work, [a]*16))
+
+        assert get_worker_device_index() is None
+        for index, result in results:
+            assert 0 <= index < len(executor.devices)
+            assert (result == 2*a).all()
+
+        # a waiting shutdown completes one started without waiting
+        executor = DeviceExecutor(devices=[0])
+        future = executor.submit(work, a)
+        executor.shutdown(wait=False)
+        executor.shutdown(wait=True)
+        assert future.done()
+        assert not any(thread.is_alive()
+                for slot in executor._slots for thread in slot.threads)
+        assert executor._released
+
+    @mark_cuda_test
+    def test_per_thread_default_stream(self):
+        if drv.get_version() < (7,):
+            return
+
+        import pycuda.gpuarray as gpuarray
+
+        was_enabled = drv.uses_per_thread_default_stream()
+        drv.set_per_thread_default_stream(True)
+        try:
+            assert drv.uses_per_thread_default_stream()
+
+            a = np.random.randn(1000).astype(np.float32)
+            a_gpu = gpuarray.to_gpu(a)
+            b_gpu = 2*a_gpu + 1
+            assert b_gpu.__cuda_array_interface__["stream"] == 2
+            assert np.allclose(b_gpu.get(), 2*a + 1)
+
+            # reductions in several threads use separate workspaces
+            import threading
+            from pycuda.tools import _get_stream_key
+
+            ctx = drv.Context.get_current()
+            keys = []
+            sums = []
+
+            def work():
+                ctx.push()
+                try:
+                    keys.append(_get_stream_key(None))
+                    for i in range(20):
+                        sums.append(gpuarray.sum(a_gpu).get())
+                finally:
+                    drv.Context.pop()
+
+            threads = [threading.Thread(target=work) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert len(set(keys)) == 2
+            assert len(sums) == 40
+            assert np.allclose(sums, a.sum(), rtol=1e-4)
+
+            # the keys, and so the workspaces cached under them, do not
+            # outlive the threads
+            import gc
+            import weakref
+            key_refs = [weakref.ref(key) for key in keys]
+            del keys[:]
+            gc.collect()
+            assert all(ref() is None for ref in key_refs)
+
+            # staged transfers without a stream are ordered with the
+            # thread's default stream
+            from pycuda.tools import get_staging_pool
+            c = np.random.randn(3 << 20).astype(np.float32)
+            assert get_staging_pool().should_stage(c)
+            c_gpu = gpuarray.to_gpu(c)
+            for i in range(3):
+                c_gpu *= 2
+                c_gpu.set(c_gpu.get() + 1)
+                c = 2*c + 1
+            assert np.allclose(c_gpu.get(), c)
+
+            stream = drv.get_default_stream()
+            drv.Event().record(stream)
+            stream.synchronize()
+            assert stream.is_done()
+            del stream
+        finally:
+            drv.set_per_thread_default_stream(was_enabled)
+
+        assert drv.uses_per_thread_default_stream() == was_enabled
+
+    @mark_cuda_test
+    def test_stream_event_pools(self):
+        from pycuda.tools import get_stream_pool, get_event_pool
+
+        stream_pool = get_stream_pool()
+        assert get_stream_pool() is stream_pool
+        assert get_stream_pool(0) is stream_pool
+
+        stream = stream_pool.get()
+        stream_pool.put(stream)
+        assert stream_pool.get() is stream
+
+        event_pool = get_event_pool()
+        assert get_event_pool(0) is not event_pool
+
+        events = [event_pool.get() for i in range(event_pool.max_size + 2)]
+        for evt in events:
+            evt.record(stream)
+            evt.synchronize()
+            event_pool.put(evt)
+        assert event_pool.idle_count == event_pool.max_size
+
+        event_pool.clear()
+        assert event_pool.idle_count == 0
+
+        # timed calls return their events to the pool
+        mod = SourceModule("""
+            __global__ void nothing(float *a)
+            { }
+            """)
+        func = mod.get_function("nothing")
+        func.prepare("P")
+        timing_pool = get_event_pool(0)
+        a_gpu = drv.mem_alloc(4)
+        get_time = func.prepared_timed_call((1, 1), (1, 1, 1), a_gpu)
+        idle = timing_pool.idle_count
+        assert get_time() >= 0
+        assert get_time() >= 0
+        assert timing_pool.idle_count == idle + 2
+
     @mark_cuda_test
     def test_3d_texture(self):
         # adapted from code by Nicolas Pinto
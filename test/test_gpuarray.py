@@ -22,6 +22,17 @@ if have_pycuda():
     from pycuda.compiler import SourceModule
 
 
+def _double_ipc_array(handle):
+    # runs in a child process of test_ipc_handle
+    import pycuda.autoinit  # noqa
+
+    a_gpu = handle.open()
+    a_gpu *= 2
+    result = a_gpu.get()
+    del a_gpu
+    return result
+
+
 class TestGPUArray:
     disabled = not have_pycuda()
 
@@ -1096,6 +1107,901 @@ class TestGPUArray:
         assert np.allclose(a_gpu.get(), a)
         assert np.allclose(a_gpu[1:3,1:3,1:3].get(), a[1:3,1:3,1:3])
 
+    @mark_cuda_test
+    def test_staged_transfer(self):
+        from pycuda.tools import PinnedStagingPool
+
+        pool = PinnedStagingPool(chunk_size=1 << 12, buffer_count=3,
+                min_transfer_size=0)
+
+        a = np.random.randn(5*1024 + 17).astype(np.float32)
+        assert pool.should_stage(a)
+        assert not pool.should_stage(drv.pagelocked_empty(a.shape, a.dtype))
+        assert pool.should_stage(drv.aligned_empty(a.shape, a.dtype))
+
+        a_gpu = gpuarray.empty(a.shape, a.dtype)
+        pool.htod(a_gpu.gpudata, a)
+        assert (a_gpu.get() == a).all()
+
+        b = np.empty_like(a)
+        pool.dtoh(b, a_gpu.gpudata)
+        assert (b == a).all()
+
+        stream = drv.Stream()
+        pool.htod(a_gpu.gpudata, 2*a, stream=stream)
+        pool.dtoh(b, a_gpu.gpudata, stream=stream)
+        assert (b == 2*a).all()
+
+        # through the default pool used by GPUArray
+        a = np.random.randn(3*1024*1024 + 5)
+        a_gpu = gpuarray.to_gpu(a)
+        assert (a_gpu.get() == a).all()
+        assert (a_gpu.get(pagelocked=True) == a).all()
+
+        # asynchronous downloads into large pageable arrays bypass staging
+        b = np.empty_like(a)
+        a_gpu.get_async(stream, ary=b)
+        stream.synchronize()
+        assert (b == a).all()
+
+    @mark_cuda_test
+    def test_chunked_pipeline(self):
+        from pycuda.elementwise import ElementwiseKernel
+        from pycuda.pipeline import ChunkedPipeline
+        from pytest import raises
+
+        axpb = ElementwiseKernel("float *x, float *y, float *z",
+                "z[i] = 2*x[i] + y[i]")
+
+        x = np.random.randn(1000, 7).astype(np.float32)
+        y = np.random.randn(1000, 7).astype(np.float32)
+        z = np.empty_like(x)
+
+        chunks = []
+
+        def step(stream, x_chunk, y_chunk, z_chunk):
+            axpb(x_chunk, y_chunk, z_chunk, stream=stream)
+
+        pipeline = ChunkedPipeline(chunk_size=7*4*64, depth=3)
+        assert pipeline.get_chunk_length([x, y, z]) == 64
+        pipeline(step, [x, y[::-1]], [z],
+                chunk_callback=lambda start, stop: chunks.append(start))
+
+        assert np.allclose(z, 2*x + y[::-1])
+        assert chunks == list(range(0, 1000, 64))
+
+        # an exception in the middle leaves the pools usable
+        def failing_step(stream, x_chunk, y_chunk, z_chunk):
+            if len(chunks) > 3:
+                raise RuntimeError("failed")
+            step(stream, x_chunk, y_chunk, z_chunk)
+
+        del chunks[:]
+        with raises(RuntimeError):
+            pipeline(failing_step, [x, y], [z],
+                    chunk_callback=lambda start, stop: chunks.append(start))
+
+        pipeline(step, [y, x], [z])
+        assert np.allclose(z, 2*y + x)
+
+    @mark_cuda_test
+    def test_stream_map_reduce(self):
+        from pycuda.elementwise import ElementwiseKernel
+        from pycuda.reduction import get_sum_kernel, get_dot_kernel
+        from pycuda.pipeline import ChunkedPipeline
+        from tempfile import NamedTemporaryFile
+
+        pipeline = ChunkedPipeline(chunk_size=1 << 12)
+
+        with NamedTemporaryFile() as tmpf:
+            x = np.memmap(tmpf, dtype=np.float32, mode="w+", shape=(10007,))
+            x[:] = np.random.randn(x.size)
+            y = np.random.randn(x.size).astype(np.float32)
+            z = np.empty_like(y)
+
+            axpb = ElementwiseKernel("float a, float *x, float *y, float *z",
+                    "z[i] = a*x[i] + y[i]")
+            gpuarray.stream_map(axpb, 2, x, y, z, out=[z], pipeline=pipeline)
+            assert np.allclose(z, 2*x + y)
+
+            total = gpuarray.stream_reduce(
+                    get_sum_kernel(np.float64, np.float32), x,
+                    pipeline=pipeline)
+            assert total.shape == ()
+            assert np.allclose(total.get(), np.sum(x, dtype=np.float64))
+
+            dot = gpuarray.stream_reduce(
+                    get_dot_kernel(np.float64, np.float32, np.float32), x, y,
+                    pipeline=pipeline)
+            assert np.allclose(dot.get(), np.dot(x.astype(np.float64), y))
+
+    @mark_cuda_test
+    def test_save_load(self):
+        from io import BytesIO
+
+        # spans several chunks of the staging pool
+        a = np.random.randn(1500, 1001).astype(np.float32)
+        for a_gpu in [gpuarray.to_gpu(a), gpuarray.to_gpu(np.asfortranarray(a)),
+                gpuarray.to_gpu(a)[::2, 3:]]:
+            f = BytesIO()
+            gpuarray.save(f, a_gpu)
+
+            f.seek(0)
+            assert (np.load(f) == a_gpu.get()).all()
+
+            f.seek(0)
+            b_gpu = gpuarray.load(f)
+            assert b_gpu.shape == a_gpu.shape
+            assert (b_gpu.get() == a_gpu.get()).all()
+
+        f = BytesIO()
+        np.save(f, a)
+        f.seek(0)
+        assert (gpuarray.load(f).get() == a).all()
+
+        f = BytesIO()
+        a_gpu = gpuarray.to_gpu(a)
+        a_gpu.tofile(f)
+        f.seek(0)
+        assert (gpuarray.fromfile(f, np.float32).get() == a.ravel()).all()
+        f.seek(0)
+        assert (gpuarray.fromfile(f, np.float32, shape=(3, 101),
+            offset=a[0].nbytes).get() == a[1:4]).all()
+
+    @mark_cuda_test
+    def test_ipc_handle(self):
+        from pickle import dumps, loads
+
+        a_gpu = gpuarray.to_gpu(np.random.randn(20, 30).astype(np.float32))
+        view = a_gpu[2:, ::3]
+
+        handle = view.get_ipc_handle()
+        b_gpu = loads(dumps(handle)).open()
+        assert b_gpu.shape == view.shape
+        assert b_gpu.strides == view.strides
+        assert (b_gpu.get() == view.get()).all()
+
+        b_gpu.fill(1)
+        assert (view.get() == 1).all()
+
+        # other views of the same allocation do not replace the export
+        other_handle = a_gpu[:5].get_ipc_handle()
+        other_handle.close()
+        del other_handle
+        assert (loads(dumps(handle)).open().get() == 1).all()
+
+        # open the handle in another process
+        if sys.version_info < (3, 4):
+            return
+
+        import multiprocessing
+        a_gpu.fill(3)
+        handle = view.get_ipc_handle()
+        pool = multiprocessing.get_context("spawn").Pool(1)
+        try:
+            result = pool.apply(_double_ipc_array, (handle,))
+        finally:
+            pool.close()
+            pool.join()
+
+        assert (result == 6).all()
+        assert (view.get() == 6).all()
+
+    @mark_cuda_test
+    def test_array_interchange(self):
+        a = np.random.randn(20, 30).astype(np.float32)
+        a_gpu = gpuarray.to_gpu(a)
+
+        for view, ref in [(a_gpu, a), (a_gpu[3:, ::2], a[3:, ::2])]:
+            iface = view.__cuda_array_interface__
+            assert iface["data"][0] == view.ptr
+            assert tuple(iface["shape"]) == view.shape
+
+            b_gpu = gpuarray.from_cuda_array_interface(view)
+            assert b_gpu.strides == view.strides
+            assert b_gpu.base is view
+            assert (b_gpu.get() == ref).all()
+
+            c_gpu = gpuarray.from_dlpack(view)
+            assert c_gpu.ptr == view.ptr
+            assert c_gpu.strides == view.strides
+            assert (c_gpu.get() == ref).all()
+
+            c_gpu = gpuarray.from_dlpack(view.__dlpack__())
+            assert (c_gpu.get() == ref).all()
+
+        # capsules may only be consumed once
+        from pytest import raises
+        capsule = a_gpu.__dlpack__()
+        gpuarray.from_dlpack(capsule)
+        with raises(ValueError):
+            gpuarray.from_dlpack(capsule)
+
+    @mark_cuda_test
+    def test_sort(self):
+        from pycuda.algorithm import RadixSort
+
+        n = 10007
+        for dtype in [np.int8, np.uint16, np.int32, np.uint32, np.int64,
+                np.float32, np.float64]:
+            if np.dtype(dtype).kind == "f":
+                a = (np.random.randn(n)*100).astype(dtype)
+            else:
+                info = np.iinfo(dtype)
+                a = np.random.randint(info.min, info.max, n).astype(dtype)
+            a[:n//10] = a[n//10:2*(n//10)]  # make sure there are ties
+
+            a_gpu = gpuarray.to_gpu(a)
+            assert (gpuarray.sort(a_gpu).get() == np.sort(a)).all()
+            assert (gpuarray.argsort(a_gpu).get()
+                    == np.argsort(a, kind="mergesort")).all()
+            assert (a_gpu.get() == a).all()
+
+        a = np.random.randint(0, 1000, (30, 40)).astype(np.int32)
+        a_gpu = gpuarray.to_gpu(a)
+        assert (gpuarray.sort(a_gpu, axis=None).get()
+                == np.sort(a, axis=None)).all()
+        assert (gpuarray.sort(a_gpu[::2, 3], axis=None).get()
+                == np.sort(a[::2, 3])).all()
+
+        keys = np.random.randint(0, 1 << 10, n).astype(np.uint32)
+        values = np.random.randn(n).astype(np.float32)
+        sorted_keys, sorted_values = RadixSort(np.uint32, np.float32)(
+                gpuarray.to_gpu(keys), gpuarray.to_gpu(values), end_bit=10)
+        perm = np.argsort(keys, kind="mergesort")
+        assert (sorted_keys.get() == keys[perm]).all()
+        assert (sorted_values.get() == values[perm]).all()
+
+        # sizes around tile boundaries, few distinct digits
+        for n in [1, 2047, 2048, 2049, 3*2048+5]:
+            a = np.random.randint(0, 3, n).astype(np.uint32) << 8
+            assert (gpuarray.sort(gpuarray.to_gpu(a)).get()
+                    == np.sort(a)).all()
+
+    @mark_cuda_test
+    def test_stream_compaction(self):
+        from pycuda.algorithm import copy_if
+
+        a = np.random.randn(300, 70).astype(np.float32)
+        a_gpu = gpuarray.to_gpu(a)
+
+        mask = a > 0.5
+        assert (a_gpu[gpuarray.to_gpu(mask)].get() == a[mask]).all()
+        assert (a_gpu[mask].get() == a[mask]).all()
+        assert (a_gpu[:, ::3][mask[:, ::3]].get() == a[:, ::3][mask[:, ::3]]).all()
+        assert (a_gpu[a_gpu > 0.5].get() == a[mask]).all()
+        assert (a_gpu[gpuarray.to_gpu(mask.astype(np.uint8))].get()
+                == a[mask]).all()
+
+        # integer arrays are indices, not masks
+        from pytest import raises
+        idx_gpu = gpuarray.to_gpu(
+                np.random.randint(0, 2, a.shape).astype(np.int32))
+        with raises(IndexError):
+            a_gpu[idx_gpu]
+
+        for nz_gpu, nz in zip(gpuarray.nonzero(a_gpu > 0), np.nonzero(a > 0)):
+            assert (nz_gpu.get() == nz).all()
+
+        flat_gpu = a_gpu.reshape(a.size)
+        result = copy_if(flat_gpu, "ary[i] > threshold",
+                extra_args=[("threshold", np.float32(1))])
+        assert (result.get() == a.ravel()[a.ravel() > 1]).all()
+
+        result = copy_if(flat_gpu, "ary[i] > 100")
+        assert result.shape == (0,)
+
+    @mark_cuda_test
+    def test_segmented_scan(self):
+        from pycuda.scan import SegmentedScanKernel
+        from pycuda.algorithm import reduce_by_key
+
+        a = np.random.randint(0, 10, (37, 1001)).astype(np.int32)
+        a_gpu = gpuarray.to_gpu(a)
+
+        assert (gpuarray.cumsum(a_gpu).get() == np.cumsum(a)).all()
+        for axis in [0, 1, -1]:
+            assert (gpuarray.cumsum(a_gpu, axis=axis).get()
+                    == np.cumsum(a, axis=axis)).all()
+        assert (gpuarray.cumsum(a_gpu[:, ::2], axis=1).get()
+                == np.cumsum(a[:, ::2], axis=1)).all()
+
+        b = np.random.randint(0, 10, (5, 17, 33)).astype(np.int32)
+        b_gpu = gpuarray.to_gpu(b)
+        for axis in range(3):
+            assert (gpuarray.cumsum(b_gpu, axis=axis).get()
+                    == np.cumsum(b, axis=axis)).all()
+
+        # scan into a non-contiguous output
+        out_gpu = gpuarray.zeros((37, 2002), np.int32)
+        gpuarray._get_segmented_cumsum_kernel(np.int32)(
+                a_gpu, out_gpu[:, ::2], axis=0)
+        assert (out_gpu.get()[:, ::2] == np.cumsum(a, axis=0)).all()
+        assert (out_gpu.get()[:, 1::2] == 0).all()
+
+        x = a.ravel()
+        offsets = np.array([0, 5, 17, 2000, 2001, 30000], dtype=np.int32)
+        flags = np.zeros(x.size, np.uint8)
+        flags[offsets] = 1
+
+        expected = np.empty_like(x)
+        expected_excl = np.empty_like(x)
+        for start, stop in zip(offsets, list(offsets[1:]) + [x.size]):
+            expected[start:stop] = np.cumsum(x[start:stop])
+            expected_excl[start:stop] = expected[start:stop] - x[start:stop]
+
+        incl = SegmentedScanKernel(np.int32, "a+b", "0")
+        excl = SegmentedScanKernel(np.int32, "a+b", "0", exclusive=True)
+        x_gpu = gpuarray.to_gpu(x)
+        assert (incl(x_gpu, "new", segment_flags=gpuarray.to_gpu(flags))
+                .get() == expected).all()
+        assert (incl(x_gpu, "new", segment_offsets=gpuarray.to_gpu(offsets))
+                .get() == expected).all()
+        assert (excl(x_gpu, "new", segment_offsets=gpuarray.to_gpu(offsets))
+                .get() == expected_excl).all()
+
+        keys = np.sort(np.random.randint(0, 100, 5000)).astype(np.int32)
+        values = np.random.randn(5000).astype(np.float32)
+        unique_keys, sums = reduce_by_key(
+                gpuarray.to_gpu(keys), gpuarray.to_gpu(values))
+        assert (unique_keys.get() == np.unique(keys)).all()
+        assert np.allclose(sums.get(),
+                [values[keys == k].sum() for k in np.unique(keys)],
+                rtol=1e-4, atol=1e-4)
+
+    @mark_cuda_test
+    def test_single_pass_scan(self):
+        from pycuda.scan import InclusiveScanKernel, ExclusiveScanKernel
+
+        incl = InclusiveScanKernel(np.int32, "a+b", single_pass=True)
+        excl = ExclusiveScanKernel(np.int32, "a+b", "0", single_pass=True)
+        stream = drv.Stream()
+
+        for n in [1, 10, 2047, 2048, 2049, 2**20-2**18+5, 10**7]:
+            host_data = np.random.randint(0, 10, n).astype(np.int32)
+            expected = np.cumsum(host_data, axis=0)
+
+            dev_data = gpuarray.to_gpu(host_data)
+            assert (excl(dev_data, "new").get()
+                    == expected - host_data).all()
+            incl(dev_data, stream=stream)
+            stream.synchronize()
+            assert (dev_data.get() == expected).all()
+
+        max_scan = InclusiveScanKernel(np.float64, "fmax(a, b)",
+                single_pass=True)
+        host_data = np.random.randn(100001)
+        assert (max_scan(gpuarray.to_gpu(host_data)).get()
+                == np.maximum.accumulate(host_data)).all()
+
+    @mark_cuda_test
+    def test_autotune(self):
+        import os
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from pycuda import autotune
+        from pycuda.reduction import ReductionKernel
+        from pycuda.scan import InclusiveScanKernel
+
+        tmpdir = mkdtemp()
+        old_db = autotune.get_tuning_db()
+        try:
+            db = autotune.TuningDatabase(os.path.join(tmpdir, "tuning.json"))
+            autotune.set_tuning_db(db)
+
+            n = 300000
+            a = np.random.randint(0, 10, n).astype(np.int32)
+            a_gpu = gpuarray.to_gpu(a)
+
+            from pycuda.gpuarray import _tuned_splay
+            func = gpuarray.elementwise.get_axpbyz_kernel(
+                    np.int32, np.int32, np.int32)
+            generation = db.generation
+            assert _tuned_splay(n, np.int32, func) == gpuarray.splay(n)
+
+            params = autotune.tune_elementwise(n, np.int32)
+            assert db.lookup("elementwise", np.int32, n) == params
+
+            # the cached thread cap is updated
+            assert db.generation > generation
+            db.store("elementwise", np.int32, n, {"max_threads": 64})
+            assert _tuned_splay(n, np.int32, func)[1][0] <= 64
+            assert db.lookup("elementwise", np.float64, n) is None
+            assert ((gpuarray.to_gpu(a) + a_gpu).get() == 2*a).all()
+            assert ((a_gpu + a_gpu.astype(np.complex128)).get() == 2*a).all()
+
+            red = ReductionKernel(np.int32, "0", "a+b",
+                    arguments="const int *in", name="tuned_sum")
+            config = red.autotune(a_gpu)
+            assert db.lookup("reduction:tuned_sum", np.int32, n) == config
+            assert red(a_gpu).get() == a.sum()
+
+            scan = InclusiveScanKernel(np.int32, "a+b", name_prefix="tuned")
+            scan.autotune(a_gpu)
+            assert (a_gpu.get() == a).all()
+            assert (scan(a_gpu, "new").get() == np.cumsum(a)).all()
+
+            # the database is persistent
+            db2 = autotune.TuningDatabase(db.path)
+            assert db2.lookup("reduction:tuned_sum", np.int32, n) == config
+        finally:
+            autotune.set_tuning_db(old_db)
+            rmtree(tmpdir)
+
+    @mark_cuda_test
+    def test_single_launch_reduction(self):
+        from pycuda.reduction import ReductionKernel
+
+        red = ReductionKernel(np.int32, "0", "a+b",
+                arguments="const int *in", single_launch=True)
+        out = gpuarray.empty((), np.int32)
+        stream = drv.Stream()
+
+        # repeated calls check that the completion counter is reset
+        for n in [0, 1, 511, 512, 513, 2048*1024, 2048*1024+1, 10**7]:
+            a = np.random.randint(0, 10, n).astype(np.int32)
+            a_gpu = gpuarray.to_gpu(a)
+            for i in range(2):
+                assert red(a_gpu).get() == a.sum()
+                assert red(a_gpu, stream=stream, out=out) is out
+                assert out.get(stream=stream) == a.sum()
+
+        a_gpu = gpuarray.arange(1000, dtype=np.float32)
+        b_gpu = gpuarray.arange(1000, dtype=np.float32)
+        out = gpuarray.empty((1,), np.float32)
+        gpuarray.dot(a_gpu, b_gpu, out=out)
+        assert np.allclose(out.get()[0], np.dot(a_gpu.get(), b_gpu.get()))
+        gpuarray.sum(a_gpu, out=out)
+        assert out.get()[0] == 999*1000/2
+
+    @mark_cuda_test
+    def test_reduction_codegen(self):
+        from pycuda.reduction import ReductionKernel, use_warp_shuffle
+        from pycuda.tools import dtype_to_ctype
+
+        assert not use_warp_shuffle(np.int16, 512)
+        assert not use_warp_shuffle(np.float32, 48)
+
+        dtypes = [np.int16, np.int32, np.float32, np.complex64]
+        if has_double_support():
+            dtypes.extend([np.float64, np.complex128])
+
+        for dtype in dtypes:
+            dtype = np.dtype(dtype)
+            ctype = dtype_to_ctype(dtype)
+            for single_launch in [False, True]:
+                red = ReductionKernel(dtype, "0", "a+b",
+                        arguments="const %s *in" % ctype,
+                        single_launch=single_launch)
+
+                for n in [1, 31, 33, 1000, 100000]:
+                    a = (np.arange(n) % 7).astype(dtype)
+                    result = red(gpuarray.to_gpu(a)).get()
+                    assert result == a.sum(dtype=dtype), (dtype, n)
+
+    @mark_cuda_test
+    def test_batched_reduction(self):
+        from pycuda.reduction import BatchedReductionKernel
+
+        sizes = [0, 1, 100, 1023, 1024, 1025, 5000, 3*10**6]
+        arrays = [np.random.randint(0, 10, n).astype(np.int32)
+                for n in sizes]
+        arrays_gpu = [gpuarray.to_gpu(a) for a in arrays]
+
+        sums = gpuarray.multi_sum(arrays_gpu)
+        assert (sums.get() == [a.sum() for a in arrays]).all()
+
+        # repeated call, reusing the pointer table and block counters
+        out = gpuarray.empty(len(arrays), np.int32)
+        assert gpuarray.multi_sum(arrays_gpu, out=out) is out
+        assert (out.get() == [a.sum() for a in arrays]).all()
+
+        knl = BatchedReductionKernel(np.float32, np.int32, "0", "a+b",
+                map_expr="(float) in[i]*in[i]")
+        expected = [np.sum(a.astype(np.float32)**2) for a in arrays]
+        assert np.allclose(knl(arrays_gpu).get(), expected, rtol=1e-4)
+
+        pointers = gpuarray.to_gpu(np.array(
+            [a.ptr if a.size else 0 for a in arrays_gpu], dtype=np.uintp))
+        lengths = gpuarray.to_gpu(np.array(sizes, dtype=np.uint32))
+        assert np.allclose(knl.reduce_pointers(pointers, lengths).get(),
+                expected, rtol=1e-4)
+
+        many = [gpuarray.to_gpu(np.arange(k, dtype=np.int32))
+                for k in range(500)]
+        assert (gpuarray.multi_sum(many).get()
+                == [k*(k-1)//2 for k in range(500)]).all()
+
+    @mark_cuda_test
+    def test_struct_reductions(self):
+        dtypes = [np.float32, np.int32, np.uint8]
+        if has_double_support():
+            dtypes.append(np.float64)
+
+        for dtype in dtypes:
+            for n in [1, 100, 100000]:
+                a = np.random.randint(0, 50, n).astype(dtype)
+                a_gpu = gpuarray.to_gpu(a)
+                assert gpuarray.argmax(a_gpu).get() == np.argmax(a)
+                assert gpuarray.argmin(a_gpu).get() == np.argmin(a)
+
+        a = np.random.randn(12, 345).astype(np.float32)
+        a[3, 7] = np.nan
+        a[5, 6] = np.nan
+        a_gpu = gpuarray.to_gpu(a)
+        assert gpuarray.argmax(a_gpu).get() == np.argmax(a)
+        assert gpuarray.argmin(a_gpu).get() == np.argmin(a)
+        assert gpuarray.argmax(a_gpu[:, ::3]).get() == np.argmax(a[:, ::3])
+
+        a = (np.random.randn(300001) * 3 + 5).astype(np.float32)
+        mean, var = gpuarray.moments(gpuarray.to_gpu(a))
+        assert np.allclose(mean.get(), a.astype(np.float64).mean(),
+                rtol=1e-4)
+        assert np.allclose(var.get(), a.astype(np.float64).var(),
+                rtol=1e-3)
+
+        if has_double_support():
+            b = np.random.randint(0, 100, 1000).astype(np.int32)
+            mean, var = gpuarray.moments(gpuarray.to_gpu(b), ddof=1)
+            assert mean.dtype == np.float64
+            assert np.allclose(mean.get(), b.mean())
+            assert np.allclose(var.get(), b.var(ddof=1))
+
+    @mark_cuda_test
+    def test_futures(self):
+        from pytest import raises
+
+        a = np.random.randn(1000, 100).astype(np.float32)
+        a_gpu = gpuarray.to_gpu(a)
+        stream = drv.Stream()
+
+        s_future = gpuarray.sum(a_gpu, stream=stream).get_future(stream)
+        a_future = a_gpu[:, ::2].get_future(stream)
+
+        import threading
+        called = []
+        fired = threading.Event()
+
+        def callback(future):
+            called.append(future)
+            fired.set()
+
+        s_future.add_done_callback(callback)
+
+        # callbacks fire without anybody polling the future
+        assert fired.wait(10)
+        assert called == [s_future]
+
+        assert gpuarray.wait_futures([s_future, a_future]) == []
+        assert s_future.done()
+        assert np.allclose(s_future.result(), a.sum(), rtol=1e-4)
+        assert s_future.result().shape == ()
+        assert (a_future.result() == a[:, ::2]).all()
+
+        s_future.add_done_callback(called.append)
+        assert called == [s_future, s_future]
+
+        # results are only reported once the stream gets there
+        b_gpu = gpuarray.zeros(10**7, np.float32)
+        for i in range(20):
+            b_gpu._axpbz(1, 1, b_gpu, stream=stream)
+        future = gpuarray.sum(b_gpu, stream=stream).get_future(stream)
+        if not future.wait(timeout=0):
+            assert not future.done()
+            raises(gpuarray.FutureTimeoutError, future.result, timeout=0)
+        assert np.allclose(future.result(), 20 * 10**7, rtol=1e-5)
+
+    @mark_cuda_test
+    def test_device_scalars(self):
+        a = np.random.randn(1000).astype(np.float32)
+        b = np.random.randn(1000).astype(np.float32)
+        a_gpu = gpuarray.to_gpu(a)
+        b_gpu = gpuarray.to_gpu(b)
+
+        s = np.float32(2.5)
+        s_gpu = gpuarray.to_gpu(np.array(s))
+        assert s_gpu.shape == ()
+
+        for result, expected in [
+                (a_gpu + s_gpu, a + s),
+                (s_gpu + a_gpu, s + a),
+                (a_gpu - s_gpu, a - s),
+                (s_gpu - a_gpu, s - a),
+                (a_gpu * s_gpu, a * s),
+                (s_gpu * a_gpu, s * a),
+                (a_gpu / s_gpu, a / s),
+                (s_gpu / a_gpu, s / a),
+                (a_gpu.mul_add(s_gpu, b_gpu, s_gpu), s*a + s*b),
+                (a_gpu.mul_add(2, b_gpu, s_gpu), 2*a + s*b),
+                (abs(a_gpu) ** s_gpu, abs(a) ** s),
+                ]:
+            assert result.shape == a.shape
+            assert np.allclose(result.get(), expected, rtol=1e-5)
+
+        assert ((a_gpu < s_gpu).get() == (a < s)).all()
+        assert ((s_gpu < a_gpu).get() == (s < a)).all()
+        assert ((s_gpu >= a_gpu).get() == (s >= a)).all()
+        assert ((s_gpu == a_gpu).get() == (s == a)).all()
+
+        # scalars computed on the device
+        norm_gpu = gpuarray.dot(a_gpu, a_gpu)
+        assert np.allclose((a_gpu / norm_gpu).get(), a / np.dot(a, a),
+                rtol=1e-4)
+
+        c_gpu = a_gpu.copy()
+        c_gpu += s_gpu
+        c_gpu *= s_gpu
+        c_gpu -= s_gpu
+        c_gpu /= s_gpu
+        assert np.allclose(c_gpu.get(), ((a + s) * s - s) / s, rtol=1e-5)
+
+        c_gpu.fill(s_gpu)
+        assert (c_gpu.get() == s).all()
+
+        if has_double_support():
+            d_gpu = gpuarray.to_gpu(np.array(0.5))
+            result = a_gpu * d_gpu
+            assert result.dtype == np.float64
+            assert np.allclose(result.get(), a * 0.5)
+
+    @mark_cuda_test
+    def test_aio(self):
+        import sys
+        if sys.version_info < (3, 4):
+            from pytest import skip
+            skip("pycuda.aio requires Python 3.4")
+
+        import asyncio
+        from pycuda import aio
+
+        a = np.random.randn(10**6).astype(np.float32)
+        streams = [drv.Stream() for i in range(4)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            futures = []
+            for i, stream in enumerate(streams):
+                a_gpu = gpuarray.to_gpu_async(a, stream=stream)
+                a_gpu._axpbz(i, 1, a_gpu, stream=stream)
+                futures.append(aio.get(a_gpu, stream=stream, loop=loop))
+            futures.append(aio.wait_stream(streams[0], loop=loop))
+
+            b = drv.pagelocked_empty_like(a)
+            b[:] = 2*a
+            b_gpu = gpuarray.empty_like(a_gpu)
+            futures.append(aio.set_array(
+                b_gpu, b, stream=streams[1], loop=loop))
+
+            results = loop.run_until_complete(asyncio.gather(*futures))
+
+            # closing the notifier does not break later awaitables
+            notifier = aio.get_notifier()
+            notifier.close()
+            assert aio.get_notifier() is not notifier
+            loop.run_until_complete(aio.wait_stream(streams[2], loop=loop))
+        finally:
+            loop.close()
+
+        for i in range(len(streams)):
+            assert np.allclose(results[i], i*a + 1)
+        assert results[len(streams)] is None
+        assert (b_gpu.get() == 2*a).all()
+
+    @mark_cuda_test
+    def test_dependency_tracking(self):
+        gpuarray.set_dependency_tracking()
+        try:
+            s1 = drv.Stream()
+            s2 = drv.Stream()
+
+            a_gpu = gpuarray.zeros(10**7, np.float32)
+            for i in range(10):
+                a_gpu._axpbz(1, 1, a_gpu, stream=s1)
+
+            # must wait for the work on s1
+            b_gpu = gpuarray.empty_like(a_gpu)
+            a_gpu._axpbz(2, 0, b_gpu, stream=s2)
+            assert (b_gpu.get_future(s2).result() == 20).all()
+
+            # views share the state of the array owning their memory
+            a_gpu[:1000]._axpbz(1, 1, a_gpu[:1000], stream=s1)
+            s = gpuarray.sum(a_gpu, stream=s2)
+            assert np.allclose(s.get_future(s2).result(), 10 * 10**7 + 1000,
+                    rtol=1e-5)
+
+            # device scalars are tracked like other arrays
+            alpha_gpu = gpuarray.sum(a_gpu, stream=s1)
+            c_gpu = gpuarray.zeros(10, np.float32)
+            gpuarray.ones_like(c_gpu)._axpbz(alpha_gpu, 0, c_gpu, stream=s2)
+            assert np.allclose(c_gpu.get_future(s2).result(),
+                    10 * 10**7 + 1000, rtol=1e-5)
+        finally:
+            gpuarray.set_dependency_tracking(False)
+
+        assert not gpuarray.is_dependency_tracking()
+
+    @mark_cuda_test
+    def test_launch_recording(self):
+        from pycuda.recording import record
+
+        a = np.random.randn(1000).astype(np.float32)
+        x_gpu = gpuarray.to_gpu(a)
+        y_gpu = gpuarray.zeros_like(x_gpu)
+        host = np.empty_like(a)
+
+        with record() as rec:
+            y_gpu += 2*x_gpu
+            total = gpuarray.sum(y_gpu)
+            y_gpu.get(ary=host)
+
+        assert len(rec) >= 4
+        assert np.allclose(total.get(), np.sum(2*a), rtol=1e-4)
+
+        for i in range(4):
+            rec.replay()
+        drv.Context.synchronize()
+        assert np.allclose(y_gpu.get(), 10*a)
+        assert np.allclose(host, 10*a)
+        assert np.allclose(total.get(), np.sum(10*a), rtol=1e-4)
+
+        # redirect the recording to other memory
+        y2_gpu = gpuarray.zeros_like(y_gpu)
+        assert rec.update(y_gpu, y2_gpu) >= 3
+        stream = drv.Stream()
+        rec.replay(stream)
+        stream.synchronize()
+        assert np.allclose(y2_gpu.get(), 2*a)
+        assert np.allclose(y_gpu.get(), 10*a)
+        assert np.allclose(total.get(), np.sum(2*a), rtol=1e-4)
+
+        # scalars that happen to equal an address are left alone
+        mod = SourceModule("""
+            __global__ void store(unsigned long long *out,
+                unsigned long long value)
+            { *out = value; }
+            """)
+        store = mod.get_function("store")
+        store_prepared = mod.get_function("store").prepare("PQ")
+        out_gpu = gpuarray.zeros(2, np.uint64)
+        address = np.uint64(int(y_gpu.gpudata))
+
+        with record() as rec:
+            store(out_gpu, address, block=(1, 1, 1))
+            store_prepared.prepared_call((1, 1), (1, 1, 1),
+                    out_gpu[1:], address)
+
+        assert rec.update(y_gpu, y2_gpu) == 0
+        out_gpu.fill(0)
+        rec.replay()
+        assert (out_gpu.get() == address).all()
+
+        # single-pass scans reset their tile state as part of the recording
+        from pycuda.scan import InclusiveScanKernel
+        scan = InclusiveScanKernel(np.int32, "a+b", single_pass=True)
+        b = np.random.randint(0, 10, 100000).astype(np.int32)
+        b_gpu = gpuarray.to_gpu(b)
+        c_gpu = gpuarray.empty_like(b_gpu)
+        scan(b_gpu, c_gpu)
+
+        with record() as rec:
+            scan(b_gpu, c_gpu)
+
+        for i in range(3):
+            c_gpu.fill(0)
+            rec.replay()
+            assert (c_gpu.get() == np.cumsum(b)).all()
+
+    @mark_cuda_test
+    def test_multi_elementwise(self):
+        sizes = [1, 17, 0, 1000, 5000, 3]
+        xs = [np.random.randn(n).astype(np.float32) for n in sizes]
+        ys = [np.random.randn(n).astype(np.float32) for n in sizes]
+        xs_gpu = [gpuarray.to_gpu(x) for x in xs]
+        ys_gpu = [gpuarray.to_gpu(y) for y in ys]
+
+        results = gpuarray.multi_mul_add(2, xs_gpu, 3, ys_gpu)
+        for x, y, z_gpu in zip(xs, ys, results):
+            assert np.allclose(z_gpu.get(), 2*x + 3*y)
+
+        # device scalar factor, mixed dtypes
+        ys_gpu[1] = ys_gpu[1].astype(np.float64)
+        factor = gpuarray.to_gpu(np.array(-1, np.float32))
+        results = gpuarray.multi_mul_add(factor, xs_gpu, 1, ys_gpu)
+        for x, y, z_gpu in zip(xs, ys, results):
+            assert np.allclose(z_gpu.get(), y - x)
+        assert results[1].dtype == np.float64
+
+        gpuarray.multi_fill(xs_gpu, 7)
+        for x_gpu in xs_gpu:
+            assert (x_gpu.get() == 7).all()
+
+        from pycuda.elementwise import MultiElementwiseKernel
+        reverse = MultiElementwiseKernel(
+                "float *x, float *z", "z[i] = x[n-1-i]")
+        zs_gpu = [gpuarray.empty_like(y_gpu) for y_gpu in ys_gpu[2:]]
+        reverse(ys_gpu[2:], zs_gpu)
+        for y, z_gpu in zip(ys[2:], zs_gpu):
+            assert (z_gpu.get() == y[::-1]).all()
+
+    @mark_cuda_test
+    def test_instrumentation(self):
+        import pycuda.instrumentation as instr
+
+        a = np.random.randn(1000).astype(np.float32)
+
+        instr.enable(capacity=100)
+        try:
+            x_gpu = gpuarray.to_gpu(a)
+            y_gpu = 2*x_gpu
+            y_gpu.get()
+            for i in range(200):
+                y_gpu += x_gpu
+        finally:
+            instr.disable()
+
+        records = instr.get_records()
+        assert len(records) == 100
+        assert all(record.kind == "kernel" for record in records)
+        assert all(record.device_time is not None for record in records)
+        # y_gpu is passed both as input and output
+        assert records[-1].nbytes == 3*x_gpu.nbytes
+
+        summary = instr.summarize(records)
+        assert len(summary) == 1
+        assert summary[0]["count"] == 100
+        assert summary[0]["name"] == records[-1].name
+        assert summary[0]["name"] in instr.format_summary(records)
+
+        trace = instr.get_chrome_trace(records)
+        assert len(trace["traceEvents"]) == 100
+        assert all(event["ph"] == "X" for event in trace["traceEvents"])
+
+        instr.clear()
+        instr.enable()
+        try:
+            x_gpu.get()
+        finally:
+            instr.disable()
+        records = instr.get_records()
+        assert [record.name for record in records] == ["memcpy_dtoh"]
+        assert records[0].nbytes == x_gpu.nbytes
+        instr.clear()
+
+        # direct driver copies
+        memcpy_dtoh = drv.memcpy_dtoh
+        stream = drv.Stream()
+        host = np.empty_like(a)
+        instr.enable()
+        try:
+            drv.memcpy_dtoh(host, x_gpu.gpudata)
+            drv.memcpy_htod_async(y_gpu.gpudata, host, stream)
+            drv.memcpy_dtod(y_gpu.gpudata, x_gpu.gpudata, x_gpu.nbytes)
+            stream.synchronize()
+        finally:
+            instr.disable()
+        assert drv.memcpy_dtoh is memcpy_dtoh
+
+        records = instr.get_records()
+        assert [record.name for record in records] == [
+                "memcpy_dtoh", "memcpy_htod", "memcpy_dtod"]
+        assert all(record.nbytes == x_gpu.nbytes for record in records)
+        assert records[1].stream == stream.handle
+        instr.clear()
+
+        # completed records dropped from the buffer return their events
+        from pycuda.tools import get_event_pool
+        event_pool = get_event_pool(0)
+        event_pool.clear()
+        instr.enable(capacity=4)
+        try:
+            for i in range(10):
+                y_gpu += x_gpu
+                drv.Context.synchronize()
+        finally:
+            instr.disable()
+        assert event_pool.idle_count > 0
+        instr.clear()
+
     @mark_cuda_test
     def test_zeros_like_etc(self):
         shape = (16, 16)